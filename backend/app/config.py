@@ -21,6 +21,28 @@ class Settings(BaseSettings):
     app_name: str = "NotebookLM Reimagined"
     debug: bool = False
 
+    # Uploads (matches the 50MB limit on the "sources" storage bucket)
+    max_upload_bytes: int = 50 * 1024 * 1024
+
+    # Worker processes for PDF/DOCX parsing (0 = run in a thread instead)
+    extraction_workers: int = 2
+
+    # Threads for blocking supabase-py calls offloaded via asyncio.to_thread
+    db_threads: int = 32
+
+    # Keep-alive pool for the shared Supabase client (per worker process)
+    supabase_max_connections: int = 50
+    supabase_max_keepalive_connections: int = 20
+
+    # Concurrent Gemini calls per worker when fanning out generations
+    gemini_max_concurrency: int = 8
+
+    # Redis for rate limits shared across workers (empty = per-process limits)
+    redis_url: str = ""
+
+    # Seconds between batched writes of API key last_used_at/total_requests
+    api_key_usage_flush_seconds: float = 10.0
+
     class Config:
         env_file = ".env"
 
@@ -1,24 +1,50 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import uuid
 import hashlib
 from datetime import datetime
 
 from app.config import get_settings
+from app.services.cpu_pool import start_cpu_pool, shutdown_cpu_pool
+from app.services.auth import run_api_key_usage_flusher
+from app.services.upload_limit import UploadSizeLimitMiddleware
 from app.routers import notebooks, sources, chat, audio, video, research, study, notes, api_keys, global_chat, studio, export, profile
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sized for concurrent supabase-py round trips rather than CPU count
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=settings.db_threads))
+    start_cpu_pool(settings.extraction_workers)
+    usage_flusher = asyncio.create_task(run_api_key_usage_flusher(settings.api_key_usage_flush_seconds))
+    yield
+    usage_flusher.cancel()
+    await asyncio.gather(usage_flusher, return_exceptions=True)
+    shutdown_cpu_pool()
+
+
 app = FastAPI(
     title=settings.app_name,
     description="NotebookLM Reimagined - An API-first research intelligence platform",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    # Route results are encoded with orjson instead of the stdlib json module
+    default_response_class=ORJSONResponse,
 )
 
+# Reject oversized uploads before FastAPI parses and spools the body.
+# Registered before CORS so its 413s still carry CORS headers.
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=settings.max_upload_bytes)
+
 # GZip compression for responses > 1KB
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
@@ -114,7 +140,7 @@ async def add_request_id_and_cache(request: Request, call_next):
 # Exception handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": {
@@ -127,7 +153,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": {
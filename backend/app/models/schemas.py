@@ -48,6 +48,7 @@ class UsageInfo(BaseModel):
     output_tokens: int = 0
     cost_usd: float = 0.0
     model_used: str = ""
+    cache_hit: bool = False
 
 
 class ApiResponse(BaseModel):
@@ -127,6 +128,17 @@ class TextSourceCreate(BaseModel):
     name: str
 
 
+class BatchSourceItem(BaseModel):
+    type: SourceType  # text, url or youtube
+    name: Optional[str] = None
+    content: Optional[str] = None  # For text sources
+    url: Optional[str] = None  # For URL/YouTube sources
+
+
+class BatchSourceCreate(BaseModel):
+    sources: List[BatchSourceItem] = Field(..., min_length=1, max_length=50)
+
+
 # Chat schemas
 class ChatMessage(BaseModel):
     message: str
@@ -247,6 +259,7 @@ class FlashcardCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     count: int = 10
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class Flashcard(BaseModel):
@@ -263,6 +276,7 @@ class QuizCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     question_count: int = 10
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class QuizQuestion(BaseModel):
@@ -280,6 +294,7 @@ class QuizResponse(BaseModel):
 class StudyGuideCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class StudyGuideResponse(BaseModel):
@@ -294,6 +309,7 @@ class FAQCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     count: int = 10
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class FAQItem(BaseModel):
@@ -305,6 +321,25 @@ class FAQResponse(BaseModel):
     faqs: List[FAQItem]
 
 
+class StudyMaterialKind(str, Enum):
+    SUMMARY = "summary"
+    FLASHCARDS = "flashcards"
+    QUIZ = "quiz"
+    STUDY_GUIDE = "study_guide"
+    FAQ = "faq"
+
+
+class StudyBundleCreate(BaseModel):
+    source_ids: Optional[List[UUID]] = None
+    kinds: List[StudyMaterialKind] = [
+        StudyMaterialKind.FLASHCARDS,
+        StudyMaterialKind.QUIZ,
+        StudyMaterialKind.STUDY_GUIDE,
+        StudyMaterialKind.FAQ,
+    ]
+    model: str = "gemini-2.5-flash"
+
+
 # Notes schemas
 class NoteCreate(BaseModel):
     title: Optional[str] = None
@@ -373,12 +408,14 @@ class DataTableCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     custom_instructions: Optional[str] = None
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class ReportCreate(BaseModel):
     source_ids: Optional[List[UUID]] = None
     custom_instructions: Optional[str] = None
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class SlideDeckCreate(BaseModel):
@@ -386,6 +423,7 @@ class SlideDeckCreate(BaseModel):
     slide_count: int = 10
     custom_instructions: Optional[str] = None
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class InfographicCreate(BaseModel):
@@ -393,6 +431,7 @@ class InfographicCreate(BaseModel):
     style: str = "modern"  # modern, minimal, bold, infographic
     custom_instructions: Optional[str] = None
     model: str = "gemini-2.5-flash"
+    regenerate: bool = False  # Skip cached results
 
 
 class StudioOutputResponse(BaseModel):
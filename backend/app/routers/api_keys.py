@@ -10,8 +10,8 @@ from app.models.schemas import (
     ApiKeyUsageStats,
     ApiResponse,
 )
-from app.services.auth import get_current_user, generate_api_key, require_jwt_auth
-from app.services.supabase_client import get_supabase_client
+from app.services.auth import get_current_user, generate_api_key, require_jwt_auth, invalidate_api_key
+from app.services.supabase_client import get_supabase_client, execute_query
 
 router = APIRouter(prefix="/api-keys", tags=["api-keys"])
 
@@ -48,7 +48,7 @@ async def create_api_key(
         "allowed_ips": key_data.allowed_ips,
     }
 
-    result = supabase.table("api_keys").insert(data).execute()
+    result = await execute_query(supabase.table("api_keys").insert(data))
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create API key")
@@ -70,12 +70,11 @@ async def list_api_keys(
     """
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("api_keys")
         .select("*")
         .eq("user_id", user["id"])
         .order("created_at", desc=True)
-        .execute()
     )
 
     return ApiResponse(data=result.data)
@@ -92,12 +91,11 @@ async def get_api_key(
     """
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("api_keys")
         .select("*")
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
     if not result.data or len(result.data) == 0:
@@ -142,17 +140,18 @@ async def update_api_key(
 
     update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
 
-    result = (
+    result = await execute_query(
         supabase.table("api_keys")
         .update(update_dict)
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
     if not result.data:
         raise HTTPException(status_code=404, detail="API key not found")
 
+    invalidate_api_key(str(key_id))
+
     return ApiResponse(data=result.data[0])
 
 
@@ -167,17 +166,18 @@ async def revoke_api_key(
     """
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("api_keys")
         .delete()
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
     if not result.data:
         raise HTTPException(status_code=404, detail="API key not found")
 
+    invalidate_api_key(str(key_id))
+
     return ApiResponse(data={"deleted": True, "id": str(key_id)})
 
 
@@ -193,12 +193,11 @@ async def get_api_key_usage(
     supabase = get_supabase_client()
 
     # Get key details
-    key_result = (
+    key_result = await execute_query(
         supabase.table("api_keys")
         .select("*")
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
     if not key_result.data or len(key_result.data) == 0:
@@ -208,12 +207,11 @@ async def get_api_key_usage(
 
     # Get today's request count from usage logs
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_result = (
+    today_result = await execute_query(
         supabase.table("api_key_usage_logs")
         .select("id", count="exact")
         .eq("api_key_id", str(key_id))
         .gte("created_at", today_start.isoformat())
-        .execute()
     )
 
     usage_stats = {
@@ -245,12 +243,11 @@ async def rotate_api_key(
     supabase = get_supabase_client()
 
     # Verify key exists
-    existing = (
+    existing = await execute_query(
         supabase.table("api_keys")
         .select("*")
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
     if not existing.data or len(existing.data) == 0:
@@ -260,7 +257,7 @@ async def rotate_api_key(
     full_key, key_prefix, key_hash = generate_api_key()
 
     # Update with new key hash
-    result = (
+    result = await execute_query(
         supabase.table("api_keys")
         .update({
             "key_prefix": key_prefix,
@@ -269,9 +266,11 @@ async def rotate_api_key(
         })
         .eq("id", str(key_id))
         .eq("user_id", user["id"])
-        .execute()
     )
 
+    # The old key must stop working immediately on this worker
+    invalidate_api_key(str(key_id))
+
     response_data = result.data[0]
     response_data["key"] = full_key
 
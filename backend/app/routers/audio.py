@@ -11,7 +11,7 @@ from app.models.schemas import (
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, execute_query, run_sync, upload_storage_object
 from app.services.gemini import gemini_service
 from app.config import get_settings
 
@@ -34,13 +34,12 @@ def add_audio_urls(audio_list: list) -> list:
 async def verify_notebook_access(notebook_id: UUID, user_id: str):
     """Verify user has access to the notebook."""
     supabase = get_supabase_client()
-    result = (
+    result = await execute_query(
         supabase.table("notebooks")
         .select("id")
         .eq("id", str(notebook_id))
         .eq("user_id", user_id)
         .single()
-        .execute()
     )
     if not result.data:
         raise HTTPException(status_code=404, detail="Notebook not found")
@@ -56,16 +55,15 @@ async def get_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]
     if source_ids:
         query = query.in_("id", [str(sid) for sid in source_ids])
 
-    result = query.execute()
+    result = await execute_query(query)
     sources = result.data or []
 
     content_parts = []
     for source in sources:
         source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
 
-        if source["type"] == "text" and metadata.get("content"):
-            content_parts.append(metadata["content"])
+        if source["type"] == "text" and source.get("content"):
+            content_parts.append(source["content"])
         elif source_guide.get("summary"):
             content_parts.append(source_guide["summary"])
 
@@ -136,7 +134,7 @@ async def create_audio(
         "source_ids": [str(s["id"]) for s in sources],
     }
 
-    result = supabase.table("audio_overviews").insert(audio_data).execute()
+    result = await execute_query(supabase.table("audio_overviews").insert(audio_data))
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create audio job")
@@ -147,10 +145,10 @@ async def create_audio(
     try:
         print(f"[AUDIO] Starting audio generation for {audio_id}")
         # Update status to processing
-        supabase.table("audio_overviews").update({
+        await execute_query(supabase.table("audio_overviews").update({
             "status": "processing",
             "progress_percent": 10,
-        }).eq("id", audio_id).execute()
+        }).eq("id", audio_id))
 
         # Generate script
         script_result = await gemini_service.generate_audio_script(
@@ -162,40 +160,30 @@ async def create_audio(
         script = script_result["content"]
 
         # Update with script
-        supabase.table("audio_overviews").update({
+        await execute_query(supabase.table("audio_overviews").update({
             "script": script,
             "progress_percent": 50,
-        }).eq("id", audio_id).execute()
+        }).eq("id", audio_id))
 
         # Generate TTS audio
         print(f"[AUDIO] Starting TTS generation for {audio_id}")
-        supabase.table("audio_overviews").update({
+        await execute_query(supabase.table("audio_overviews").update({
             "progress_percent": 60,
-        }).eq("id", audio_id).execute()
+        }).eq("id", audio_id))
 
+        # The WAV header and PCM are uploaded as separate chunks rather than
+        # joined into a second full-size buffer (the PCM itself arrives from
+        # Gemini as one blob and is held in full)
+        audio_filename = f"{notebook_id}/{audio_id}.wav"
         tts_result = await gemini_service.generate_tts_audio(
             script=script,
             format_type=audio.format,
+            upload=lambda chunks: upload_storage_object("audio", audio_filename, chunks, "audio/wav"),
         )
-        print(f"[AUDIO] TTS completed, audio size: {len(tts_result.get('audio_data', b''))} bytes")
-
-        # Upload audio to Supabase Storage
-        supabase.table("audio_overviews").update({
-            "progress_percent": 80,
-        }).eq("id", audio_id).execute()
-
-        audio_filename = f"{notebook_id}/{audio_id}.wav"
-        upload_result = supabase.storage.from_("audio").upload(
-            audio_filename,
-            tts_result["audio_data"],
-            {"content-type": "audio/wav"}
-        )
-
-        # Get public URL for the audio file
-        audio_url = supabase.storage.from_("audio").get_public_url(audio_filename)
+        print(f"[AUDIO] TTS completed, audio size: {tts_result['size_bytes']} bytes")
 
         # Mark as complete with audio file
-        supabase.table("audio_overviews").update({
+        await execute_query(supabase.table("audio_overviews").update({
             "status": "completed",
             "progress_percent": 100,
             "model_used": "gemini-2.5-flash",
@@ -203,19 +191,19 @@ async def create_audio(
             "audio_file_path": audio_filename,
             "duration_seconds": int(tts_result["duration_seconds"]),
             "completed_at": "now()",
-        }).eq("id", audio_id).execute()
+        }).eq("id", audio_id))
 
     except Exception as e:
         import traceback
         print(f"[AUDIO] ERROR: {type(e).__name__}: {str(e)}")
         print(f"[AUDIO] Traceback: {traceback.format_exc()}")
-        supabase.table("audio_overviews").update({
+        await execute_query(supabase.table("audio_overviews").update({
             "status": "failed",
             "error_message": str(e),
-        }).eq("id", audio_id).execute()
+        }).eq("id", audio_id))
 
     # Get updated record
-    result = supabase.table("audio_overviews").select("*").eq("id", audio_id).single().execute()
+    result = await execute_query(supabase.table("audio_overviews").select("*").eq("id", audio_id).single())
 
     return ApiResponse(data=add_audio_url(result.data))
 
@@ -229,12 +217,11 @@ async def list_audio(
     await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("audio_overviews")
         .select("*")
         .eq("notebook_id", str(notebook_id))
         .order("created_at", desc=True)
-        .execute()
     )
 
     return ApiResponse(data=add_audio_urls(result.data or []))
@@ -250,13 +237,12 @@ async def get_audio(
     await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("audio_overviews")
         .select("*")
         .eq("id", str(audio_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not result.data:
@@ -275,20 +261,20 @@ async def get_audio_download(
     await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("audio_overviews")
         .select("audio_file_path")
         .eq("id", str(audio_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not result.data or not result.data.get("audio_file_path"):
         raise HTTPException(status_code=404, detail="Audio file not found")
 
     # Generate signed URL
-    signed_url = supabase.storage.from_("audio").create_signed_url(
+    signed_url = await run_sync(
+        supabase.storage.from_("audio").create_signed_url,
         result.data["audio_file_path"],
         3600,  # 1 hour expiry
     )
@@ -307,13 +293,12 @@ async def delete_audio(
     supabase = get_supabase_client()
 
     # Get audio first
-    audio = (
+    audio = await execute_query(
         supabase.table("audio_overviews")
         .select("*")
         .eq("id", str(audio_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not audio.data:
@@ -322,11 +307,11 @@ async def delete_audio(
     # Delete from storage if exists
     if audio.data.get("audio_file_path"):
         try:
-            supabase.storage.from_("audio").remove([audio.data["audio_file_path"]])
+            await run_sync(supabase.storage.from_("audio").remove, [audio.data["audio_file_path"]])
         except:
             pass
 
     # Delete record
-    supabase.table("audio_overviews").delete().eq("id", str(audio_id)).execute()
+    await execute_query(supabase.table("audio_overviews").delete().eq("id", str(audio_id)))
 
     return ApiResponse(data={"deleted": True, "id": str(audio_id)})
@@ -55,10 +55,9 @@ async def get_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]
 
         # Get content based on source type
         source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
 
-        if source["type"] == "text" and metadata.get("content"):
-            content = metadata["content"]
+        if source["type"] == "text" and source.get("content"):
+            content = source["content"]
         elif source_guide.get("summary"):
             content = source_guide["summary"]
         else:
@@ -255,9 +255,8 @@ This export can be used as a backup. To re-import, use the NotebookLM Reimagined
                         source_info["export_error"] = str(e)
 
                 # For text sources, include content
-                if source["type"] == "text" and source.get("metadata"):
-                    metadata = source["metadata"] or {}
-                    if content := metadata.get("content"):
+                if source["type"] == "text":
+                    if content := source.get("content"):
                         filename = f"{source['id']}.txt"
                         zf.writestr(f"{zip_name}/sources/text/{filename}", content)
                         source_info["exported_file"] = f"text/{filename}"
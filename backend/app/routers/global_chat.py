@@ -86,10 +86,9 @@ async def get_sources_from_notebooks(
 
                 # Get content
                 source_guide = source.get("source_guide") or {}
-                metadata = source.get("metadata") or {}
 
-                if source["type"] == "text" and metadata.get("content"):
-                    content = metadata["content"]
+                if source["type"] == "text" and source.get("content"):
+                    content = source["content"]
                 elif source_guide.get("summary"):
                     content = source_guide["summary"]
                 else:
@@ -10,6 +10,7 @@ from app.models.schemas import (
 )
 from app.services.auth import get_current_user
 from app.services.supabase_client import get_supabase_client
+from app.services.notebook_access import invalidate_notebook_access
 
 router = APIRouter(prefix="/notebooks", tags=["notebooks"])
 
@@ -114,6 +115,8 @@ async def update_notebook(
     if not result.data:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
+    invalidate_notebook_access(notebook_id)
+
     return ApiResponse(data=result.data[0])
 
 
@@ -137,4 +140,6 @@ async def delete_notebook(
     if not result.data:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
+    invalidate_notebook_access(notebook_id)
+
     return ApiResponse(data={"deleted": True, "id": str(notebook_id)})
@@ -1,14 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List, Optional
 from uuid import UUID
+import orjson
 
 from app.models.schemas import (
     ResearchCreate,
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
-from app.services.gemini import gemini_service
+from app.services.supabase_client import get_supabase_client, execute_query
+from app.services.gemini import gemini_service, RESEARCH_CITATIONS
+from app.services.generation_cache import cached_generate
+from app.services.notebook_access import invalidate_sources_content
 
 router = APIRouter(prefix="/notebooks/{notebook_id}/research", tags=["research"])
 
@@ -70,7 +75,8 @@ async def create_research(
         }).eq("id", task_id).execute()
 
         # Generate research report
-        research_result = await gemini_service.generate_research_report(
+        research_result = await cached_generate(
+            gemini_service.generate_research_report,
             query=research.query,
             mode=research.mode or "fast",
         )
@@ -98,6 +104,77 @@ async def create_research(
     return ApiResponse(data=result.data)
 
 
+@router.post("/stream")
+async def stream_research(
+    notebook_id: UUID,
+    research: ResearchCreate,
+    user: dict = Depends(get_current_user),
+):
+    """Start a research task, streaming the report as NDJSON while it is written.
+
+    Emits a {"type": "task"} line with the task id, {"type": "text"} lines,
+    then a final {"type": "done"} line with usage (or {"type": "error"}).
+    The task row is updated after the stream closes.
+    """
+    await verify_notebook_access(notebook_id, user["id"])
+    supabase = get_supabase_client()
+
+    result = await execute_query(supabase.table("research_tasks").insert({
+        "notebook_id": str(notebook_id),
+        "query": research.query,
+        "mode": research.mode or "fast",
+        "status": "processing",
+        "progress_message": "Writing report...",
+    }))
+
+    if not result.data:
+        raise HTTPException(status_code=400, detail="Failed to create research task")
+
+    task_id = result.data[0]["id"]
+    # Filled in by the stream; written by the background task once it closes
+    final_fields: dict = {}
+
+    async def events():
+        yield orjson.dumps({"type": "task", "id": task_id}) + b"\n"
+        parts = []
+        usage = {}
+        try:
+            async for event in gemini_service.generate_research_report_stream(
+                query=research.query,
+                mode=research.mode or "fast",
+            ):
+                if event["type"] == "usage":
+                    usage = event["usage"]
+                    continue
+                parts.append(event["text"])
+                yield orjson.dumps(event) + b"\n"
+        except Exception as e:
+            final_fields.update({"status": "failed", "progress_message": str(e)})
+            yield orjson.dumps({"type": "error", "detail": str(e)}) + b"\n"
+            return
+
+        final_fields.update({
+            "status": "completed",
+            "progress_message": "Research complete",
+            "report_content": "".join(parts),
+            "report_citations": RESEARCH_CITATIONS,
+            "cost_usd": usage.get("cost_usd"),
+            "completed_at": "now()",
+        })
+        yield orjson.dumps({"type": "done", "id": task_id, "citations": RESEARCH_CITATIONS, "usage": usage}) + b"\n"
+
+    async def persist():
+        # A stream that ended early leaves the task failed rather than processing
+        fields = final_fields or {"status": "failed", "progress_message": "Stream closed before completion"}
+        await execute_query(supabase.table("research_tasks").update(fields).eq("id", task_id))
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(persist),
+    )
+
+
 @router.get("", response_model=ApiResponse)
 async def list_research(
     notebook_id: UUID,
@@ -190,6 +267,8 @@ async def add_research_to_notebook(
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create source")
 
+    invalidate_sources_content(notebook_id)
+
     return ApiResponse(data=result.data[0])
 
 
@@ -1,74 +1,229 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Query
+from typing import List, Optional, Union
 from uuid import UUID
+from datetime import datetime
 import aiofiles
+import asyncio
+import base64
+import hashlib
+import io
 import os
 import tempfile
-import json
 import httpx
+import orjson
 import re
+import zipfile
 
 from app.models.schemas import (
-    SourceResponse,
     YouTubeSourceCreate,
     URLSourceCreate,
     TextSourceCreate,
+    BatchSourceCreate,
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, execute_query, run_sync
+from app.services.notebook_access import verify_notebook_access_only, invalidate_sources_content
+from app.services.cpu_pool import run_cpu_bound
 from app.services.gemini import gemini_service
+from app.config import get_settings
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+
+# Optional extraction backends, resolved once at import time
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = lxml_html = None
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from youtube_transcript_api import YouTubeTranscriptApi
+except ImportError:
+    YouTubeTranscriptApi = None
 
 router = APIRouter(prefix="/notebooks/{notebook_id}/sources", tags=["sources"])
 
+# Columns returned by list responses. Extracted text lives in the
+# `content` column and is only returned by get_source.
+SOURCE_COLUMNS = (
+    "id, notebook_id, type, name, status, file_path, original_filename, mime_type, "
+    "file_size_bytes, token_count, metadata, source_guide, error_message, created_at, updated_at"
+)
 
-async def verify_notebook_access(notebook_id: UUID, user_id: str):
-    """Verify user has access to the notebook."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("notebooks")
-        .select("id")
-        .eq("id", str(notebook_id))
-        .eq("user_id", user_id)
-        .single()
-        .execute()
-    )
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Notebook not found")
-    return result.data
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# upload_source parses its multipart body itself, so describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+TYPE_MAP = {
+    "pdf": "pdf",
+    "docx": "docx",
+    "doc": "docx",
+    "txt": "txt",
+    "md": "txt",
+    "html": "txt",
+}
+
+# Use correct MIME type based on extension (browsers often send application/octet-stream for docx)
+MIME_MAP = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "doc": "application/msword",
+    "txt": "text/plain",
+    "md": "text/markdown",
+    "html": "text/html",
+}
+
+
+SOURCE_GUIDE_MODEL = "gemini-2.5-flash"
+
+# Content longer than one chunk (~8K tokens) is summarized per chunk, then merged
+SOURCE_GUIDE_CHUNK_CHARS = 32000
+SOURCE_GUIDE_CONCURRENCY = 4
+
+YOUTUBE_ID_RE = re.compile(r"(?:[?&#]v=|youtu\.be/|/embed/|/shorts/|/live/)([A-Za-z0-9_-]{11})")
+
+MAX_HTML_BYTES = 2 * 1024 * 1024
+# Opening tags of blocks dropped before parsing; attributes are bounded so a
+# stray "<script" with no ">" after it can't make every match scan to the end
+SCRIPT_OPEN_RE = re.compile(rb"<(script|style|noscript)\b[^>]{0,2048}>", re.I)
+
+# Responses used verbatim instead of going through the HTML parser
+PLAIN_TEXT_TYPES = {"text/plain", "text/markdown", "text/csv", "application/json"}
+
+BLANK_LINES_RE = re.compile(r"[^\S\n]*\n\s*")
+
+# Elements that never hold readable page content
+STRIP_XPATH = "|".join(
+    f"//{tag}" for tag in ("script", "style", "nav", "footer", "header", "aside", "form", "noscript")
+) + "|//comment()"
+
+
+def strip_script_blocks(html: bytes) -> bytes:
+    """Remove script, style and noscript blocks in one forward pass.
+
+    A block with no closing tag is left for lxml to drop. Once a tag has no
+    closing tag ahead, its later openings are skipped rather than searched
+    again, so unclosed blocks can't make the pass quadratic.
+    """
+    lowered = html.lower()
+    parts = []
+    pos = 0
+    unclosed = set()
+    for match in SCRIPT_OPEN_RE.finditer(html):
+        tag = match.group(1).lower()
+        if match.start() < pos or tag in unclosed:
+            continue
+
+        # The closing tag is "</tag" followed by whitespace or ">"
+        close = lowered.find(b"</" + tag, match.end())
+        while close != -1 and lowered[close + len(tag) + 2:close + len(tag) + 3] not in b" \t\r\n\f>":
+            close = lowered.find(b"</" + tag, close + 1)
+        end = lowered.find(b">", close) if close != -1 else -1
+        if end == -1:
+            unclosed.add(tag)
+            continue
+
+        parts.append(html[pos:match.start()])
+        pos = end + 1
+
+    parts.append(html[pos:])
+    return b"".join(parts)
 
 
 async def extract_url_content(url: str) -> str:
-    """Fetch a URL and extract readable text content."""
-    try:
-        from bs4 import BeautifulSoup
-    except ImportError:
-        return ""
+    """Fetch a URL and extract readable text content.
 
+    Plain text and JSON are used as-is and PDFs go through the PDF
+    extractor; only HTML responses are parsed.
+    """
     try:
+        # Stream the body and stop at the size cap; text past the 100k
+        # character cap would be discarded anyway
+        chunks = []
+        received = 0
         async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-            response = await client.get(url, headers={
+            async with client.stream("GET", url, headers={
                 "User-Agent": "Mozilla/5.0 (compatible; NotebookLM/1.0)"
-            })
-            response.raise_for_status()
-            html = response.text
+            }) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                # A truncated PDF cannot be parsed, so allow a full upload's worth
+                max_bytes = get_settings().max_upload_bytes if content_type == "application/pdf" else MAX_HTML_BYTES
+                async for chunk in response.aiter_bytes():
+                    chunks.append(chunk)
+                    received += len(chunk)
+                    if received >= max_bytes:
+                        break
+                charset = response.charset_encoding
+
+        body = b"".join(chunks)[:max_bytes]
+
+        if content_type == "application/pdf":
+            return await run_cpu_bound(extract_pdf_text, body)
+
+        if content_type in PLAIN_TEXT_TYPES:
+            try:
+                text = body.decode(charset or "utf-8", errors="replace")
+            except LookupError:
+                text = body.decode("utf-8", errors="replace")
+            return text.strip()[:100000]
 
-        soup = BeautifulSoup(html, "html.parser")
+        if lxml_html is None:
+            return ""
+
+        # Drop script/style blocks before parsing so lxml builds a smaller tree
+        html = strip_script_blocks(body)
+        if charset:
+            try:
+                html = html.decode(charset, errors="replace")
+            except LookupError:
+                pass  # Unknown charset: let lxml sniff the <meta> declaration
+
+        tree = lxml_html.fromstring(html)
 
         # Remove scripts, styles, nav, footer, etc.
-        for tag in soup(["script", "style", "nav", "footer", "header", "aside", "form", "noscript"]):
-            tag.decompose()
+        for element in tree.xpath(STRIP_XPATH):
+            element.drop_tree()
 
-        # Try to get the main content area first
-        main = soup.find("main") or soup.find("article") or soup.find("body")
-        if main:
-            text = main.get_text(separator="\n", strip=True)
-        else:
-            text = soup.get_text(separator="\n", strip=True)
+        # Try to get the main content area first (lxml elements without
+        # children are falsy, so compare against None explicitly)
+        main = next(
+            (node for node in (tree.find(".//main"), tree.find(".//article"), tree.find(".//body")) if node is not None),
+            tree,
+        )
+        text = "\n".join(main.itertext())
 
-        # Clean up whitespace
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        text = "\n".join(lines)
+        # Clean up whitespace: trim every line and drop blank ones in one pass
+        text = BLANK_LINES_RE.sub("\n", text).strip()
 
         # Limit to ~100KB
         return text[:100000]
@@ -80,14 +235,13 @@ async def extract_url_content(url: str) -> str:
 
 async def extract_youtube_transcript(video_id: str) -> str:
     """Extract transcript from a YouTube video."""
-    try:
-        from youtube_transcript_api import YouTubeTranscriptApi
-    except ImportError:
+    if YouTubeTranscriptApi is None:
         return ""
 
     try:
         ytt_api = YouTubeTranscriptApi()
-        transcript = ytt_api.fetch(video_id)
+        # The client uses blocking HTTP calls
+        transcript = await run_sync(ytt_api.fetch, video_id)
         # Combine all text segments
         text = " ".join([entry.text for entry in transcript])
         return text[:100000]
@@ -96,21 +250,51 @@ async def extract_youtube_transcript(video_id: str) -> str:
         return ""
 
 
-def extract_pdf_text(content: bytes) -> str:
-    """Extract text from a PDF file."""
+def extract_pdf_text(content: Union[bytes, str]) -> str:
+    """Extract text from a PDF file, given as bytes or a local file path.
+
+    Uses PyMuPDF (MuPDF's C engine) when available and falls back to pypdf.
+    """
+    if fitz is None:
+        return _extract_pdf_text_pypdf(content)
+
     try:
-        from PyPDF2 import PdfReader
-        import io
-    except ImportError:
+        text_parts = []
+        total_len = 0
+        doc = fitz.open(content) if isinstance(content, str) else fitz.open(stream=content, filetype="pdf")
+        with doc:
+            for page in doc:
+                page_text = page.get_text("text")
+                if page_text:
+                    text_parts.append(page_text)
+                    total_len += len(page_text) + 2
+                    # Pages past the cap would be discarded anyway
+                    if total_len >= 100000:
+                        break
+        text = "\n\n".join(text_parts)
+        return text[:100000]
+    except Exception as e:
+        print(f"PDF extraction failed: {e}")
+        return ""
+
+
+def _extract_pdf_text_pypdf(content: Union[bytes, str]) -> str:
+    """Extract text from a PDF file with pure-Python pypdf."""
+    if PdfReader is None:
         return ""
 
     try:
-        reader = PdfReader(io.BytesIO(content))
+        reader = PdfReader(content if isinstance(content, str) else io.BytesIO(content))
         text_parts = []
+        total_len = 0
         for page in reader.pages:
             page_text = page.extract_text()
             if page_text:
                 text_parts.append(page_text)
+                total_len += len(page_text) + 2
+                # Stop decoding pages once the cap is reached
+                if total_len >= 100000:
+                    break
         text = "\n\n".join(text_parts)
         return text[:100000]
     except Exception as e:
@@ -118,17 +302,13 @@ def extract_pdf_text(content: bytes) -> str:
         return ""
 
 
-def extract_docx_text(content: bytes) -> str:
-    """Extract text from a DOCX file.
+def extract_docx_text(content: Union[bytes, str]) -> str:
+    """Extract text from a DOCX file, given as bytes or a local file path.
 
     Parses all w:t elements from the raw XML to capture text from
     paragraphs, tables, text boxes, grouped shapes, headers, and footers.
     """
-    try:
-        import zipfile
-        import io
-        from lxml import etree
-    except ImportError:
+    if etree is None:
         print("lxml not installed, DOCX extraction unavailable")
         return ""
 
@@ -136,7 +316,7 @@ def extract_docx_text(content: bytes) -> str:
         nsmap = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
         text_parts = []
 
-        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        with zipfile.ZipFile(content if isinstance(content, str) else io.BytesIO(content)) as zf:
             # Main document body
             xml_parts = ["word/document.xml"]
             # Also check headers and footers
@@ -163,18 +343,273 @@ def extract_docx_text(content: bytes) -> str:
         return ""
 
 
+def read_text_file(path: str) -> str:
+    """Read the start of a local text file (enough bytes for the 100k character cap)."""
+    with open(path, "rb") as f:
+        return f.read(400000).decode("utf-8", errors="ignore")
+
+
+async def spool_upload(request: Request, max_bytes: int) -> tuple[str, int, str, str, Optional[str]]:
+    """Stream the "file" part of a multipart upload to a temp file, hashing it on the way.
+
+    The body is parsed as it arrives, so the file is written to disk once
+    (not spooled by the framework and then copied). Returns (temp_path,
+    size, sha256 hexdigest, filename, part content type). Raises 413 and
+    removes the temp file once the file exceeds max_bytes.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    part_headers: dict = {}
+    header_name = b""
+    header_value = b""
+    in_file = False
+    file_meta: dict = {}
+    pending: List[bytes] = []
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        nonlocal header_name
+        header_name += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        nonlocal header_value
+        header_value += data[start:end]
+
+    def on_header_end() -> None:
+        nonlocal header_name, header_value
+        part_headers[header_name.lower()] = header_value
+        header_name = header_value = b""
+
+    def on_headers_finished() -> None:
+        nonlocal in_file
+        _, options = parse_options_header(part_headers.get(b"content-disposition", b""))
+        in_file = options.get(b"name") == b"file" and b"filename" in options and not file_meta
+        if in_file:
+            file_meta["filename"] = options[b"filename"].decode("utf-8", errors="replace")
+            content_type = part_headers.get(b"content-type")
+            file_meta["content_type"] = content_type.decode("latin-1") if content_type else None
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if in_file:
+            pending.append(data[start:end])
+
+    def on_part_end() -> None:
+        nonlocal in_file
+        in_file = False
+        part_headers.clear()
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise HTTPException(status_code=400, detail="Malformed multipart upload")
+                for data in pending:
+                    size += len(data)
+                    if size > max_bytes:
+                        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+                    hasher.update(data)
+                    await out.write(data)
+                pending.clear()
+        if not file_meta:
+            raise HTTPException(status_code=422, detail='Missing "file" upload field')
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # Parsers pick the format from the extension, which is only known once
+    # the part headers have been read
+    suffix = os.path.splitext(file_meta["filename"])[1].lower()
+    if suffix:
+        os.rename(tmp_path, tmp_path + suffix)
+        tmp_path += suffix
+    return tmp_path, size, hasher.hexdigest(), file_meta["filename"], file_meta["content_type"]
+
+
+async def download_to_temp(supabase, storage_path: str, suffix: str) -> str:
+    """Stream an object from the sources bucket to a temp file and return its path."""
+    signed = await run_sync(supabase.storage.from_("sources").create_signed_url, storage_path, 60)
+    signed_url = signed.get("signedURL") or signed.get("signedUrl")
+
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            async with client.stream("GET", signed_url) as response:
+                response.raise_for_status()
+                async with aiofiles.open(tmp_path, "wb") as out:
+                    async for chunk in response.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                        await out.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+async def extract_file_text(source_type: str, path: str) -> str:
+    """Extract text from a local pdf/docx/txt file; parsing runs off the event loop."""
+    if source_type == "txt":
+        return await run_sync(read_text_file, path)
+    if source_type == "pdf":
+        return await run_cpu_bound(extract_pdf_text, path)
+    if source_type == "docx":
+        return await run_cpu_bound(extract_docx_text, path)
+    return ""
+
+
+def upload_file_to_storage(supabase, storage_path: str, local_path: str, mime_type: str):
+    """Upload a local file to the sources bucket, streaming it from disk.
+
+    Paths are content-addressed, so overwriting an existing object writes the
+    same bytes; upserting lets concurrent uploads of one file both succeed.
+    """
+    with open(local_path, "rb") as f:
+        supabase.storage.from_("sources").upload(
+            storage_path, f, {"content-type": mime_type, "upsert": "true"}
+        )
+
+
+def without_content(source: dict) -> dict:
+    """Drop the extracted text from a source row returned by insert/update.
+
+    Writes return the saved row, so handlers respond with it instead of
+    selecting the source again.
+    """
+    return {key: value for key, value in source.items() if key != "content"}
+
+
+def content_storage_path(user_id: str, digest: str, ext: str) -> str:
+    """Build a storage key under the user's folder (as the storage policies
+    require) so the same file uploaded again by that user shares one object."""
+    return f"{user_id}/{digest}.{ext}"
+
+
+async def storage_object_exists(supabase, path: str) -> bool:
+    """Check whether an object already exists in the sources bucket."""
+    folder, _, name = path.rpartition("/")
+    try:
+        entries = await run_sync(supabase.storage.from_("sources").list, folder, {"search": name})
+    except Exception:
+        return False
+    return any(entry.get("name") == name for entry in entries or [])
+
+
+def encode_cursor(created_at: str, source_id: str) -> str:
+    """Encode a list_sources keyset position as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{created_at}|{source_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        created_at, source_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        datetime.fromisoformat(created_at)
+        return created_at, str(UUID(source_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_youtube_video_id(url: str) -> Optional[str]:
+    """Extract the video ID from a watch, youtu.be, embed, shorts or live URL."""
+    match = YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def content_digest(text: str) -> str:
+    """Fingerprint text for the source guide cache."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=32).hexdigest()
+
+
+def chunk_text(text: str, size: int) -> List[str]:
+    """Split text into chunks of at most size characters, preferring line breaks."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            newline = text.rfind("\n", start + size // 2, end)
+            if newline != -1:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+async def summarize_content(content: str) -> dict:
+    """Summarize content with one call, or map-reduce over chunks when it is long.
+
+    Chunk summaries run concurrently (bounded to avoid rate limits) and are
+    merged by a final call, so the whole source contributes to the guide.
+    """
+    chunks = chunk_text(content, SOURCE_GUIDE_CHUNK_CHARS)
+    if len(chunks) == 1:
+        return await gemini_service.generate_summary(content, model_name=SOURCE_GUIDE_MODEL)
+
+    semaphore = asyncio.Semaphore(SOURCE_GUIDE_CONCURRENCY)
+
+    async def summarize_chunk(chunk: str) -> dict:
+        async with semaphore:
+            return await gemini_service.generate_summary(chunk, model_name=SOURCE_GUIDE_MODEL)
+
+    partials = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+    merged = "\n\n".join(
+        f"Section {i} of {len(partials)}:\n{partial['content']}"
+        for i, partial in enumerate(partials, 1)
+    )
+    final = await gemini_service.generate_summary(merged, model_name=SOURCE_GUIDE_MODEL)
+    # Report the tokens of the source itself rather than of the merge prompt
+    final["usage"]["input_tokens"] = sum(p["usage"]["input_tokens"] for p in partials)
+    return final
+
+
 async def generate_source_guide(content: str) -> dict:
-    """Generate a source guide (summary, topics, questions) from content."""
+    """Generate a source guide (summary, topics, questions) from content.
+
+    Results are cached in source_guide_cache by content hash and model, so
+    re-uploads and reprocessing of unchanged content skip the LLM calls.
+    """
     if not content or len(content.strip()) < 50:
         return {}
 
+    key = content_digest(content)
+    supabase = get_supabase_client()
+
     try:
-        summary_result = await gemini_service.generate_summary(content[:50000])
+        cached = await execute_query(
+            supabase.table("source_guide_cache")
+            .select("source_guide, token_count")
+            .eq("key", key)
+            .eq("model", SOURCE_GUIDE_MODEL)
+            .limit(1)
+        )
+        if cached.data:
+            return cached.data[0]
+    except Exception as e:
+        print(f"Source guide cache lookup failed: {e}")
+
+    try:
+        summary_result = await summarize_content(content)
         try:
-            source_guide = json.loads(summary_result["content"])
-        except (json.JSONDecodeError, TypeError):
+            source_guide = orjson.loads(summary_result["content"])
+        except (orjson.JSONDecodeError, TypeError):
             source_guide = {"summary": summary_result["content"]}
-        return {
+        guide_result = {
             "source_guide": source_guide,
             "token_count": summary_result["usage"]["input_tokens"],
         }
@@ -182,54 +617,70 @@ async def generate_source_guide(content: str) -> dict:
         print(f"Source guide generation failed: {e}")
         return {}
 
+    try:
+        await execute_query(
+            supabase.table("source_guide_cache").upsert(
+                {"key": key, "model": SOURCE_GUIDE_MODEL, **guide_result},
+                on_conflict="key,model",
+            )
+        )
+    except Exception as e:
+        print(f"Source guide cache write failed: {e}")
+
+    return guide_result
 
-@router.post("", response_model=ApiResponse)
+
+@router.post("", response_model=ApiResponse, openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_source(
     notebook_id: UUID,
-    file: UploadFile = File(...),
+    request: Request,
     user: dict = Depends(get_current_user),
 ):
-    """Upload a file source (PDF, DOCX, TXT, etc.)."""
-    await verify_notebook_access(notebook_id, user["id"])
+    """Upload a file source (PDF, DOCX, TXT, etc.) as multipart form field "file".
+
+    UploadSizeLimitMiddleware rejects oversized bodies before they are parsed.
+    """
+    max_bytes = get_settings().max_upload_bytes
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    # Determine file type
-    filename = file.filename or "unknown"
-    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "txt"
-
-    type_map = {
-        "pdf": "pdf",
-        "docx": "docx",
-        "doc": "docx",
-        "txt": "txt",
-        "md": "txt",
-        "html": "txt",
-    }
-    source_type = type_map.get(ext, "txt")
-
-    # Use correct MIME type based on extension (browsers often send application/octet-stream for docx)
-    mime_map = {
-        "pdf": "application/pdf",
-        "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "doc": "application/msword",
-        "txt": "text/plain",
-        "md": "text/markdown",
-        "html": "text/html",
-    }
-    mime_type = mime_map.get(ext, file.content_type or "application/octet-stream")
+    # Stream the upload to disk so memory stays flat regardless of file size
+    tmp_path, file_size, digest, filename, content_type = await spool_upload(request, max_bytes)
+    try:
+        # Determine file type
+        filename = filename or "unknown"
+        ext = os.path.splitext(filename)[1][1:].lower() or "txt"
+        source_type = TYPE_MAP.get(ext, "txt")
+        mime_type = MIME_MAP.get(ext, content_type or "application/octet-stream")
 
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
 
-    # Upload to Supabase Storage
-    storage_path = f"{user['id']}/{notebook_id}/{filename}"
+        return await _store_uploaded_source(
+            supabase, notebook_id, user["id"], tmp_path, filename, ext, source_type, mime_type, file_size, digest
+        )
+    finally:
+        os.unlink(tmp_path)
 
-    supabase.storage.from_("sources").upload(
-        storage_path,
-        content,
-        {"content-type": mime_type}
-    )
+
+async def _store_uploaded_source(
+    supabase,
+    notebook_id: UUID,
+    user_id: str,
+    tmp_path: str,
+    filename: str,
+    ext: str,
+    source_type: str,
+    mime_type: str,
+    file_size: int,
+    digest: str,
+) -> ApiResponse:
+    """Upload a spooled file to storage, create its source row and extract its text."""
+    # Upload to Supabase Storage under a content-addressed path in the user's
+    # folder; re-uploads of the same file (retries, the same PDF in several of
+    # their notebooks) reuse the object
+    storage_path = content_storage_path(user_id, digest, ext)
+
+    if not await storage_object_exists(supabase, storage_path):
+        await run_sync(upload_file_to_storage, supabase, storage_path, tmp_path, mime_type)
 
     # Create source record
     source_data = {
@@ -244,7 +695,7 @@ async def upload_source(
         "metadata": {},
     }
 
-    result = supabase.table("sources").insert(source_data).execute()
+    result = await execute_query(supabase.table("sources").insert(source_data))
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create source")
@@ -252,50 +703,29 @@ async def upload_source(
     source = result.data[0]
 
     try:
-        extracted_text = ""
-
-        if source_type == "txt":
-            extracted_text = content.decode("utf-8", errors="ignore")
-        elif source_type == "pdf":
-            extracted_text = extract_pdf_text(content)
-        elif source_type == "docx":
-            extracted_text = extract_docx_text(content)
+        extracted_text = await extract_file_text(source_type, tmp_path)
 
+        update_data = {"status": "ready"}
         if extracted_text:
             guide_result = await generate_source_guide(extracted_text)
-            update_data = {
-                "status": "ready",
-                "metadata": {"content": extracted_text[:100000]},
-            }
+            update_data["content"] = extracted_text[:100000]
             if guide_result.get("source_guide"):
                 update_data["source_guide"] = guide_result["source_guide"]
             if guide_result.get("token_count"):
                 update_data["token_count"] = guide_result["token_count"]
 
-            supabase.table("sources").update(update_data).eq("id", source["id"]).execute()
-        else:
-            supabase.table("sources").update({
-                "status": "ready",
-            }).eq("id", source["id"]).execute()
-
     except Exception as e:
-        supabase.table("sources").update({
+        update_data = {
             "status": "ready",
             "error_message": f"Processing failed: {str(e)[:200]}",
-        }).eq("id", source["id"]).execute()
+        }
 
-    # Update notebook source count
-    try:
-        supabase.table("notebooks").update({
-            "source_count": supabase.table("sources").select("id", count="exact").eq("notebook_id", str(notebook_id)).execute().count or 0
-        }).eq("id", str(notebook_id)).execute()
-    except Exception:
-        pass
+    # notebooks.source_count is maintained by a trigger on sources
+    result = await execute_query(supabase.table("sources").update(update_data).eq("id", source["id"]))
 
-    # Refresh source data
-    result = supabase.table("sources").select("*").eq("id", source["id"]).single().execute()
+    invalidate_sources_content(notebook_id)
 
-    return ApiResponse(data=result.data)
+    return ApiResponse(data=without_content(result.data[0]))
 
 
 @router.post("/youtube", response_model=ApiResponse)
@@ -305,16 +735,11 @@ async def add_youtube_source(
     user: dict = Depends(get_current_user),
 ):
     """Add a YouTube video as a source."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    # Extract video ID from URL
     url = youtube.url
-    video_id = None
-    if "youtube.com/watch?v=" in url:
-        video_id = url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in url:
-        video_id = url.split("youtu.be/")[1].split("?")[0]
+    video_id = parse_youtube_video_id(url)
 
     name = youtube.name or f"YouTube: {video_id or url}"
 
@@ -329,59 +754,60 @@ async def add_youtube_source(
         },
     }
 
-    result = supabase.table("sources").insert(source_data).execute()
+    # Create the row while the transcript is fetched
+    result, transcript = await asyncio.gather(
+        execute_query(supabase.table("sources").insert(source_data)),
+        extract_youtube_transcript(video_id) if video_id else asyncio.sleep(0, result=""),
+    )
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create source")
 
     source = result.data[0]
 
-    # Extract transcript and generate source guide
+    # Generate source guide
     try:
-        transcript = ""
-        if video_id:
-            transcript = await extract_youtube_transcript(video_id)
-
         if transcript:
             guide_result = await generate_source_guide(transcript)
             update_data = {
                 "status": "ready",
-                "metadata": {
-                    "url": url,
-                    "video_id": video_id,
-                    "content": transcript[:100000],
-                },
+                "content": transcript[:100000],
             }
             if guide_result.get("source_guide"):
                 update_data["source_guide"] = guide_result["source_guide"]
             if guide_result.get("token_count"):
                 update_data["token_count"] = guide_result["token_count"]
 
-            supabase.table("sources").update(update_data).eq("id", source["id"]).execute()
+            result = await execute_query(supabase.table("sources").update(update_data).eq("id", source["id"]))
         else:
-            supabase.table("sources").update({
+            result = await execute_query(supabase.table("sources").update({
                 "status": "ready",
-            }).eq("id", source["id"]).execute()
+            }).eq("id", source["id"]))
 
     except Exception as e:
-        supabase.table("sources").update({
+        result = await execute_query(supabase.table("sources").update({
             "status": "ready",
             "error_message": f"Transcript extraction failed: {str(e)[:200]}",
-        }).eq("id", source["id"]).execute()
+        }).eq("id", source["id"]))
 
-    # Refresh
-    result = supabase.table("sources").select("*").eq("id", source["id"]).single().execute()
-    return ApiResponse(data=result.data)
+    invalidate_sources_content(notebook_id)
 
+    return ApiResponse(data=without_content(result.data[0]))
 
-@router.post("/url", response_model=ApiResponse)
+
+@router.post("/url", response_model=ApiResponse, status_code=202)
 async def add_url_source(
     notebook_id: UUID,
     url_source: URLSourceCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
-    """Add a website URL as a source."""
-    await verify_notebook_access(notebook_id, user["id"])
+    """Add a website URL as a source.
+
+    The row is returned in the processing state; the page is fetched and
+    summarized in the background.
+    """
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
     name = url_source.name or url_source.url[:100]
@@ -396,46 +822,15 @@ async def add_url_source(
         },
     }
 
-    result = supabase.table("sources").insert(source_data).execute()
+    result = await execute_query(supabase.table("sources").insert(source_data))
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create source")
 
     source = result.data[0]
+    background_tasks.add_task(ingest_source, source)
 
-    # Fetch URL content and generate source guide
-    try:
-        extracted_text = await extract_url_content(url_source.url)
-
-        if extracted_text:
-            guide_result = await generate_source_guide(extracted_text)
-            update_data = {
-                "status": "ready",
-                "metadata": {
-                    "url": url_source.url,
-                    "content": extracted_text[:100000],
-                },
-            }
-            if guide_result.get("source_guide"):
-                update_data["source_guide"] = guide_result["source_guide"]
-            if guide_result.get("token_count"):
-                update_data["token_count"] = guide_result["token_count"]
-
-            supabase.table("sources").update(update_data).eq("id", source["id"]).execute()
-        else:
-            supabase.table("sources").update({
-                "status": "ready",
-            }).eq("id", source["id"]).execute()
-
-    except Exception as e:
-        supabase.table("sources").update({
-            "status": "ready",
-            "error_message": f"Content extraction failed: {str(e)[:200]}",
-        }).eq("id", source["id"]).execute()
-
-    # Refresh
-    result = supabase.table("sources").select("*").eq("id", source["id"]).single().execute()
-    return ApiResponse(data=result.data)
+    return ApiResponse(data=without_content(source))
 
 
 @router.post("/text", response_model=ApiResponse)
@@ -445,7 +840,7 @@ async def add_text_source(
     user: dict = Depends(get_current_user),
 ):
     """Add pasted text as a source."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
     source_data = {
@@ -453,47 +848,127 @@ async def add_text_source(
         "type": "text",
         "name": text_source.name,
         "status": "processing",
-        "metadata": {
-            "content": text_source.content[:100000],  # Limit content size
-        },
+        "content": text_source.content[:100000],  # Limit content size
+        "metadata": {},
     }
 
-    result = supabase.table("sources").insert(source_data).execute()
+    # Create the row and generate the summary concurrently
+    result, guide_result = await asyncio.gather(
+        execute_query(supabase.table("sources").insert(source_data)),
+        generate_source_guide(text_source.content),
+    )
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create source")
 
     source = result.data[0]
 
-    # Generate summary
+    update_data = {"status": "ready"}
+    if guide_result.get("source_guide"):
+        update_data["source_guide"] = guide_result["source_guide"]
+    if guide_result.get("token_count"):
+        update_data["token_count"] = guide_result["token_count"]
+
+    result = await execute_query(supabase.table("sources").update(update_data).eq("id", source["id"]))
+
+    invalidate_sources_content(notebook_id)
+
+    return ApiResponse(data=without_content(result.data[0]))
+
+
+async def ingest_source(source: dict):
+    """Extract content and generate a source guide for a text/URL/YouTube source row."""
+    supabase = get_supabase_client()
+    metadata = source.get("metadata") or {}
+
     try:
-        guide_result = await generate_source_guide(text_source.content)
+        extracted_text = ""
+        if source["type"] == "text":
+            extracted_text = source.get("content") or ""
+        elif source["type"] == "url" and metadata.get("url"):
+            extracted_text = await extract_url_content(metadata["url"])
+        elif source["type"] == "youtube" and metadata.get("video_id"):
+            extracted_text = await extract_youtube_transcript(metadata["video_id"])
+
         update_data = {"status": "ready"}
-        if guide_result.get("source_guide"):
-            update_data["source_guide"] = guide_result["source_guide"]
-        if guide_result.get("token_count"):
-            update_data["token_count"] = guide_result["token_count"]
+        if extracted_text:
+            guide_result = await generate_source_guide(extracted_text)
+            update_data["content"] = extracted_text[:100000]
+            if guide_result.get("source_guide"):
+                update_data["source_guide"] = guide_result["source_guide"]
+            if guide_result.get("token_count"):
+                update_data["token_count"] = guide_result["token_count"]
 
-        supabase.table("sources").update(update_data).eq("id", source["id"]).execute()
+        await execute_query(supabase.table("sources").update(update_data).eq("id", source["id"]))
 
     except Exception as e:
-        supabase.table("sources").update({
+        await execute_query(supabase.table("sources").update({
             "status": "ready",
-            "error_message": f"Summary generation failed: {str(e)[:200]}",
-        }).eq("id", source["id"]).execute()
+            "error_message": f"Processing failed: {str(e)[:200]}",
+        }).eq("id", source["id"]))
 
-    # Update notebook source count
-    try:
-        count_result = supabase.table("sources").select("id", count="exact").eq("notebook_id", str(notebook_id)).execute()
-        supabase.table("notebooks").update({
-            "source_count": count_result.count or 0
-        }).eq("id", str(notebook_id)).execute()
-    except Exception:
-        pass
+    invalidate_sources_content(source["notebook_id"])
 
-    result = supabase.table("sources").select("*").eq("id", source["id"]).single().execute()
 
-    return ApiResponse(data=result.data)
+async def ingest_sources(sources: List[dict]):
+    """Process a batch of newly inserted sources concurrently."""
+    await asyncio.gather(*(ingest_source(source) for source in sources))
+
+
+@router.post("/batch", response_model=ApiResponse)
+async def add_sources_batch(
+    notebook_id: UUID,
+    batch: BatchSourceCreate,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(get_current_user),
+):
+    """Add several text, URL and YouTube sources in one request.
+
+    Rows are inserted with a single statement and returned in the processing
+    state; content extraction and source guides run in the background.
+    """
+    await verify_notebook_access_only(notebook_id, user["id"])
+    supabase = get_supabase_client()
+
+    rows = []
+    for item in batch.sources:
+        if item.type == "text":
+            if not item.content:
+                raise HTTPException(status_code=400, detail="Text sources require content")
+            content = item.content[:100000]
+            metadata = {}
+            name = item.name or item.content[:100]
+        elif item.type in ("url", "youtube"):
+            if not item.url:
+                raise HTTPException(status_code=400, detail=f"{item.type.value} sources require a url")
+            content = None
+            metadata = {"url": item.url}
+            if item.type == "youtube":
+                metadata["video_id"] = parse_youtube_video_id(item.url)
+                name = item.name or f"YouTube: {metadata['video_id'] or item.url}"
+            else:
+                name = item.name or item.url[:100]
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported batch source type: {item.type.value}")
+
+        rows.append({
+            "notebook_id": str(notebook_id),
+            "type": item.type.value,
+            "name": name,
+            "status": "processing",
+            "content": content,
+            "metadata": metadata,
+        })
+
+    result = await execute_query(supabase.table("sources").insert(rows))
+
+    if not result.data:
+        raise HTTPException(status_code=400, detail="Failed to create sources")
+
+    # The background task needs the content; the response does not
+    background_tasks.add_task(ingest_sources, result.data)
+
+    return ApiResponse(data=[without_content(source) for source in result.data])
 
 
 @router.post("/{source_id}/reprocess", response_model=ApiResponse)
@@ -503,17 +978,16 @@ async def reprocess_source(
     user: dict = Depends(get_current_user),
 ):
     """Re-process an existing source to extract content and generate source guide."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
     # Get the source
-    source_result = (
+    source_result = await execute_query(
         supabase.table("sources")
         .select("*")
         .eq("id", str(source_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not source_result.data:
@@ -524,104 +998,104 @@ async def reprocess_source(
     metadata = source.get("metadata") or {}
 
     # Mark as processing
-    supabase.table("sources").update({"status": "processing"}).eq("id", str(source_id)).execute()
+    await execute_query(supabase.table("sources").update({"status": "processing"}).eq("id", str(source_id)))
 
     try:
         extracted_text = ""
 
         if source_type == "text":
-            extracted_text = metadata.get("content", "")
+            extracted_text = source.get("content") or ""
 
         elif source_type == "url":
             url = metadata.get("url", "")
             if url:
                 extracted_text = await extract_url_content(url)
-                if extracted_text:
-                    metadata["content"] = extracted_text[:100000]
 
         elif source_type == "youtube":
             video_id = metadata.get("video_id", "")
             if video_id:
                 extracted_text = await extract_youtube_transcript(video_id)
-                if extracted_text:
-                    metadata["content"] = extracted_text[:100000]
 
-        elif source_type == "pdf" and source.get("file_path"):
-            # Download from storage and extract
+        elif source_type in ("pdf", "docx", "txt") and source.get("file_path"):
+            # Stream from storage to disk and extract by path
+            tmp_path = None
             try:
-                file_data = supabase.storage.from_("sources").download(source["file_path"])
-                extracted_text = extract_pdf_text(file_data)
-                if extracted_text:
-                    metadata["content"] = extracted_text[:100000]
+                tmp_path = await download_to_temp(supabase, source["file_path"], f".{source_type}")
+                extracted_text = await extract_file_text(source_type, tmp_path)
             except Exception as e:
-                print(f"PDF download/extraction failed: {e}")
-
-        elif source_type == "docx" and source.get("file_path"):
-            try:
-                file_data = supabase.storage.from_("sources").download(source["file_path"])
-                extracted_text = extract_docx_text(file_data)
-                if extracted_text:
-                    metadata["content"] = extracted_text[:100000]
-            except Exception as e:
-                print(f"DOCX download/extraction failed: {e}")
-
-        elif source_type == "txt" and source.get("file_path"):
-            try:
-                file_data = supabase.storage.from_("sources").download(source["file_path"])
-                extracted_text = file_data.decode("utf-8", errors="ignore")
-                if extracted_text:
-                    metadata["content"] = extracted_text[:100000]
-            except Exception as e:
-                print(f"TXT download failed: {e}")
+                print(f"{source_type.upper()} download/extraction failed: {e}")
+            finally:
+                if tmp_path:
+                    os.unlink(tmp_path)
 
         # Generate source guide
         if extracted_text:
             guide_result = await generate_source_guide(extracted_text)
             update_data = {
                 "status": "ready",
-                "metadata": metadata,
+                "content": extracted_text[:100000],
             }
             if guide_result.get("source_guide"):
                 update_data["source_guide"] = guide_result["source_guide"]
             if guide_result.get("token_count"):
                 update_data["token_count"] = guide_result["token_count"]
 
-            supabase.table("sources").update(update_data).eq("id", str(source_id)).execute()
+            result = await execute_query(supabase.table("sources").update(update_data).eq("id", str(source_id)))
         else:
-            supabase.table("sources").update({
+            result = await execute_query(supabase.table("sources").update({
                 "status": "ready",
                 "error_message": "No content could be extracted",
-            }).eq("id", str(source_id)).execute()
+            }).eq("id", str(source_id)))
 
     except Exception as e:
-        supabase.table("sources").update({
+        result = await execute_query(supabase.table("sources").update({
             "status": "ready",
             "error_message": f"Reprocessing failed: {str(e)[:200]}",
-        }).eq("id", str(source_id)).execute()
+        }).eq("id", str(source_id)))
 
-    # Return refreshed source
-    result = supabase.table("sources").select("*").eq("id", str(source_id)).single().execute()
-    return ApiResponse(data=result.data)
+    invalidate_sources_content(notebook_id)
+
+    return ApiResponse(data=without_content(result.data[0]))
 
 
 @router.get("", response_model=ApiResponse)
 async def list_sources(
     notebook_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     user: dict = Depends(get_current_user),
 ):
-    """List all sources in a notebook."""
-    await verify_notebook_access(notebook_id, user["id"])
+    """List sources in a notebook, newest first.
+
+    Results are paginated; pass meta.next_cursor back as `cursor` to fetch the next page.
+    """
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
+    query = (
         supabase.table("sources")
-        .select("*")
+        .select(SOURCE_COLUMNS)
         .eq("notebook_id", str(notebook_id))
-        .order("created_at", desc=True)
-        .execute()
     )
 
-    return ApiResponse(data=result.data)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        # Keyset on (created_at, id): batch inserts share a created_at
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})'
+        )
+
+    result = await execute_query(
+        query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+    )
+
+    sources = result.data or []
+    next_cursor = None
+    if len(sources) > limit:
+        sources = sources[:limit]
+        next_cursor = encode_cursor(sources[-1]["created_at"], sources[-1]["id"])
+
+    return ApiResponse(data=sources, meta={"next_cursor": next_cursor})
 
 
 @router.get("/{source_id}", response_model=ApiResponse)
@@ -631,16 +1105,15 @@ async def get_source(
     user: dict = Depends(get_current_user),
 ):
     """Get a specific source."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
+    result = await execute_query(
         supabase.table("sources")
         .select("*")
         .eq("id", str(source_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not result.data:
@@ -656,39 +1129,29 @@ async def delete_source(
     user: dict = Depends(get_current_user),
 ):
     """Delete a source."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    # Get source first to check file path
-    source = (
-        supabase.table("sources")
-        .select("*")
-        .eq("id", str(source_id))
-        .eq("notebook_id", str(notebook_id))
-        .single()
-        .execute()
+    # Delete the record and check for other rows sharing its file in one call;
+    # the notebooks.source_count trigger runs in the same transaction
+    result = await execute_query(
+        supabase.rpc("delete_source_row", {"sid": str(source_id), "nb": str(notebook_id)})
     )
 
-    if not source.data:
+    if not result.data:
         raise HTTPException(status_code=404, detail="Source not found")
 
-    # Delete from storage if file exists
-    if source.data.get("file_path"):
-        try:
-            supabase.storage.from_("sources").remove([source.data["file_path"]])
-        except:
-            pass  # Ignore storage errors
-
-    # Delete record
-    supabase.table("sources").delete().eq("id", str(source_id)).execute()
+    invalidate_sources_content(notebook_id)
 
-    # Update notebook source count
-    try:
-        count_result = supabase.table("sources").select("id", count="exact").eq("notebook_id", str(notebook_id)).execute()
-        supabase.table("notebooks").update({
-            "source_count": count_result.count or 0
-        }).eq("id", str(notebook_id)).execute()
-    except Exception:
-        pass  # Non-critical
+    # Delete from storage if file exists and no other source shares the object.
+    # Objects live in the owner's folder, so only their own uploads can race this.
+    deleted = result.data[0]
+    file_path = deleted["path"]
+    if file_path and not deleted["shared"]:
+        try:
+            await run_sync(supabase.storage.from_("sources").remove, [file_path])
+        except Exception as e:
+            # The row is gone either way; an orphaned object only costs storage
+            print(f"Source file cleanup failed for {file_path}: {e}")
 
     return ApiResponse(data={"deleted": True, "id": str(source_id)})
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
-from uuid import UUID
-import json
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Optional
+from uuid import UUID, uuid4
+import orjson
 
 from app.models.schemas import (
     DataTableCreate,
@@ -12,65 +14,35 @@ from app.models.schemas import (
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, execute_query
+from app.services.notebook_access import verify_notebook_access_only, load_notebook_and_sources, parse_json_object
 from app.services.gemini import gemini_service
-from app.services.persona_utils import build_persona_instructions
+from app.services.generation_cache import cached_generate
+from app.services.json_stream import ArrayItemStream
 
 router = APIRouter(prefix="/notebooks/{notebook_id}/studio", tags=["studio"])
 
+# Columns returned by list responses; the generated content is only
+# returned by get_studio_output.
+STUDIO_OUTPUT_LIST_COLUMNS = (
+    "id, notebook_id, type, status, title, custom_instructions, source_ids, file_path, "
+    "thumbnail_path, model_used, cost_usd, error_message, created_at, updated_at, completed_at"
+)
 
-async def verify_notebook_access(notebook_id: UUID, user_id: str):
-    """Verify user has access to the notebook and return notebook data with settings."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("notebooks")
-        .select("id, settings")
-        .eq("id", str(notebook_id))
-        .eq("user_id", user_id)
-        .single()
-        .execute()
-    )
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Notebook not found")
-    return result.data
 
+async def save_studio_output(output: dict, fields: dict):
+    """Write a studio output row with its final status in a single round trip.
 
-async def get_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]] = None):
-    """Get content from sources."""
+    Completed outputs are saved by a background task once the response is
+    sent, so the client gets the content without waiting on the write and
+    the returned id can 404 until the row lands. By then there is no caller
+    to report to, so a failed write is logged rather than raised.
+    """
     supabase = get_supabase_client()
-
-    query = supabase.table("sources").select("*").eq("notebook_id", str(notebook_id)).in_("status", ["ready", "completed"])
-
-    if source_ids:
-        query = query.in_("id", [str(sid) for sid in source_ids])
-
-    result = query.execute()
-    sources = result.data or []
-
-    content_parts = []
-    for source in sources:
-        source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
-
-        if source["type"] == "text" and metadata.get("content"):
-            content_parts.append(metadata["content"])
-        elif source_guide.get("summary"):
-            content_parts.append(source_guide["summary"])
-
-    return "\n\n".join(content_parts), sources
-
-
-def parse_json_response(text: str) -> dict:
-    """Parse JSON from Gemini response, handling markdown code blocks."""
-    if "```json" in text:
-        text = text.split("```json")[1].split("```")[0]
-    elif "```" in text:
-        text = text.split("```")[1].split("```")[0]
-
     try:
-        return json.loads(text.strip())
-    except json.JSONDecodeError:
-        return {"error": "Failed to parse response", "raw": text}
+        await execute_query(supabase.table("studio_outputs").upsert({**output, **fields}))
+    except Exception as e:
+        print(f"Saving studio output {output['id']} failed: {e}")
 
 
 @router.get("/outputs", response_model=ApiResponse)
@@ -80,15 +52,15 @@ async def list_studio_outputs(
     user: dict = Depends(get_current_user),
 ):
     """List all studio outputs for a notebook."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
 
     supabase = get_supabase_client()
-    query = supabase.table("studio_outputs").select("*").eq("notebook_id", str(notebook_id))
+    query = supabase.table("studio_outputs").select(STUDIO_OUTPUT_LIST_COLUMNS).eq("notebook_id", str(notebook_id))
 
     if type:
         query = query.eq("type", type)
 
-    result = query.order("created_at", desc=True).execute()
+    result = await execute_query(query.order("created_at", desc=True))
 
     return ApiResponse(data={"outputs": result.data or []})
 
@@ -99,17 +71,20 @@ async def get_studio_output(
     output_id: UUID,
     user: dict = Depends(get_current_user),
 ):
-    """Get a specific studio output."""
-    await verify_notebook_access(notebook_id, user["id"])
+    """Get a specific studio output.
+
+    Generated outputs are saved just after their response, so a new id can
+    briefly return 404.
+    """
+    await verify_notebook_access_only(notebook_id, user["id"])
 
     supabase = get_supabase_client()
-    result = (
+    result = await execute_query(
         supabase.table("studio_outputs")
         .select("*")
         .eq("id", str(output_id))
         .eq("notebook_id", str(notebook_id))
         .single()
-        .execute()
     )
 
     if not result.data:
@@ -125,15 +100,14 @@ async def delete_studio_output(
     user: dict = Depends(get_current_user),
 ):
     """Delete a studio output."""
-    await verify_notebook_access(notebook_id, user["id"])
+    await verify_notebook_access_only(notebook_id, user["id"])
 
     supabase = get_supabase_client()
-    result = (
+    await execute_query(
         supabase.table("studio_outputs")
         .delete()
         .eq("id", str(output_id))
         .eq("notebook_id", str(notebook_id))
-        .execute()
     )
 
     return {"success": True}
@@ -143,63 +117,57 @@ async def delete_studio_output(
 async def generate_data_table(
     notebook_id: UUID,
     request: DataTableCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
     """Generate a data table from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
-
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    # Create pending record
-    supabase = get_supabase_client()
-    source_id_list = [str(s["id"]) for s in sources]
-
-    insert_result = supabase.table("studio_outputs").insert({
+    # The row is written once, in its final state, after generation
+    output = {
+        "id": str(uuid4()),
         "notebook_id": str(notebook_id),
         "type": "data_table",
-        "status": "processing",
-        "source_ids": source_id_list,
+        "source_ids": [str(s["id"]) for s in sources],
         "custom_instructions": request.custom_instructions,
-    }).execute()
-
-    output_id = insert_result.data[0]["id"]
+    }
 
     try:
-        result = await gemini_service.generate_data_table(
-            content=content[:50000],
+        result = await cached_generate(
+            gemini_service.generate_data_table,
+            regenerate=request.regenerate,
+            expect=dict,
+            content=content,
             custom_instructions=request.custom_instructions,
             model_name=request.model,
             persona_instructions=persona_instructions,
         )
 
-        table_data = parse_json_response(result["content"])
+        table_data = parse_json_object(result["content"])
 
-        # Update record with results
-        supabase.table("studio_outputs").update({
+        background_tasks.add_task(save_studio_output, output, {
             "status": "completed",
             "title": table_data.get("title", "Data Table"),
             "content": table_data,
             "model_used": result["usage"].get("model_used"),
             "cost_usd": result["usage"].get("cost_usd"),
             "completed_at": "now()",
-        }).eq("id", output_id).execute()
+        })
 
         return ApiResponse(
-            data={"id": output_id, "content": table_data},
+            data={"id": output["id"], "content": table_data},
             usage=result["usage"],
         )
     except Exception as e:
-        supabase.table("studio_outputs").update({
+        await save_studio_output(output, {
             "status": "failed",
             "error_message": str(e),
-        }).eq("id", output_id).execute()
+        })
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -207,61 +175,57 @@ async def generate_data_table(
 async def generate_report(
     notebook_id: UUID,
     request: ReportCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
     """Generate a briefing document/report from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
-
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    supabase = get_supabase_client()
-    source_id_list = [str(s["id"]) for s in sources]
-
-    insert_result = supabase.table("studio_outputs").insert({
+    # The row is written once, in its final state, after generation
+    output = {
+        "id": str(uuid4()),
         "notebook_id": str(notebook_id),
         "type": "report",
-        "status": "processing",
-        "source_ids": source_id_list,
+        "source_ids": [str(s["id"]) for s in sources],
         "custom_instructions": request.custom_instructions,
-    }).execute()
-
-    output_id = insert_result.data[0]["id"]
+    }
 
     try:
-        result = await gemini_service.generate_report(
-            content=content[:50000],
+        result = await cached_generate(
+            gemini_service.generate_report,
+            regenerate=request.regenerate,
+            expect=dict,
+            content=content,
             custom_instructions=request.custom_instructions,
             model_name=request.model,
             persona_instructions=persona_instructions,
         )
 
-        report_data = parse_json_response(result["content"])
+        report_data = parse_json_object(result["content"])
 
-        supabase.table("studio_outputs").update({
+        background_tasks.add_task(save_studio_output, output, {
             "status": "completed",
             "title": report_data.get("title", "Briefing Document"),
             "content": report_data,
             "model_used": result["usage"].get("model_used"),
             "cost_usd": result["usage"].get("cost_usd"),
             "completed_at": "now()",
-        }).eq("id", output_id).execute()
+        })
 
         return ApiResponse(
-            data={"id": output_id, "content": report_data},
+            data={"id": output["id"], "content": report_data},
             usage=result["usage"],
         )
     except Exception as e:
-        supabase.table("studio_outputs").update({
+        await save_studio_output(output, {
             "status": "failed",
             "error_message": str(e),
-        }).eq("id", output_id).execute()
+        })
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -269,127 +233,192 @@ async def generate_report(
 async def generate_slide_deck(
     notebook_id: UUID,
     request: SlideDeckCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
     """Generate a slide deck from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
-
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    supabase = get_supabase_client()
-    source_id_list = [str(s["id"]) for s in sources]
-
-    insert_result = supabase.table("studio_outputs").insert({
+    # The row is written once, in its final state, after generation
+    output = {
+        "id": str(uuid4()),
         "notebook_id": str(notebook_id),
         "type": "slide_deck",
-        "status": "processing",
-        "source_ids": source_id_list,
+        "source_ids": [str(s["id"]) for s in sources],
         "custom_instructions": request.custom_instructions,
-    }).execute()
-
-    output_id = insert_result.data[0]["id"]
+    }
 
     try:
-        result = await gemini_service.generate_slide_deck(
-            content=content[:50000],
+        result = await cached_generate(
+            gemini_service.generate_slide_deck,
+            regenerate=request.regenerate,
+            expect=dict,
+            content=content,
             slide_count=request.slide_count,
             custom_instructions=request.custom_instructions,
             model_name=request.model,
             persona_instructions=persona_instructions,
         )
 
-        slides_data = parse_json_response(result["content"])
+        slides_data = parse_json_object(result["content"])
 
-        supabase.table("studio_outputs").update({
+        background_tasks.add_task(save_studio_output, output, {
             "status": "completed",
             "title": slides_data.get("title", "Presentation"),
             "content": slides_data,
             "model_used": result["usage"].get("model_used"),
             "cost_usd": result["usage"].get("cost_usd"),
             "completed_at": "now()",
-        }).eq("id", output_id).execute()
+        })
 
         return ApiResponse(
-            data={"id": output_id, "content": slides_data},
+            data={"id": output["id"], "content": slides_data},
             usage=result["usage"],
         )
     except Exception as e:
-        supabase.table("studio_outputs").update({
+        await save_studio_output(output, {
             "status": "failed",
             "error_message": str(e),
-        }).eq("id", output_id).execute()
+        })
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/slide-deck/stream")
+async def stream_slide_deck(
+    notebook_id: UUID,
+    request: SlideDeckCreate,
+    user: dict = Depends(get_current_user),
+):
+    """Generate a slide deck, streaming each slide as NDJSON as soon as it is complete.
+
+    Emits {"type": "slide"} lines, then a final {"type": "done"} line with the
+    full deck (or {"type": "error"}). The output row is saved after the
+    stream closes.
+    """
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
+
+    persona_instructions = notebook["persona_instructions"]
+
+    if not content:
+        raise HTTPException(status_code=400, detail="No source content available")
+
+    output = {
+        "id": str(uuid4()),
+        "notebook_id": str(notebook_id),
+        "type": "slide_deck",
+        "source_ids": [str(s["id"]) for s in sources],
+        "custom_instructions": request.custom_instructions,
+    }
+    # Filled in by the stream; written by the background task once it closes
+    final_fields: dict = {}
+
+    async def events():
+        parser = ArrayItemStream("slides")
+        usage = {}
+        try:
+            async for event in gemini_service.generate_slide_deck_stream(
+                content=content,
+                slide_count=request.slide_count,
+                custom_instructions=request.custom_instructions,
+                model_name=request.model,
+                persona_instructions=persona_instructions,
+            ):
+                if event["type"] == "usage":
+                    usage = event["usage"]
+                    continue
+                for slide in parser.feed(event["text"]):
+                    yield orjson.dumps({"type": "slide", "slide": slide}) + b"\n"
+
+            slides_data = parse_json_object(parser.text)
+        except Exception as e:
+            final_fields.update({"status": "failed", "error_message": str(e)})
+            yield orjson.dumps({"type": "error", "detail": str(e)}) + b"\n"
+            return
+
+        final_fields.update({
+            "status": "completed",
+            "title": slides_data.get("title", "Presentation"),
+            "content": slides_data,
+            "model_used": usage.get("model_used"),
+            "cost_usd": usage.get("cost_usd"),
+            "completed_at": "now()",
+        })
+        yield orjson.dumps({"type": "done", "id": output["id"], "content": slides_data, "usage": usage}) + b"\n"
+
+    async def persist():
+        if final_fields:
+            await save_studio_output(output, final_fields)
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(persist),
+    )
+
+
 @router.post("/infographic", response_model=ApiResponse)
 async def generate_infographic(
     notebook_id: UUID,
     request: InfographicCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
     """Generate an infographic from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
-
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    supabase = get_supabase_client()
-    source_id_list = [str(s["id"]) for s in sources]
-
-    insert_result = supabase.table("studio_outputs").insert({
+    # The row is written once, in its final state, after generation
+    output = {
+        "id": str(uuid4()),
         "notebook_id": str(notebook_id),
         "type": "infographic",
-        "status": "processing",
-        "source_ids": source_id_list,
+        "source_ids": [str(s["id"]) for s in sources],
         "custom_instructions": request.custom_instructions,
-    }).execute()
-
-    output_id = insert_result.data[0]["id"]
+    }
 
     try:
         # First, generate the infographic content plan
-        result = await gemini_service.generate_infographic_plan(
-            content=content[:50000],
+        result = await cached_generate(
+            gemini_service.generate_infographic_plan,
+            regenerate=request.regenerate,
+            expect=dict,
+            content=content,
             style=request.style,
             custom_instructions=request.custom_instructions,
             model_name=request.model,
             persona_instructions=persona_instructions,
         )
 
-        infographic_data = parse_json_response(result["content"])
+        infographic_data = parse_json_object(result["content"])
 
         # TODO: Generate actual image using Nano Banana API
         # For now, we store the plan and image prompt
 
-        supabase.table("studio_outputs").update({
+        background_tasks.add_task(save_studio_output, output, {
             "status": "completed",
             "title": infographic_data.get("title", "Infographic"),
             "content": infographic_data,
             "model_used": result["usage"].get("model_used"),
             "cost_usd": result["usage"].get("cost_usd"),
             "completed_at": "now()",
-        }).eq("id", output_id).execute()
+        })
 
         return ApiResponse(
-            data={"id": output_id, "content": infographic_data},
+            data={"id": output["id"], "content": infographic_data},
             usage=result["usage"],
         )
     except Exception as e:
-        supabase.table("studio_outputs").update({
+        await save_studio_output(output, {
             "status": "failed",
             "error_message": str(e),
-        }).eq("id", output_id).execute()
+        })
         raise HTTPException(status_code=500, detail=str(e))
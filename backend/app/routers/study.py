@@ -1,7 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
 from uuid import UUID
-import json
 
 from app.models.schemas import (
     FlashcardCreate,
@@ -12,71 +10,17 @@ from app.models.schemas import (
     StudyGuideResponse,
     FAQCreate,
     FAQResponse,
+    StudyBundleCreate,
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
+from app.services.notebook_access import load_notebook_and_sources, parse_json_response
 from app.services.gemini import gemini_service
-from app.services.persona_utils import build_persona_instructions
+from app.services.generation_cache import cached_generate
 
 router = APIRouter(prefix="/notebooks/{notebook_id}", tags=["study"])
 
 
-async def verify_notebook_access(notebook_id: UUID, user_id: str):
-    """Verify user has access to the notebook and return notebook data with settings."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("notebooks")
-        .select("id, settings")
-        .eq("id", str(notebook_id))
-        .eq("user_id", user_id)
-        .single()
-        .execute()
-    )
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Notebook not found")
-    return result.data
-
-
-async def get_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]] = None):
-    """Get content from sources."""
-    supabase = get_supabase_client()
-
-    query = supabase.table("sources").select("*").eq("notebook_id", str(notebook_id)).in_("status", ["ready", "completed"])
-
-    if source_ids:
-        query = query.in_("id", [str(sid) for sid in source_ids])
-
-    result = query.execute()
-    sources = result.data or []
-
-    content_parts = []
-    for source in sources:
-        source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
-
-        if source["type"] == "text" and metadata.get("content"):
-            content_parts.append(metadata["content"])
-        elif source_guide.get("summary"):
-            content_parts.append(source_guide["summary"])
-
-    return "\n\n".join(content_parts), sources
-
-
-def parse_json_response(text: str) -> dict:
-    """Parse JSON from Gemini response, handling markdown code blocks."""
-    # Remove markdown code blocks if present
-    if "```json" in text:
-        text = text.split("```json")[1].split("```")[0]
-    elif "```" in text:
-        text = text.split("```")[1].split("```")[0]
-
-    try:
-        return json.loads(text.strip())
-    except json.JSONDecodeError:
-        return {"error": "Failed to parse response", "raw": text}
-
-
 @router.post("/flashcards", response_model=ApiResponse)
 async def generate_flashcards(
     notebook_id: UUID,
@@ -84,19 +28,18 @@ async def generate_flashcards(
     user: dict = Depends(get_current_user),
 ):
     """Generate flashcards from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
-
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    result = await gemini_service.generate_flashcards(
-        content=content[:50000],
+    result = await cached_generate(
+        gemini_service.generate_flashcards,
+        regenerate=request.regenerate,
+        expect=list,
+        content=content,
         count=request.count,
         model_name=request.model,
         persona_instructions=persona_instructions,
@@ -117,19 +60,18 @@ async def generate_quiz(
     user: dict = Depends(get_current_user),
 ):
     """Generate a quiz from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
-
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    result = await gemini_service.generate_quiz(
-        content=content[:50000],
+    result = await cached_generate(
+        gemini_service.generate_quiz,
+        regenerate=request.regenerate,
+        expect=list,
+        content=content,
         question_count=request.question_count,
         model_name=request.model,
         persona_instructions=persona_instructions,
@@ -150,19 +92,18 @@ async def generate_study_guide(
     user: dict = Depends(get_current_user),
 ):
     """Generate a study guide from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
-
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    result = await gemini_service.generate_study_guide(
-        content=content[:50000],
+    result = await cached_generate(
+        gemini_service.generate_study_guide,
+        regenerate=request.regenerate,
+        expect=dict,
+        content=content,
         model_name=request.model,
         persona_instructions=persona_instructions,
     )
@@ -182,19 +123,18 @@ async def generate_faq(
     user: dict = Depends(get_current_user),
 ):
     """Generate FAQ from notebook sources."""
-    notebook = await verify_notebook_access(notebook_id, user["id"])
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
 
-    # Get persona instructions from notebook settings
-    settings = notebook.get("settings") or {}
-    persona_instructions = build_persona_instructions(settings)
-
-    content, sources = await get_sources_content(notebook_id, request.source_ids)
+    persona_instructions = notebook["persona_instructions"]
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    result = await gemini_service.generate_faq(
-        content=content[:50000],
+    result = await cached_generate(
+        gemini_service.generate_faq,
+        regenerate=request.regenerate,
+        expect=list,
+        content=content,
         count=request.count,
         model_name=request.model,
         persona_instructions=persona_instructions,
@@ -206,3 +146,42 @@ async def generate_faq(
         data={"faqs": faqs if isinstance(faqs, list) else []},
         usage=result["usage"],
     )
+
+
+@router.post("/study-bundle", response_model=ApiResponse)
+async def generate_study_bundle(
+    notebook_id: UUID,
+    request: StudyBundleCreate,
+    user: dict = Depends(get_current_user),
+):
+    """Generate several study materials from notebook sources concurrently.
+
+    Each kind's result is keyed by kind; a kind that fails returns
+    {"error": ...} without failing the others.
+    """
+    notebook, content, sources = await load_notebook_and_sources(notebook_id, user["id"], request.source_ids)
+
+    persona_instructions = notebook["persona_instructions"]
+
+    if not content:
+        raise HTTPException(status_code=400, detail="No source content available")
+
+    kinds = list(dict.fromkeys(kind.value for kind in request.kinds))
+    results = await gemini_service.generate_bundle(
+        content,
+        kinds,
+        model_name=request.model,
+        persona_instructions=persona_instructions,
+    )
+
+    data = {}
+    usage = {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "model_used": request.model}
+    for kind, result in results.items():
+        if "error" in result:
+            data[kind] = result
+            continue
+        data[kind] = parse_json_response(result["content"])
+        for field in ("input_tokens", "output_tokens", "cost_usd"):
+            usage[field] += result["usage"][field]
+
+    return ApiResponse(data=data, usage=usage)
@@ -1,88 +1,108 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from uuid import UUID
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import asyncio
+import time
 
 from app.models.schemas import (
     VideoCreate,
     ApiResponse,
 )
 from app.services.auth import get_current_user
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, execute_query, run_sync
+from app.services.notebook_access import load_notebook_and_sources
 from app.services.gemini import gemini_service
+from app.services.generation_cache import cached_generate
 from app.services.atlascloud_video import atlascloud_video_service
 
 router = APIRouter(prefix="/notebooks/{notebook_id}/video", tags=["video"])
 
+# Columns returned by list_videos (status and playback fields only)
+VIDEO_LIST_COLUMNS = (
+    "id, notebook_id, style, status, progress_percent, video_file_path, thumbnail_path, "
+    "duration_seconds, error_message, created_at, completed_at"
+)
 
-async def verify_notebook_access(notebook_id: UUID, user_id: str):
-    """Verify user has access to the notebook."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("notebooks")
-        .select("id")
-        .eq("id", str(notebook_id))
-        .eq("user_id", user_id)
-        .single()
-        .execute()
-    )
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Notebook not found")
-    return result.data
+# Columns returned by get_video, including the script and cost details
+VIDEO_COLUMNS = f"{VIDEO_LIST_COLUMNS}, source_ids, script, model_used, cost_usd"
 
 
-async def get_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]] = None):
-    """Get content from sources."""
-    supabase = get_supabase_client()
+def owned_videos(supabase, columns: str, notebook_id: UUID, user_id: str):
+    """Query a notebook's videos, filtered to notebooks the user owns.
 
-    query = supabase.table("sources").select("*").eq("notebook_id", str(notebook_id)).in_("status", ["ready", "completed"])
-
-    if source_ids:
-        query = query.in_("id", [str(sid) for sid in source_ids])
+    The inner join on notebooks does the ownership check in the same round
+    trip as the read, so no separate access query is needed.
+    """
+    return (
+        supabase.table("video_overviews")
+        .select(f"{columns}, notebooks!inner(user_id)")
+        .eq("notebook_id", str(notebook_id))
+        .eq("notebooks.user_id", user_id)
+    )
 
-    result = query.execute()
-    sources = result.data or []
 
-    content_parts = []
-    for source in sources:
-        source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
+def without_owner(row: dict) -> dict:
+    """Drop the embedded notebooks join from a video row."""
+    row.pop("notebooks", None)
+    return row
 
-        if source["type"] == "text" and metadata.get("content"):
-            content_parts.append(metadata["content"])
-        elif source_guide.get("summary"):
-            content_parts.append(source_guide["summary"])
 
-    return "\n\n".join(content_parts), sources
+@dataclass(frozen=True, slots=True)
+class Style:
+    """Settings for one video generation style."""
+    name: str
+    description: str
+    duration: int  # seconds for Wan 2.5
+    prompt_style: str
+    negative_prompt: str
 
 
 # Style settings for video generation
-STYLE_SETTINGS = {
-    "documentary": {
-        "name": "Documentary",
-        "description": "Cinematic documentary style with narration",
-        "duration": 10,  # seconds for Wan 2.5
-        "prompt_style": "cinematic documentary footage, professional cinematography, dramatic lighting, smooth camera movements, 4K quality",
-        "negative_prompt": "text, watermark, logo, low quality, blurry, distorted",
-    },
-    "explainer": {
-        "name": "Explainer",
-        "description": "Educational explainer with graphics",
-        "duration": 5,
-        "prompt_style": "educational visualization, clean modern graphics, infographic style, smooth animations, professional presentation",
-        "negative_prompt": "text, watermark, logo, cluttered, messy, low quality",
-    },
-    "presentation": {
-        "name": "Presentation",
-        "description": "Business presentation style",
-        "duration": 5,
-        "prompt_style": "professional business presentation, clean corporate aesthetic, modern office environment, polished visuals",
-        "negative_prompt": "text, watermark, logo, unprofessional, casual, low quality",
-    },
+STYLES = {
+    "documentary": Style(
+        name="Documentary",
+        description="Cinematic documentary style with narration",
+        duration=10,
+        prompt_style="cinematic documentary footage, professional cinematography, dramatic lighting, smooth camera movements, 4K quality",
+        negative_prompt="text, watermark, logo, low quality, blurry, distorted",
+    ),
+    "explainer": Style(
+        name="Explainer",
+        description="Educational explainer with graphics",
+        duration=5,
+        prompt_style="educational visualization, clean modern graphics, infographic style, smooth animations, professional presentation",
+        negative_prompt="text, watermark, logo, cluttered, messy, low quality",
+    ),
+    "presentation": Style(
+        name="Presentation",
+        description="Business presentation style",
+        duration=5,
+        prompt_style="professional business presentation, clean corporate aesthetic, modern office environment, polished visuals",
+        negative_prompt="text, watermark, logo, unprofessional, casual, low quality",
+    ),
 }
 
+# Used for unknown style names
+DEFAULT_STYLE = STYLES["explainer"]
+
 # Cost per second for Wan 2.5
 VIDEO_COST_PER_SECOND = 0.02
 
+# Minimum seconds between progress writes while a video is generating
+PROGRESS_WRITE_INTERVAL = 2.0
+
+# Gemini prompt for turning source content into a video prompt. The content
+# leads so requests for the same sources share a prefix for implicit caching.
+VIDEO_PROMPT_TEMPLATE = """Content:
+{content}
+
+Based on the content above, create a single concise video generation prompt (2-3 sentences max) that describes a compelling visual scene to represent the main theme or concept.
+
+The video should be {style_name} style: {style_prompt}.
+
+Generate ONLY the video prompt, nothing else. Make it vivid and visually descriptive."""
+
 
 @router.post("/estimate", response_model=ApiResponse)
 async def estimate_video_cost(
@@ -90,11 +110,13 @@ async def estimate_video_cost(
     video: VideoCreate,
     user: dict = Depends(get_current_user),
 ):
-    """Get cost estimate for video generation."""
-    await verify_notebook_access(notebook_id, user["id"])
+    """Get cost estimate for video generation.
 
-    style_settings = STYLE_SETTINGS.get(video.style, STYLE_SETTINGS["explainer"])
-    duration = style_settings["duration"]
+    The estimate depends only on the requested style, so it needs
+    authentication but no notebook lookup.
+    """
+    style = STYLES.get(video.style, DEFAULT_STYLE)
+    duration = style.duration
 
     # Wan 2.5 costs approximately $0.02 per second + Gemini prompt generation
     video_cost = duration * VIDEO_COST_PER_SECOND
@@ -105,92 +127,110 @@ async def estimate_video_cost(
         "estimated_duration_seconds": duration,
         "estimated_cost_usd": round(estimated_cost, 2),
         "style": video.style,
-        "style_name": style_settings["name"],
+        "style_name": style.name,
         "model": "alibaba/wan-2.5/text-to-video-fast",
     }
 
     return ApiResponse(data=estimate)
 
 
-@router.post("", response_model=ApiResponse)
+@router.post("", response_model=ApiResponse, status_code=202)
 async def create_video(
     notebook_id: UUID,
     video: VideoCreate,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
 ):
     """Start video overview generation using AtlasCloud Wan 2.5."""
-    await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    # Get source content
-    content, sources = await get_sources_content(notebook_id, video.source_ids)
+    _, content, sources = await load_notebook_and_sources(
+        notebook_id, user["id"], video.source_ids, max_chars=10000, with_settings=False
+    )
 
     if not content:
         raise HTTPException(status_code=400, detail="No source content available")
 
-    style_settings = STYLE_SETTINGS.get(video.style, STYLE_SETTINGS["explainer"])
-    duration = style_settings["duration"]
+    style = STYLES.get(video.style, DEFAULT_STYLE)
 
-    # Create video record
+    # Create video record, already in the processing state
     video_data = {
         "notebook_id": str(notebook_id),
         "style": video.style,
-        "status": "pending",
-        "progress_percent": 0,
+        "status": "processing",
+        "progress_percent": 5,
         "source_ids": [str(s["id"]) for s in sources],
     }
 
-    result = supabase.table("video_overviews").insert(video_data).execute()
+    result = await execute_query(supabase.table("video_overviews").insert(video_data))
 
     if not result.data:
         raise HTTPException(status_code=400, detail="Failed to create video job")
 
-    video_id = result.data[0]["id"]
-    total_cost = 0.0
+    video_row = result.data[0]
 
-    try:
-        # Update status to processing
-        supabase.table("video_overviews").update({
-            "status": "processing",
-            "progress_percent": 5,
-        }).eq("id", video_id).execute()
+    # Prompt and video generation take tens of seconds; run them after the
+    # response so the client polls the row for progress
+    background_tasks.add_task(run_video_job, video_row["id"], style, content)
 
-        # Step 1: Generate video prompt from content using Gemini (cheaper model)
-        prompt_gen_result = await gemini_service.generate_content(
-            prompt=f"""Based on the following content, create a single concise video generation prompt (2-3 sentences max) that describes a compelling visual scene to represent the main theme or concept.
+    return ApiResponse(data=video_row)
 
-The video should be {style_settings['name'].lower()} style: {style_settings['prompt_style']}.
 
-Content:
-{content[:10000]}
+async def run_video_job(video_id: str, style: Style, content: str):
+    """Generate the prompt and video for a processing row and record the result."""
+    supabase = get_supabase_client()
+    duration = style.duration
+    total_cost = 0.0
+    final_update = {}
 
-Generate ONLY the video prompt, nothing else. Make it vivid and visually descriptive.""",
+    try:
+        # Step 1: Generate video prompt from content using Gemini (cheaper model);
+        # identical requests reuse the cached result
+        prompt_gen_result = await cached_generate(
+            gemini_service.generate_content,
+            prompt=VIDEO_PROMPT_TEMPLATE.format(
+                content=content,
+                style_name=style.name.lower(),
+                style_prompt=style.prompt_style,
+            ),
             model_name="gemini-2.5-flash",
             temperature=0.7,
         )
 
         video_prompt = prompt_gen_result["content"].strip()
         total_cost += prompt_gen_result["usage"]["cost_usd"]
-
-        # Update with generated prompt
-        supabase.table("video_overviews").update({
-            "script": f"Video Prompt: {video_prompt}\n\nStyle: {style_settings['name']}\nDuration: {duration} seconds",
-            "progress_percent": 15,
-        }).eq("id", video_id).execute()
+        final_update["script"] = f"Video Prompt: {video_prompt}\n\nStyle: {style.name}\nDuration: {duration} seconds"
 
         # Step 2: Generate video using AtlasCloud Wan 2.5
+        last_progress_write = 0.0
+        last_ui_progress = None
+
         async def update_progress(progress):
+            nonlocal last_progress_write, last_ui_progress
             # Map the 0-90 progress from AtlasCloud to 15-95 for our UI
             ui_progress = 15 + int(progress * 0.8)
-            supabase.table("video_overviews").update({
-                "progress_percent": ui_progress,
-            }).eq("id", video_id).execute()
+
+            # AtlasCloud reports progress on every poll; skip unchanged values
+            # and write at most once per interval, the final update sets 100%
+            now = time.monotonic()
+            if ui_progress == last_ui_progress or now - last_progress_write < PROGRESS_WRITE_INTERVAL:
+                return
+            last_progress_write = now
+            last_ui_progress = ui_progress
+
+            # Progress is cosmetic; a failed write must not fail the job
+            try:
+                await execute_query(supabase.table("video_overviews").update({
+                    "progress_percent": ui_progress,
+                }).eq("id", video_id))
+            except Exception as e:
+                print(f"Video progress update failed for {video_id}: {e}")
 
         video_result = await atlascloud_video_service.generate_and_wait(
             prompt=video_prompt,
             duration=duration,
             size="1280*720",
-            negative_prompt=style_settings.get("negative_prompt"),
+            negative_prompt=style.negative_prompt,
             enable_prompt_expansion=True,
             progress_callback=update_progress,
         )
@@ -198,28 +238,25 @@ Generate ONLY the video prompt, nothing else. Make it vivid and visually descrip
         video_url = video_result["video_url"]
         total_cost += video_result["cost_usd"]
 
-        # Update with completed video
-        supabase.table("video_overviews").update({
+        final_update.update({
             "status": "completed",
             "progress_percent": 100,
             "video_file_path": video_url,  # Store the AtlasCloud URL directly
             "duration_seconds": duration,
             "model_used": "alibaba/wan-2.5/text-to-video-fast",
             "cost_usd": total_cost,
-            "completed_at": "now()",
-        }).eq("id", video_id).execute()
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        })
 
     except Exception as e:
-        supabase.table("video_overviews").update({
+        final_update.update({
             "status": "failed",
             "error_message": str(e),
             "cost_usd": total_cost,
-        }).eq("id", video_id).execute()
+        })
 
-    # Get updated record
-    result = supabase.table("video_overviews").select("*").eq("id", video_id).single().execute()
-
-    return ApiResponse(data=result.data)
+    # One write for the script and final status
+    await execute_query(supabase.table("video_overviews").update(final_update).eq("id", video_id))
 
 
 @router.get("", response_model=ApiResponse)
@@ -228,18 +265,14 @@ async def list_videos(
     user: dict = Depends(get_current_user),
 ):
     """List all video overviews for a notebook."""
-    await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
-        supabase.table("video_overviews")
-        .select("*")
-        .eq("notebook_id", str(notebook_id))
+    result = await execute_query(
+        owned_videos(supabase, VIDEO_LIST_COLUMNS, notebook_id, user["id"])
         .order("created_at", desc=True)
-        .execute()
     )
 
-    return ApiResponse(data=result.data)
+    return ApiResponse(data=[without_owner(row) for row in result.data or []])
 
 
 @router.get("/{video_id}", response_model=ApiResponse)
@@ -249,22 +282,18 @@ async def get_video(
     user: dict = Depends(get_current_user),
 ):
     """Get video overview status."""
-    await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
-        supabase.table("video_overviews")
-        .select("*")
+    result = await execute_query(
+        owned_videos(supabase, VIDEO_COLUMNS, notebook_id, user["id"])
         .eq("id", str(video_id))
-        .eq("notebook_id", str(notebook_id))
-        .single()
-        .execute()
+        .maybe_single()
     )
 
-    if not result.data:
+    if not result or not result.data:
         raise HTTPException(status_code=404, detail="Video not found")
 
-    return ApiResponse(data=result.data)
+    return ApiResponse(data=without_owner(result.data))
 
 
 @router.get("/{video_id}/download", response_model=ApiResponse)
@@ -274,23 +303,20 @@ async def get_video_download(
     user: dict = Depends(get_current_user),
 ):
     """Get signed download URL for video file."""
-    await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    result = (
-        supabase.table("video_overviews")
-        .select("video_file_path")
+    result = await execute_query(
+        owned_videos(supabase, "video_file_path", notebook_id, user["id"])
         .eq("id", str(video_id))
-        .eq("notebook_id", str(notebook_id))
-        .single()
-        .execute()
+        .maybe_single()
     )
 
-    if not result.data or not result.data.get("video_file_path"):
+    if not result or not result.data or not result.data.get("video_file_path"):
         raise HTTPException(status_code=404, detail="Video file not found")
 
     # Generate signed URL
-    signed_url = supabase.storage.from_("video").create_signed_url(
+    signed_url = await run_sync(
+        supabase.storage.from_("video").create_signed_url,
         result.data["video_file_path"],
         3600,  # 1 hour expiry
     )
@@ -305,36 +331,32 @@ async def delete_video(
     user: dict = Depends(get_current_user),
 ):
     """Delete a video overview."""
-    await verify_notebook_access(notebook_id, user["id"])
     supabase = get_supabase_client()
 
-    # Get video first
-    video = (
-        supabase.table("video_overviews")
-        .select("*")
+    # Get video first (this also checks notebook ownership)
+    video = await execute_query(
+        owned_videos(supabase, "video_file_path, thumbnail_path", notebook_id, user["id"])
         .eq("id", str(video_id))
-        .eq("notebook_id", str(notebook_id))
-        .single()
-        .execute()
+        .maybe_single()
     )
 
-    if not video.data:
+    if not video or not video.data:
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # Delete from storage if exists
-    if video.data.get("video_file_path"):
-        try:
-            supabase.storage.from_("video").remove([video.data["video_file_path"]])
-        except:
-            pass
-
-    if video.data.get("thumbnail_path"):
-        try:
-            supabase.storage.from_("video").remove([video.data["thumbnail_path"]])
-        except:
-            pass
-
-    # Delete record
-    supabase.table("video_overviews").delete().eq("id", str(video_id)).execute()
+    # Delete the record and any stored files concurrently; the storage API
+    # removes several paths in one call
+    tasks = [execute_query(supabase.table("video_overviews").delete().eq("id", str(video_id)))]
+    paths = [path for path in (video.data.get("video_file_path"), video.data.get("thumbnail_path")) if path]
+    if paths:
+        tasks.append(run_sync(supabase.storage.from_("video").remove, paths))
+
+    # Storage errors are logged and don't fail the request; a failed record
+    # delete does
+    delete_result, *storage_results = await asyncio.gather(*tasks, return_exceptions=True)
+    if isinstance(delete_result, Exception):
+        raise delete_result
+    for storage_result in storage_results:
+        if isinstance(storage_result, Exception):
+            print(f"Failed to remove video files {paths}: {storage_result}")
 
     return ApiResponse(data={"deleted": True, "id": str(video_id)})
@@ -6,17 +6,56 @@ import hashlib
 import secrets
 from datetime import datetime, timezone
 from collections import defaultdict
+from functools import lru_cache
+import asyncio
 import time
 
+from cachetools import TTLCache
+
+try:
+    import redis.asyncio as redis_asyncio
+    from redis.exceptions import RedisError
+except ImportError:
+    redis_asyncio = None
+    RedisError = OSError
+
 from app.config import get_settings
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, execute_query
 
 settings = get_settings()
 security = HTTPBearer(auto_error=False)
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
-# Simple in-memory rate limiter (for production, use Redis)
-rate_limit_store: dict = defaultdict(lambda: {"minute": {}, "day": {}})
+# API keys are this prefix followed by 64 hex characters
+API_KEY_PREFIX = "nb_live_"
+API_KEY_LENGTH = len(API_KEY_PREFIX) + 64
+
+# In-memory rate limiter, used when Redis is not configured or unreachable.
+# Limits are then enforced per worker process.
+rate_limit_store: dict = defaultdict(lambda: {"minute": (None, 0), "day": (None, 0)})
+
+# Atomically checks both windows and only counts the request when it is
+# allowed. Returns 0 when allowed, 1 when over the minute limit, 2 when over
+# the day limit.
+RATE_LIMIT_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') >= tonumber(ARGV[1]) then return 1 end
+if tonumber(redis.call('GET', KEYS[2]) or '0') >= tonumber(ARGV[2]) then return 2 end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], 172800)
+return 0
+"""
+
+# API key rows by key_hash, so authenticated requests skip the lookup. Revoking
+# or editing a key evicts it here; other workers see the change within the TTL.
+_api_key_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# Requests per API key id since the last usage flush
+_usage_counts: dict = defaultdict(int)
+
+# Decoded JWT users by token, stored with the time they stop being valid
+_jwt_cache: TTLCache = TTLCache(maxsize=5000, ttl=60)
 
 
 def generate_api_key() -> Tuple[str, str, str]:
@@ -27,73 +66,148 @@ def generate_api_key() -> Tuple[str, str, str]:
     """
     # Generate 32 random bytes = 64 hex characters
     random_part = secrets.token_hex(32)
-    full_key = f"nb_live_{random_part}"
-    key_prefix = f"nb_live_{random_part[:8]}..."
-    key_hash = hashlib.sha256(full_key.encode()).hexdigest()
+    full_key = f"{API_KEY_PREFIX}{random_part}"
+    key_prefix = f"{API_KEY_PREFIX}{random_part[:8]}..."
+    key_hash = hash_api_key(full_key)
 
     return full_key, key_prefix, key_hash
 
 
 def hash_api_key(key: str) -> str:
-    """Hash an API key for comparison."""
-    return hashlib.sha256(key.encode()).hexdigest()
+    """Hash an API key for comparison (hex, as stored in api_keys.key_hash)."""
+    return hashlib.sha256(key.encode("ascii")).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def get_rate_limit_script():
+    """Rate limit script on the shared Redis client, or None when not configured.
 
+    The script is sent by hash (EVALSHA) after the first call.
+    """
+    if not settings.redis_url or redis_asyncio is None:
+        return None
+    return redis_asyncio.from_url(settings.redis_url).register_script(RATE_LIMIT_SCRIPT)
+
+
+def rate_limit_exceeded(limit: int, period: str, retry_after: int) -> HTTPException:
+    """Build the 429 response for an exhausted rate limit window."""
+    return HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded: {limit} requests per {period}",
+        headers={"Retry-After": str(retry_after)}
+    )
 
-def check_rate_limit(api_key_id: str, rpm_limit: int, rpd_limit: int) -> bool:
+
+async def check_rate_limit(api_key_id: str, rpm_limit: int, rpd_limit: int) -> bool:
     """Check if the API key is within rate limits.
 
+    Uses Redis when configured so limits are shared across workers.
     Returns True if allowed, raises HTTPException if rate limited.
     """
     now = time.time()
     minute_key = int(now // 60)
     day_key = int(now // 86400)
 
+    rate_limit_script = get_rate_limit_script()
+    if rate_limit_script is not None:
+        try:
+            result = await rate_limit_script(
+                keys=[f"rl:m:{api_key_id}:{minute_key}", f"rl:d:{api_key_id}:{day_key}"],
+                args=[rpm_limit, rpd_limit],
+            )
+        except (RedisError, OSError) as e:
+            # Redis down or timing out: enforce per-worker limits below rather
+            # than failing every API key request
+            print(f"Rate limit check failed, using in-memory limits: {e}")
+        else:
+            if result == 1:
+                raise rate_limit_exceeded(rpm_limit, "minute", 60 - int(now % 60))
+            if result == 2:
+                raise rate_limit_exceeded(rpd_limit, "day", 86400 - int(now % 86400))
+            return True
+
     store = rate_limit_store[api_key_id]
 
-    # Clean old entries
-    store["minute"] = {k: v for k, v in store["minute"].items() if k >= minute_key - 1}
-    store["day"] = {k: v for k, v in store["day"].items() if k >= day_key - 1}
+    # Each window holds (window_key, count); a new window starts from zero
+    stored_minute, minute_count = store["minute"]
+    if stored_minute != minute_key:
+        minute_count = 0
+    stored_day, day_count = store["day"]
+    if stored_day != day_key:
+        day_count = 0
 
     # Check minute limit
-    minute_count = store["minute"].get(minute_key, 0)
     if minute_count >= rpm_limit:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Rate limit exceeded: {rpm_limit} requests per minute",
-            headers={"Retry-After": str(60 - int(now % 60))}
-        )
+        raise rate_limit_exceeded(rpm_limit, "minute", 60 - int(now % 60))
 
     # Check day limit
-    day_count = store["day"].get(day_key, 0)
     if day_count >= rpd_limit:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Rate limit exceeded: {rpd_limit} requests per day",
-            headers={"Retry-After": str(86400 - int(now % 86400))}
-        )
+        raise rate_limit_exceeded(rpd_limit, "day", 86400 - int(now % 86400))
 
     # Increment counters
-    store["minute"][minute_key] = minute_count + 1
-    store["day"][day_key] = day_count + 1
+    store["minute"] = (minute_key, minute_count + 1)
+    store["day"] = (day_key, day_count + 1)
 
     return True
 
 
+def invalidate_api_key(api_key_id: str) -> None:
+    """Drop a cached API key row after it is updated, rotated or revoked."""
+    for key_hash, record in list(_api_key_cache.items()):
+        if record["id"] == api_key_id:
+            _api_key_cache.pop(key_hash, None)
+
+
+async def flush_api_key_usage() -> None:
+    """Write the request counts gathered since the last flush in one call."""
+    global _usage_counts
+    if not _usage_counts:
+        return
+
+    counts, _usage_counts = _usage_counts, defaultdict(int)
+    supabase = get_supabase_client()
+    try:
+        await execute_query(supabase.rpc("increment_api_key_usage", {
+            "key_ids": list(counts.keys()),
+            "counts": list(counts.values()),
+            "used_at": datetime.now(timezone.utc).isoformat(),
+        }))
+    except Exception as e:
+        # Keep the counts for the next flush rather than losing them
+        for key_id, count in counts.items():
+            _usage_counts[key_id] += count
+        print(f"API key usage flush failed: {e}")
+
+
+async def run_api_key_usage_flusher(interval: float) -> None:
+    """Flush API key usage every `interval` seconds until cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await flush_api_key_usage()
+    finally:
+        await flush_api_key_usage()
+
+
 async def validate_api_key(api_key: str, request: Request) -> Optional[dict]:
     """Validate an API key and return user info if valid."""
-    if not api_key or not api_key.startswith("nb_live_"):
+    # Reject malformed keys before hashing; non-ASCII keys can't be valid
+    if not api_key or len(api_key) != API_KEY_LENGTH or not api_key.startswith(API_KEY_PREFIX) or not api_key.isascii():
         return None
 
     supabase = get_supabase_client()
     key_hash = hash_api_key(api_key)
 
-    # Look up API key by hash
-    result = supabase.table("api_keys").select("*").eq("key_hash", key_hash).execute()
+    api_key_record = _api_key_cache.get(key_hash)
+    if api_key_record is None:
+        # Look up API key by hash
+        result = await execute_query(supabase.table("api_keys").select("*").eq("key_hash", key_hash))
 
-    if not result.data or len(result.data) == 0:
-        return None
+        if not result.data or len(result.data) == 0:
+            return None
 
-    api_key_record = result.data[0]
+        api_key_record = result.data[0]
+        _api_key_cache[key_hash] = api_key_record
 
     # Check if active
     if not api_key_record["is_active"]:
@@ -116,17 +230,15 @@ async def validate_api_key(api_key: str, request: Request) -> Optional[dict]:
             raise HTTPException(status_code=403, detail="IP address not allowed")
 
     # Check rate limits
-    check_rate_limit(
+    await check_rate_limit(
         api_key_record["id"],
         api_key_record["rate_limit_rpm"],
         api_key_record["rate_limit_rpd"]
     )
 
-    # Update last used and increment request count
-    supabase.table("api_keys").update({
-        "last_used_at": datetime.now(timezone.utc).isoformat(),
-        "total_requests": api_key_record["total_requests"] + 1
-    }).eq("id", api_key_record["id"]).execute()
+    # Count the request; last_used_at and total_requests are written in
+    # batches by flush_api_key_usage
+    _usage_counts[api_key_record["id"]] += 1
 
     # Store api_key_id in request state for usage logging
     request.state.api_key_id = api_key_record["id"]
@@ -143,6 +255,15 @@ async def validate_api_key(api_key: str, request: Request) -> Optional[dict]:
 
 async def validate_jwt(token: str) -> Optional[dict]:
     """Validate a JWT token and return user info."""
+    # Browsers reuse the same token for many requests; a cached entry is
+    # only served until the token's own exp
+    cached = _jwt_cache.get(token)
+    if cached is not None:
+        user, valid_until = cached
+        if time.time() < valid_until:
+            return user
+        _jwt_cache.pop(token, None)
+
     try:
         payload = jwt.decode(
             token,
@@ -160,7 +281,7 @@ async def validate_jwt(token: str) -> Optional[dict]:
         if not user_id:
             return None
 
-        return {
+        user = {
             "id": user_id,
             "email": email,
             "token": token,
@@ -168,6 +289,11 @@ async def validate_jwt(token: str) -> Optional[dict]:
             "api_key_scopes": ["*"],
             "auth_method": "jwt"
         }
+
+        exp = payload.get("exp")
+        _jwt_cache[token] = (user, exp if exp is not None else float("inf"))
+
+        return user
     except JWTError:
         return None
     except Exception:
@@ -0,0 +1,36 @@
+"""Process pool for CPU-bound work (document parsing) kept off the event loop."""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def start_cpu_pool(max_workers: int) -> None:
+    """Create the shared process pool (called on app startup)."""
+    global _pool
+    if _pool is None and max_workers > 0:
+        _pool = ProcessPoolExecutor(max_workers=max_workers)
+
+
+def shutdown_cpu_pool() -> None:
+    """Shut down the shared process pool (called on app shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args: Any) -> T:
+    """Run a picklable, module-level function in the process pool.
+
+    Falls back to a worker thread when no pool is running (e.g. serverless
+    deployments without a lifespan, or extraction_workers=0).
+    """
+    if _pool is None:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, fn, *args)
@@ -1,26 +1,45 @@
-import google.generativeai as genai
-from typing import Optional, List, Dict, Any
-import wave
-import io
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable
+from functools import lru_cache
+import asyncio
+import hashlib
+import re
+import struct
+from cachetools import LRUCache, TTLCache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 from app.config import get_settings
 
-# Try to import new SDK for TTS, fallback gracefully
-try:
-    from google import genai as genai_new
-    from google.genai import types as genai_types
-    NEW_SDK_AVAILABLE = True
-except ImportError:
-    NEW_SDK_AVAILABLE = False
-    genai_new = None
-    genai_types = None
-
 settings = get_settings()
-genai.configure(api_key=settings.google_api_key)
 
-# Initialize new genai client for TTS (if available)
-genai_client = None
-if NEW_SDK_AVAILABLE:
-    genai_client = genai_new.Client(api_key=settings.google_api_key)
+
+# The Gemini SDKs (grpc/protobuf for google.generativeai) are imported on
+# first use, so workers start fast and routes that never call Gemini don't
+# pay for them.
+@lru_cache(maxsize=1)
+def _genai():
+    """google.generativeai, configured with the API key."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=settings.google_api_key)
+    return genai
+
+
+@lru_cache(maxsize=1)
+def _genai_sdk():
+    """(client, types) from the new google-genai SDK used for TTS and context
+    caching, or (None, None) when it isn't installed."""
+    try:
+        from google import genai as genai_new
+        from google.genai import types as genai_types
+    except ImportError:
+        return None, None
+
+    # Concurrent calls (generate_bundle over one context cache) share a single
+    # multiplexed HTTP/2 connection instead of opening one each
+    try:
+        http_options = genai_types.HttpOptions(async_client_args={"http2": True})
+    except Exception:  # SDK releases without async_client_args
+        http_options = None
+    return genai_new.Client(api_key=settings.google_api_key, http_options=http_options), genai_types
 
 
 # Model pricing (per 1M tokens)
@@ -31,23 +50,307 @@ MODEL_PRICING = {
 }
 
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost in USD for a given model and token counts."""
-    pricing = MODEL_PRICING.get(model, MODEL_PRICING["gemini-2.5-flash"])
-    input_cost = (input_tokens / 1_000_000) * pricing["input"]
-    output_cost = (output_tokens / 1_000_000) * pricing["output"]
-    return round(input_cost + output_cost, 6)
+# Cached input tokens are billed at this fraction of the input price
+CACHED_INPUT_RATE = 0.25
+
+# MODEL_PRICING as integer micro-USD per 1M tokens: (input, cached input, output)
+_TOKEN_RATES = {
+    model: (
+        round(pricing["input"] * 1_000_000),
+        round(pricing["input"] * CACHED_INPUT_RATE * 1_000_000),
+        round(pricing["output"] * 1_000_000),
+    )
+    for model, pricing in MODEL_PRICING.items()
+}
+
+# Explicit context caching: content below the API minimum is sent inline.
+# Tokens are estimated at ~4 characters each.
+CONTEXT_CACHE_MIN_TOKENS = 2048
+CONTEXT_CACHE_TTL_SECONDS = 600
+
+# Context cache names by hash of model, system instruction and content.
+# Entries expire a minute before the server-side cache does.
+_context_caches: TTLCache = TTLCache(maxsize=256, ttl=CONTEXT_CACHE_TTL_SECONDS - 60)
+_context_caches_inflight: Dict[str, asyncio.Future] = {}
+
+# Content keys seen once without a cache. Creating a cache costs a call plus
+# storage, so it only pays off when the same content comes back (a second
+# generation or a follow-up question) within the cache TTL.
+_context_cache_candidates: TTLCache = TTLCache(maxsize=1024, ttl=CONTEXT_CACHE_TTL_SECONDS)
+
+# Input tokens allowed for a document: the 2.5 models take ~1M, leaving room
+# for the task, system instruction and output
+CONTENT_TOKEN_BUDGET = 900_000
+
+# Token counts of large documents by content digest, so repeated generations
+# over the same sources pay for count_tokens once
+_token_counts: LRUCache = LRUCache(maxsize=1024)
+
+# Speaker labels at the start of a script line, like "Alex:", "Host 1:", "Speaker:"
+SPEAKER_RE = re.compile(r"^([A-Za-z][A-Za-z0-9 ]{0,30}):\s", re.MULTILINE)
+
+# Statuses worth retrying: rate limits and transient server errors. Both SDKs'
+# exceptions (google.api_core and google.genai.errors) carry the HTTP status
+# as an int `code`.
+TRANSIENT_STATUS_CODES = frozenset({429, 500, 503, 504})
+GEMINI_MAX_ATTEMPTS = 5
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    return getattr(exc, "code", None) in TRANSIENT_STATUS_CODES
+
+
+@retry(
+    retry=retry_if_exception(is_transient_error),
+    stop=stop_after_attempt(GEMINI_MAX_ATTEMPTS),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True,
+)
+async def call_gemini(call: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Await a Gemini SDK call, retrying 429/5xx with jittered exponential backoff."""
+    return await call(*args, **kwargs)
+
+
+# Bounds Gemini calls made concurrently by generate_bundle
+_gemini_semaphore = asyncio.Semaphore(settings.gemini_max_concurrency)
+
+
+# Prompt templates, built once at import and filled with str.format_map
+# (templates without placeholders are used as-is). Task templates follow the
+# document, inline or from a context cache, so they hold no content.
+CONTEXT_QUESTION_TASK = """{source_context}
+
+User Question: {message}
+
+Provide a well-cited response:"""
+
+SUMMARY_TASK = """Analyze this content and provide:
+1. A concise summary (2-3 paragraphs)
+2. Key topics covered (list of 5-10 topics)
+3. 5 suggested questions someone might ask about this content
+
+Format your response as JSON:
+{
+    "summary": "...",
+    "topics": ["topic1", "topic2", ...],
+    "suggested_questions": ["question1", "question2", ...]
+}"""
+
+FLASHCARDS_TASK = """Create {count} educational flashcards from this content.
+Each flashcard should test understanding of key concepts.
+
+Format as JSON array:
+[
+    {{"question": "...", "answer": "..."}},
+    ...
+]"""
+
+QUIZ_TASK = """Create a {question_count}-question multiple choice quiz from this content.
+Each question should have 4 options with one correct answer.
+
+Format as JSON array:
+[
+    {{
+        "question": "...",
+        "options": ["A) ...", "B) ...", "C) ...", "D) ..."],
+        "correct_index": 0,
+        "explanation": "..."
+    }},
+    ...
+]"""
+
+STUDY_GUIDE_TASK = """Create a comprehensive study guide from this content.
+
+Format as JSON:
+{
+    "title": "...",
+    "summary": "...",
+    "key_concepts": [
+        {"term": "...", "definition": "...", "importance": "..."}
+    ],
+    "glossary": [
+        {"term": "...", "definition": "..."}
+    ],
+    "review_questions": ["...", "..."]
+}"""
+
+FAQ_TASK = """Generate {count} frequently asked questions and answers about this content.
+Focus on common questions a reader might have.
+
+Format as JSON array:
+[
+    {{"question": "...", "answer": "..."}},
+    ...
+]"""
+
+AUDIO_SCRIPT_TASK = """{format_instruction}{extra}
+
+Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for each line of dialogue.
+Make it natural, engaging, and educational."""
+
+VIDEO_SCRIPT_TASK = """{style_instruction}
+
+Format the script with:
+- [SCENE X: Description] for scene markers
+- [VISUAL: Description] for visual suggestions
+- [TEXT ON SCREEN: Content] for text overlays
+- Clear narration text
+
+Make it engaging and suitable for a 30-60 second video."""
+
+RESEARCH_REPORT_PROMPT = """Create a {depth_instruction} research report on the following topic:
+
+Topic: {query}
+
+Structure your report with:
+1. Executive Summary (2-3 paragraphs)
+2. Key Findings (numbered list)
+3. Analysis (main body with subsections)
+4. Methodology notes
+5. Conclusion and recommendations
+
+Use markdown formatting. Be factual and cite sources where applicable.
+Note: In production, this would use Deep Research API for real web search and analysis."""
+
+# Placeholder citations until research runs real web searches
+RESEARCH_CITATIONS = [
+    {"title": "Research Source 1", "url": "https://example.com/source1"},
+    {"title": "Research Source 2", "url": "https://example.com/source2"},
+]
+
+DATA_TABLE_TASK = """Extract and organize the key data from this content into a structured table.{extra}
+
+Format as JSON:
+{{
+    "title": "...",
+    "columns": ["Column 1", "Column 2", ...],
+    "rows": [
+        ["value1", "value2", ...],
+        ...
+    ],
+    "summary": "Brief description of what this table shows"
+}}"""
+
+REPORT_TASK = """Create a comprehensive briefing document/report from this content.{extra}
+
+Format as JSON:
+{{
+    "title": "...",
+    "executive_summary": "...",
+    "key_findings": ["...", "..."],
+    "sections": [
+        {{"heading": "...", "content": "..."}}
+    ],
+    "conclusion": "...",
+    "recommendations": ["...", "..."]
+}}"""
+
+SLIDE_DECK_TASK = """Create a {slide_count}-slide presentation from this content.{extra}
+
+Format as JSON:
+{{
+    "title": "...",
+    "subtitle": "...",
+    "slides": [
+        {{
+            "title": "...",
+            "bullet_points": ["...", "..."],
+            "speaker_notes": "..."
+        }}
+    ]
+}}"""
+
+INFOGRAPHIC_TASK = """Create an infographic content plan in a {style} style from this content.{extra}
+
+Format as JSON:
+{{
+    "title": "...",
+    "subtitle": "...",
+    "sections": [
+        {{
+            "heading": "...",
+            "icon_suggestion": "...",
+            "key_stats": ["...", "..."],
+            "description": "..."
+        }}
+    ],
+    "color_scheme": ["#hex1", "#hex2", "#hex3"],
+    "image_prompt": "Detailed prompt for generating the infographic image"
+}}"""
+
+AUDIO_FORMAT_PROMPTS = {
+    "deep_dive": "Create an engaging 10-15 minute two-host podcast script exploring this topic in depth. The hosts should have a natural conversation, with one explaining concepts and the other asking clarifying questions.",
+    "brief": "Create a concise 2-3 minute single-speaker summary of the key points.",
+    "critique": "Create a 5-10 minute two-host analytical discussion examining strengths and weaknesses of the ideas presented.",
+    "debate": "Create an 8-15 minute two-host debate script with opposing viewpoints on the topics discussed.",
+}
+
+VIDEO_STYLE_PROMPTS = {
+    "documentary": "Create a documentary-style video script with narration and scene descriptions. Include visual cues for cinematic shots.",
+    "explainer": "Create an educational explainer video script. Include on-screen text suggestions and visual aids.",
+    "presentation": "Create a business presentation video script with clear sections and bullet points for slides.",
+}
+
+
+def calculate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """Calculate cost in USD for a given model and token counts.
+
+    cached_tokens is the part of input_tokens served from a context cache.
+    """
+    input_rate, cached_rate, output_rate = _TOKEN_RATES.get(model, _TOKEN_RATES["gemini-2.5-flash"])
+    cost = (
+        (input_tokens - cached_tokens) * input_rate
+        + cached_tokens * cached_rate
+        + output_tokens * output_rate
+    )
+    return round(cost / 1_000_000_000_000, 6)
+
+
+def build_usage(model_name: str, usage_metadata) -> Dict[str, Any]:
+    """Token counts and cost from a response's usage_metadata."""
+    if usage_metadata is None:
+        # A stream that ended without a usage chunk
+        return {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "model_used": model_name}
+    input_tokens = usage_metadata.prompt_token_count or 0
+    output_tokens = usage_metadata.candidates_token_count or 0
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": calculate_cost(model_name, input_tokens, output_tokens, cached_tokens),
+        "model_used": model_name,
+    }
+
+
+def wav_header(data_size: int, sample_rate: int = 24000, channels: int = 1, sample_width: int = 2) -> bytes:
+    """44-byte RIFF/WAVE header for `data_size` bytes of 16-bit PCM."""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
 
 
 class GeminiService:
     def __init__(self):
-        self.models = {}
-
-    def get_model(self, model_name: str = "gemini-2.5-flash"):
-        """Get or create a Gemini model instance."""
-        if model_name not in self.models:
-            self.models[model_name] = genai.GenerativeModel(model_name)
-        return self.models[model_name]
+        # Keyed by (model name, system instruction); persona instructions vary
+        # per notebook, so the number kept is bounded
+        self.models: LRUCache = LRUCache(maxsize=64)
+
+    def get_model(self, model_name: str = "gemini-2.5-flash", system_instruction: Optional[str] = None):
+        """Get or create a Gemini model instance for a model and system instruction."""
+        key = (model_name, system_instruction or "")
+        model = self.models.get(key)
+        if model is None:
+            genai = _genai()
+            if system_instruction:
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            else:
+                model = genai.GenerativeModel(model_name)
+            self.models[key] = model
+        return model
 
     async def generate_content(
         self,
@@ -55,33 +358,223 @@ class GeminiService:
         model_name: str = "gemini-2.5-flash",
         system_instruction: Optional[str] = None,
         temperature: float = 0.7,
+        cached_content: Optional[str] = None,
+        json_output: bool = False,
     ) -> Dict[str, Any]:
-        """Generate content using Gemini."""
-        model = self.get_model(model_name)
+        """Generate content using Gemini.
+
+        cached_content names a context cache (see _get_context_cache) holding
+        the system instruction and document; the prompt is then only the task.
+        json_output puts the model in JSON mode, so the text is bare JSON
+        without markdown fences or surrounding prose.
+        """
+        response_mime_type = "application/json" if json_output else None
+        if cached_content:
+            genai_client, genai_types = _genai_sdk()
+            response = await call_gemini(
+                genai_client.aio.models.generate_content,
+                model=model_name,
+                contents=prompt,
+                config=genai_types.GenerateContentConfig(
+                    cached_content=cached_content,
+                    temperature=temperature,
+                    response_mime_type=response_mime_type,
+                ),
+            )
+            return {
+                "content": response.text or "",
+                "usage": build_usage(model_name, response.usage_metadata),
+            }
 
-        generation_config = genai.GenerationConfig(temperature=temperature)
+        model = self.get_model(model_name, system_instruction)
 
-        if system_instruction:
-            model = genai.GenerativeModel(
-                model_name, system_instruction=system_instruction
+        generation_config = _genai().GenerationConfig(
+            temperature=temperature, response_mime_type=response_mime_type
+        )
+
+        response = await call_gemini(model.generate_content_async, prompt, generation_config=generation_config)
+
+        return {
+            "content": response.text,
+            "usage": build_usage(model_name, response.usage_metadata),
+        }
+
+    async def stream_content(
+        self,
+        prompt: str,
+        model_name: str = "gemini-2.5-flash",
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        cached_content: Optional[str] = None,
+        json_output: bool = False,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream generated text as {"type": "text"} events, ending with a {"type": "usage"} event."""
+        response_mime_type = "application/json" if json_output else None
+        if cached_content:
+            genai_client, genai_types = _genai_sdk()
+            stream = await call_gemini(
+                genai_client.aio.models.generate_content_stream,
+                model=model_name,
+                contents=prompt,
+                config=genai_types.GenerateContentConfig(
+                    cached_content=cached_content,
+                    temperature=temperature,
+                    response_mime_type=response_mime_type,
+                ),
             )
+            usage_metadata = None
+            async for chunk in stream:
+                if chunk.text:
+                    yield {"type": "text", "text": chunk.text}
+                if chunk.usage_metadata:
+                    usage_metadata = chunk.usage_metadata
+
+            yield {"type": "usage", "usage": build_usage(model_name, usage_metadata)}
+            return
+
+        model = self.get_model(model_name, system_instruction)
 
-        response = model.generate_content(prompt, generation_config=generation_config)
+        generation_config = _genai().GenerationConfig(
+            temperature=temperature, response_mime_type=response_mime_type
+        )
+
+        response = await call_gemini(
+            model.generate_content_async,
+            prompt, generation_config=generation_config, stream=True
+        )
 
-        input_tokens = response.usage_metadata.prompt_token_count
-        output_tokens = response.usage_metadata.candidates_token_count
-        cost = calculate_cost(model_name, input_tokens, output_tokens)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts (e.g. the final metadata chunk)
+            if text:
+                yield {"type": "text", "text": text}
+
+        yield {"type": "usage", "usage": build_usage(model_name, response.usage_metadata)}
+
+    async def _get_context_cache(
+        self,
+        content: str,
+        model_name: str,
+        system_instruction: Optional[str],
+        create: bool = False,
+    ) -> Optional[str]:
+        """Return the name of a context cache holding `content`, or None.
+
+        Summary, flashcards, quiz, etc. are often generated one after another
+        from the same sources, so the document is cached once and each call
+        only sends its task. A cache is created on the second request for the
+        same content, or on the first when `create` is set (callers about to
+        run several generations). Returns None when the content is below the
+        API minimum, seen for the first time, the google-genai SDK is missing,
+        or creation fails.
+        """
+        genai_client, _ = _genai_sdk()
+        if genai_client is None:
+            return None
+        if len(content) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        key = hashlib.blake2b(
+            f"{model_name}\0{system_instruction or ''}\0{content}".encode(), digest_size=16
+        ).hexdigest()
+        name = _context_caches.get(key)
+        if name:
+            return name
+
+        if not create and key not in _context_cache_candidates and key not in _context_caches_inflight:
+            _context_cache_candidates[key] = True
+            return None
+        _context_cache_candidates.pop(key, None)
+
+        # Concurrent calls over the same content (generate_bundle) share one create
+        future = _context_caches_inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._create_context_cache(content, model_name, system_instruction))
+            _context_caches_inflight[key] = future
+            future.add_done_callback(lambda _: _context_caches_inflight.pop(key, None))
+
+        name = await asyncio.shield(future)
+        if name:
+            _context_caches[key] = name
+        return name
+
+    async def _create_context_cache(
+        self, content: str, model_name: str, system_instruction: Optional[str]
+    ) -> Optional[str]:
+        genai_client, genai_types = _genai_sdk()
+        try:
+            cache = await call_gemini(
+                genai_client.aio.caches.create,
+                model=model_name,
+                config=genai_types.CreateCachedContentConfig(
+                    contents=[content],
+                    system_instruction=system_instruction,
+                    ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                ),
+            )
+        except Exception as e:
+            print(f"Context cache creation failed, sending content inline: {e}")
+            return None
+        return cache.name
+
+    async def _fit_content(
+        self, content: str, model_name: str, budget: int = CONTENT_TOKEN_BUDGET
+    ) -> str:
+        """Truncate `content` to about `budget` tokens.
+
+        Oversized documents would otherwise be billed in full or rejected by
+        the API. Only content longer than `budget` characters is counted, since
+        a token covers at least one character.
+        """
+        if len(content) <= budget:
+            return content
+
+        key = hashlib.blake2b(f"{model_name}\0{content}".encode(), digest_size=16).hexdigest()
+        total_tokens = _token_counts.get(key)
+        if total_tokens is None:
+            try:
+                result = await call_gemini(self.get_model(model_name).count_tokens_async, content)
+                total_tokens = _token_counts[key] = result.total_tokens
+            except Exception as e:
+                print(f"Token count failed, estimating from length: {e}")
+                total_tokens = len(content) // 4
+
+        if total_tokens <= budget:
+            return content
+
+        print(f"Truncating content from {total_tokens} to ~{budget} tokens")
+        return content[: int(len(content) * budget / total_tokens * 0.95)]
+
+    async def _content_request(
+        self,
+        content: str,
+        task: str,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Build generate_content/stream_content arguments for a task over `content`."""
+        content = await self._fit_content(content, model_name)
+        cached_content = await self._get_context_cache(content, model_name, system_instruction)
+        if cached_content:
+            return {"prompt": task, "model_name": model_name, "cached_content": cached_content}
 
         return {
-            "content": response.text,
-            "usage": {
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "cost_usd": cost,
-                "model_used": model_name,
-            },
+            "prompt": self._inline_prompt(content, task),
+            "model_name": model_name,
+            "system_instruction": system_instruction,
         }
 
+    @staticmethod
+    def _inline_prompt(content: str, task: str) -> str:
+        """A task prompt with the content sent inline rather than from a cache.
+
+        The document comes first and the task last, so calls over the same
+        content share a byte-identical prefix for Gemini's implicit caching.
+        """
+        return f"<document>\n{content}\n</document>\n\n<task>\n{task}\n</task>"
+
     async def generate_with_context(
         self,
         message: str,
@@ -107,41 +600,25 @@ Be concise but thorough."""
             for i, name in enumerate(source_names, 1):
                 source_context += f"[{i}] Source: {name}\n"
 
-        prompt = f"""Sources:
-{context}
-
-{source_context}
-
-User Question: {message}
-
-Provide a well-cited response:"""
+        task = CONTEXT_QUESTION_TASK.format_map({"source_context": source_context, "message": message})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=system_instruction,
+            **await self._content_request(context, task, model_name, system_instruction)
         )
 
     async def generate_summary(
         self, content: str, model_name: str = "gemini-2.5-flash"
     ) -> Dict[str, Any]:
         """Generate a summary of content."""
-        prompt = f"""Analyze this content and provide:
-1. A concise summary (2-3 paragraphs)
-2. Key topics covered (list of 5-10 topics)
-3. 5 suggested questions someone might ask about this content
-
-Content:
-{content}
-
-Format your response as JSON:
-{{
-    "summary": "...",
-    "topics": ["topic1", "topic2", ...],
-    "suggested_questions": ["question1", "question2", ...]
-}}"""
+        prompt = SUMMARY_TASK
 
-        return await self.generate_content(prompt=prompt, model_name=model_name)
+        # Source guides summarize each document (or chunk) once, so a
+        # context cache would never be reused
+        return await self.generate_content(
+            prompt=self._inline_prompt(await self._fit_content(content, model_name), prompt),
+            model_name=model_name,
+            json_output=True,
+        )
 
     async def generate_flashcards(
         self,
@@ -151,22 +628,11 @@ Format your response as JSON:
         persona_instructions: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Generate flashcards from content."""
-        prompt = f"""Create {count} educational flashcards from this content.
-Each flashcard should test understanding of key concepts.
-
-Content:
-{content}
-
-Format as JSON array:
-[
-    {{"question": "...", "answer": "..."}},
-    ...
-]"""
+        prompt = FLASHCARDS_TASK.format_map({"count": count})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
     async def generate_quiz(
@@ -177,27 +643,11 @@ Format as JSON array:
         persona_instructions: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Generate a quiz from content."""
-        prompt = f"""Create a {question_count}-question multiple choice quiz from this content.
-Each question should have 4 options with one correct answer.
-
-Content:
-{content}
-
-Format as JSON array:
-[
-    {{
-        "question": "...",
-        "options": ["A) ...", "B) ...", "C) ...", "D) ..."],
-        "correct_index": 0,
-        "explanation": "..."
-    }},
-    ...
-]"""
+        prompt = QUIZ_TASK.format_map({"question_count": question_count})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
     async def generate_study_guide(
@@ -207,28 +657,11 @@ Format as JSON array:
         persona_instructions: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Generate a comprehensive study guide."""
-        prompt = f"""Create a comprehensive study guide from this content.
-
-Content:
-{content}
-
-Format as JSON:
-{{
-    "title": "...",
-    "summary": "...",
-    "key_concepts": [
-        {{"term": "...", "definition": "...", "importance": "..."}}
-    ],
-    "glossary": [
-        {{"term": "...", "definition": "..."}}
-    ],
-    "review_questions": ["...", "..."]
-}}"""
+        prompt = STUDY_GUIDE_TASK
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
     async def generate_faq(
@@ -239,24 +672,46 @@ Format as JSON:
         persona_instructions: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Generate FAQ from content."""
-        prompt = f"""Generate {count} frequently asked questions and answers about this content.
-Focus on common questions a reader might have.
-
-Content:
-{content}
-
-Format as JSON array:
-[
-    {{"question": "...", "answer": "..."}},
-    ...
-]"""
+        prompt = FAQ_TASK.format_map({"count": count})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
+    async def generate_bundle(
+        self,
+        content: str,
+        kinds: List[str],
+        model_name: str = "gemini-2.5-flash",
+        persona_instructions: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Run several generators (summary, flashcards, quiz, study_guide, faq) over the same content concurrently.
+
+        Returns each kind's result, or {"error": "..."} for kinds that failed,
+        so one failure doesn't discard the rest.
+        """
+        async def run(kind: str) -> Dict[str, Any]:
+            params = {"content": content, "model_name": model_name}
+            if kind != "summary":
+                params["persona_instructions"] = persona_instructions
+            async with _gemini_semaphore:
+                return await getattr(self, f"generate_{kind}")(**params)
+
+        # Every kind but summary reads the same cached document, so create the
+        # cache up front instead of waiting for a second request
+        if sum(kind != "summary" for kind in kinds) > 1:
+            await self._get_context_cache(
+                await self._fit_content(content, model_name), model_name, persona_instructions, create=True
+            )
+
+        results = await asyncio.gather(*(run(kind) for kind in kinds), return_exceptions=True)
+
+        return {
+            kind: {"error": str(result)} if isinstance(result, Exception) else result
+            for kind, result in zip(kinds, results)
+        }
+
     async def generate_audio_script(
         self,
         content: str,
@@ -265,36 +720,34 @@ Format as JSON array:
         model_name: str = "gemini-2.5-flash",
     ) -> Dict[str, Any]:
         """Generate a podcast-style script."""
-        format_prompts = {
-            "deep_dive": "Create an engaging 10-15 minute two-host podcast script exploring this topic in depth. The hosts should have a natural conversation, with one explaining concepts and the other asking clarifying questions.",
-            "brief": "Create a concise 2-3 minute single-speaker summary of the key points.",
-            "critique": "Create a 5-10 minute two-host analytical discussion examining strengths and weaknesses of the ideas presented.",
-            "debate": "Create an 8-15 minute two-host debate script with opposing viewpoints on the topics discussed.",
-        }
-
-        format_instruction = format_prompts.get(format_type, format_prompts["deep_dive"])
+        format_instruction = AUDIO_FORMAT_PROMPTS.get(format_type, AUDIO_FORMAT_PROMPTS["deep_dive"])
 
         extra = ""
         if custom_instructions:
             extra = f"\n\nAdditional instructions: {custom_instructions}"
 
-        prompt = f"""{format_instruction}{extra}
-
-Content to discuss:
-{content}
-
-Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for each line of dialogue.
-Make it natural, engaging, and educational."""
+        prompt = AUDIO_SCRIPT_TASK.format_map({"format_instruction": format_instruction, "extra": extra})
 
-        return await self.generate_content(prompt=prompt, model_name=model_name)
+        return await self.generate_content(
+            prompt=self._inline_prompt(await self._fit_content(content, model_name), prompt),
+            model_name=model_name,
+        )
 
     async def generate_tts_audio(
         self,
         script: str,
         format_type: str = "deep_dive",
+        upload: Optional[Callable[[List[bytes]], Awaitable[Any]]] = None,
     ) -> Dict[str, Any]:
-        """Generate TTS audio from script using Gemini 2.5 Flash TTS."""
-        if not NEW_SDK_AVAILABLE or not genai_client:
+        """Generate TTS audio from script using Gemini 2.5 Flash TTS.
+
+        With `upload`, the WAV header and PCM are passed to it as separate
+        chunks and the result has no audio_data, so the PCM is not copied
+        into a header-prefixed WAV buffer. The PCM arrives from Gemini as a
+        single inline blob, so it is still held in memory once.
+        """
+        genai_client, genai_types = _genai_sdk()
+        if genai_client is None:
             raise Exception("TTS not available: google-genai SDK not installed")
 
         # Parse script to extract speakers
@@ -317,7 +770,8 @@ Make it natural, engaging, and educational."""
                         )
                     )
 
-                response = genai_client.models.generate_content(
+                response = await call_gemini(
+                    genai_client.aio.models.generate_content,
                     model="gemini-2.5-flash-preview-tts",
                     contents=script,
                     config=genai_types.GenerateContentConfig(
@@ -331,7 +785,8 @@ Make it natural, engaging, and educational."""
                 )
             else:
                 # Single speaker TTS (1 speaker or 3+ speakers fall back to single)
-                response = genai_client.models.generate_content(
+                response = await call_gemini(
+                    genai_client.aio.models.generate_content,
                     model="gemini-2.5-flash-preview-tts",
                     contents=script,
                     config=genai_types.GenerateContentConfig(
@@ -349,45 +804,43 @@ Make it natural, engaging, and educational."""
             # Extract audio data
             audio_data = response.candidates[0].content.parts[0].inline_data.data
 
-            # Convert PCM to WAV
-            wav_buffer = io.BytesIO()
-            with wave.open(wav_buffer, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)  # 16-bit
-                wf.setframerate(24000)  # 24kHz
-                wf.writeframes(audio_data)
+        except Exception as e:
+            raise Exception(f"TTS generation failed: {str(e)}")
 
-            wav_buffer.seek(0)
-            duration_seconds = len(audio_data) / (24000 * 2)  # samples / (rate * bytes_per_sample)
+        header = wav_header(len(audio_data))
+        result = {
+            "duration_seconds": len(audio_data) / (24000 * 2),  # samples / (rate * bytes_per_sample)
+            "format": "wav",
+            "sample_rate": 24000,
+            "size_bytes": len(header) + len(audio_data),
+        }
 
-            return {
-                "audio_data": wav_buffer.getvalue(),
-                "duration_seconds": duration_seconds,
-                "format": "wav",
-                "sample_rate": 24000,
-            }
+        if upload is not None:
+            await upload([header, audio_data])
+        else:
+            # A single concatenation instead of copying through a BytesIO
+            result["audio_data"] = header + audio_data
 
-        except Exception as e:
-            raise Exception(f"TTS generation failed: {str(e)}")
+        return result
 
     def _extract_speakers(self, script: str, format_type: str) -> List[str]:
-        """Extract speaker names from script."""
-        speakers = set()
-
-        # Common patterns for speaker labels
-        import re
-        # Match patterns like "Alex:", "Host 1:", "Speaker:"
-        matches = re.findall(r'^([A-Za-z0-9\s]+):', script, re.MULTILINE)
-        for match in matches:
-            speaker = match.strip()
-            if speaker:
-                speakers.add(speaker)
+        """Extract speaker names from script, in order of first appearance."""
+        speakers: List[str] = []
+        seen = set()
+
+        for match in SPEAKER_RE.finditer(script):
+            speaker = match.group(1).strip()
+            if speaker and speaker not in seen:
+                seen.add(speaker)
+                speakers.append(speaker)
+                if len(speakers) == 5:  # Limit to 5 speakers
+                    break
 
         if not speakers:
             # Default single speaker
             return ["Speaker"]
 
-        return list(speakers)[:5]  # Limit to 5 speakers
+        return speakers
 
     async def generate_video_script(
         self,
@@ -396,28 +849,14 @@ Make it natural, engaging, and educational."""
         model_name: str = "gemini-2.5-flash",
     ) -> Dict[str, Any]:
         """Generate a video script."""
-        style_prompts = {
-            "documentary": "Create a documentary-style video script with narration and scene descriptions. Include visual cues for cinematic shots.",
-            "explainer": "Create an educational explainer video script. Include on-screen text suggestions and visual aids.",
-            "presentation": "Create a business presentation video script with clear sections and bullet points for slides.",
-        }
+        style_instruction = VIDEO_STYLE_PROMPTS.get(style, VIDEO_STYLE_PROMPTS["explainer"])
 
-        style_instruction = style_prompts.get(style, style_prompts["explainer"])
+        prompt = VIDEO_SCRIPT_TASK.format_map({"style_instruction": style_instruction})
 
-        prompt = f"""{style_instruction}
-
-Content to cover:
-{content}
-
-Format the script with:
-- [SCENE X: Description] for scene markers
-- [VISUAL: Description] for visual suggestions
-- [TEXT ON SCREEN: Content] for text overlays
-- Clear narration text
-
-Make it engaging and suitable for a 30-60 second video."""
-
-        return await self.generate_content(prompt=prompt, model_name=model_name)
+        return await self.generate_content(
+            prompt=self._inline_prompt(await self._fit_content(content, model_name), prompt),
+            model_name=model_name,
+        )
 
     async def generate_research_report(
         self,
@@ -426,32 +865,35 @@ Make it engaging and suitable for a 30-60 second video."""
         model_name: str = "gemini-2.5-flash",
     ) -> Dict[str, Any]:
         """Generate a research report."""
-        depth_instruction = "comprehensive and detailed" if mode == "deep" else "concise but thorough"
-
-        prompt = f"""Create a {depth_instruction} research report on the following topic:
-
-Topic: {query}
-
-Structure your report with:
-1. Executive Summary (2-3 paragraphs)
-2. Key Findings (numbered list)
-3. Analysis (main body with subsections)
-4. Methodology notes
-5. Conclusion and recommendations
-
-Use markdown formatting. Be factual and cite sources where applicable.
-Note: In production, this would use Deep Research API for real web search and analysis."""
-
-        result = await self.generate_content(prompt=prompt, model_name=model_name)
+        result = await self.generate_content(
+            prompt=self._research_report_prompt(query, mode), model_name=model_name
+        )
 
         # Add mock citations for demo
-        result["citations"] = [
-            {"title": "Research Source 1", "url": "https://example.com/source1"},
-            {"title": "Research Source 2", "url": "https://example.com/source2"},
-        ]
+        result["citations"] = RESEARCH_CITATIONS
 
         return result
 
+    def generate_research_report_stream(
+        self,
+        query: str,
+        mode: str = "fast",
+        model_name: str = "gemini-2.5-flash",
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a research report (see stream_content for the event format).
+
+        Reports run to thousands of tokens, so streaming shows the first
+        section long before the whole report is done.
+        """
+        return self.stream_content(
+            prompt=self._research_report_prompt(query, mode), model_name=model_name
+        )
+
+    @staticmethod
+    def _research_report_prompt(query: str, mode: str) -> str:
+        depth_instruction = "comprehensive and detailed" if mode == "deep" else "concise but thorough"
+        return RESEARCH_REPORT_PROMPT.format_map({"depth_instruction": depth_instruction, "query": query})
+
     async def generate_data_table(
         self,
         content: str,
@@ -464,26 +906,11 @@ Note: In production, this would use Deep Research API for real web search and an
         if custom_instructions:
             extra = f"\n\nAdditional instructions: {custom_instructions}"
 
-        prompt = f"""Extract and organize the key data from this content into a structured table.{extra}
-
-Content:
-{content}
-
-Format as JSON:
-{{
-    "title": "...",
-    "columns": ["Column 1", "Column 2", ...],
-    "rows": [
-        ["value1", "value2", ...],
-        ...
-    ],
-    "summary": "Brief description of what this table shows"
-}}"""
+        prompt = DATA_TABLE_TASK.format_map({"extra": extra})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
     async def generate_report(
@@ -498,29 +925,22 @@ Format as JSON:
         if custom_instructions:
             extra = f"\n\nAdditional instructions: {custom_instructions}"
 
-        prompt = f"""Create a comprehensive briefing document/report from this content.{extra}
-
-Content:
-{content}
-
-Format as JSON:
-{{
-    "title": "...",
-    "executive_summary": "...",
-    "key_findings": ["...", "..."],
-    "sections": [
-        {{"heading": "...", "content": "..."}}
-    ],
-    "conclusion": "...",
-    "recommendations": ["...", "..."]
-}}"""
+        prompt = REPORT_TASK.format_map({"extra": extra})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
+    def _slide_deck_prompt(
+        self, slide_count: int, custom_instructions: Optional[str]
+    ) -> str:
+        extra = ""
+        if custom_instructions:
+            extra = f"\n\nAdditional instructions: {custom_instructions}"
+
+        return SLIDE_DECK_TASK.format_map({"slide_count": slide_count, "extra": extra})
+
     async def generate_slide_deck(
         self,
         content: str,
@@ -530,34 +950,26 @@ Format as JSON:
         persona_instructions: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Generate a slide deck from content."""
-        extra = ""
-        if custom_instructions:
-            extra = f"\n\nAdditional instructions: {custom_instructions}"
-
-        prompt = f"""Create a {slide_count}-slide presentation from this content.{extra}
-
-Content:
-{content}
-
-Format as JSON:
-{{
-    "title": "...",
-    "subtitle": "...",
-    "slides": [
-        {{
-            "title": "...",
-            "bullet_points": ["...", "..."],
-            "speaker_notes": "..."
-        }}
-    ]
-}}"""
-
+        task = self._slide_deck_prompt(slide_count, custom_instructions)
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, task, model_name, persona_instructions),
+            json_output=True,
         )
 
+    async def generate_slide_deck_stream(
+        self,
+        content: str,
+        slide_count: int = 10,
+        custom_instructions: Optional[str] = None,
+        model_name: str = "gemini-2.5-flash",
+        persona_instructions: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a slide deck from content (see stream_content for the event format)."""
+        task = self._slide_deck_prompt(slide_count, custom_instructions)
+        request = await self._content_request(content, task, model_name, persona_instructions)
+        async for event in self.stream_content(**request, json_output=True):
+            yield event
+
     async def generate_infographic_plan(
         self,
         content: str,
@@ -571,31 +983,11 @@ Format as JSON:
         if custom_instructions:
             extra = f"\n\nAdditional instructions: {custom_instructions}"
 
-        prompt = f"""Create an infographic content plan in a {style} style from this content.{extra}
-
-Content:
-{content}
-
-Format as JSON:
-{{
-    "title": "...",
-    "subtitle": "...",
-    "sections": [
-        {{
-            "heading": "...",
-            "icon_suggestion": "...",
-            "key_stats": ["...", "..."],
-            "description": "..."
-        }}
-    ],
-    "color_scheme": ["#hex1", "#hex2", "#hex3"],
-    "image_prompt": "Detailed prompt for generating the infographic image"
-}}"""
+        prompt = INFOGRAPHIC_TASK.format_map({"style": style, "extra": extra})
 
         return await self.generate_content(
-            prompt=prompt,
-            model_name=model_name,
-            system_instruction=persona_instructions,
+            **await self._content_request(content, prompt, model_name, persona_instructions),
+            json_output=True,
         )
 
 
@@ -0,0 +1,115 @@
+"""Cache for Gemini generations keyed by a hash of their inputs.
+
+Entries live in process memory and in the Supabase gen_cache table, so other
+workers (and restarts) reuse results too.
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+from cachetools import TTLCache
+
+from app.services.notebook_access import parse_json_response
+from app.services.supabase_client import get_supabase_client, execute_query
+
+# Generations are sampled, so a cached one should not outlive the session
+# that asked for it
+GENERATION_TTL_SECONDS = 60 * 60
+
+# Repeating a generation from the same sources, persona and options is common
+# (retries, re-opening a panel), and each call costs far more than a cache entry
+_generation_cache: TTLCache = TTLCache(maxsize=512, ttl=GENERATION_TTL_SECONDS)
+
+
+def generation_key(name: str, params: Dict[str, Any]) -> str:
+    """Hash a generator name and its keyword arguments into a cache key."""
+    payload = orjson.dumps(params, option=orjson.OPT_SORT_KEYS, default=str)
+    digest = hashlib.blake2b(payload, digest_size=32).hexdigest()
+    return f"gen:{name}:{digest}"
+
+
+async def _load_persisted(key: str) -> Optional[Dict[str, Any]]:
+    supabase = get_supabase_client()
+    try:
+        result = await execute_query(
+            supabase.table("gen_cache")
+            .select("response")
+            .eq("hash", key)
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())
+            .limit(1)
+        )
+    except Exception as e:
+        print(f"Generation cache read failed: {e}")
+        return None
+    return result.data[0]["response"] if result.data else None
+
+
+async def _persist(key: str, result: Dict[str, Any]) -> None:
+    supabase = get_supabase_client()
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=GENERATION_TTL_SECONDS)
+    try:
+        await execute_query(supabase.table("gen_cache").upsert({
+            "hash": key,
+            "response": result,
+            "expires_at": expires_at.isoformat(),
+        }))
+    except Exception as e:
+        print(f"Generation cache write failed: {e}")
+
+
+def is_cacheable(result: Dict[str, Any], expect: Optional[type]) -> bool:
+    """Whether a generation is worth reusing.
+
+    Empty output is never cached. With `expect` set the content must also
+    parse into a non-empty value of that type, so parse failures are retried.
+    """
+    content = result.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return False
+    if expect is None:
+        return True
+    parsed = parse_json_response(content)
+    if isinstance(parsed, dict) and "error" in parsed:
+        return False
+    return isinstance(parsed, expect) and bool(parsed)
+
+
+async def cached_generate(
+    generate: Callable[..., Awaitable[Dict[str, Any]]],
+    *,
+    regenerate: bool = False,
+    expect: Optional[type] = None,
+    **params: Any,
+) -> Dict[str, Any]:
+    """Call a gemini_service generator, reusing the result for identical inputs.
+
+    Cache hits report zero cost and set usage.cache_hit. `regenerate` skips
+    the lookup (the UI's regenerate action) and replaces the stored result.
+    `expect` is the JSON type the caller parses the content into; results
+    that don't parse into it are returned but not cached.
+    """
+    key = generation_key(generate.__name__, params)
+    cached = None
+    if not regenerate:
+        cached = _generation_cache.get(key)
+        if cached is None:
+            cached = await _load_persisted(key)
+            if cached is not None:
+                _generation_cache[key] = cached
+
+    if cached is not None:
+        return {
+            **cached,
+            "usage": {**cached["usage"], "cost_usd": 0.0, "cache_hit": True},
+        }
+
+    result = await generate(**params)
+    if is_cacheable(result, expect):
+        _generation_cache[key] = result
+        await _persist(key, result)
+    else:
+        # A failed regenerate leaves the earlier good row in gen_cache alone
+        _generation_cache.pop(key, None)
+    return result
@@ -0,0 +1,80 @@
+"""Incremental extraction of array items from streamed (possibly malformed) JSON text."""
+
+from typing import Any, List, Optional
+
+import orjson
+
+
+class ArrayItemStream:
+    """Pull complete objects out of the JSON array under `key` as text arrives.
+
+    Only tracks string/escape state and brace depth, so it tolerates the prose,
+    code fences and trailing commas LLMs wrap around their JSON. Objects that
+    fail to decode are skipped; the caller still parses the full text at the end.
+    """
+
+    def __init__(self, key: str):
+        self._marker = f'"{key}"'
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Any]:
+        """Add a chunk of text and return the array items completed by it."""
+        self._buffer += text
+        if self._done:
+            return []
+
+        if not self._in_array:
+            key_index = self._buffer.find(self._marker)
+            if key_index == -1:
+                return []
+            bracket = self._buffer.find("[", key_index + len(self._marker))
+            if bracket == -1:
+                return []
+            self._in_array = True
+            self._pos = bracket + 1
+
+        items = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    try:
+                        items.append(orjson.loads(buffer[self._start:i + 1]))
+                    except orjson.JSONDecodeError:
+                        pass
+                    self._start = None
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                break
+            i += 1
+
+        self._pos = i
+        return items
+
+    @property
+    def text(self) -> str:
+        """All text fed so far."""
+        return self._buffer
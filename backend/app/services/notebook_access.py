@@ -0,0 +1,243 @@
+"""Shared notebook ownership checks and source helpers for notebook-scoped routers."""
+
+import asyncio
+import re
+from typing import Dict, List, Optional
+from uuid import UUID
+
+import orjson
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+from app.services.supabase_client import get_supabase_client, execute_query
+from app.services.persona_utils import build_persona_instructions
+
+try:
+    import json_repair
+except ImportError:
+    json_repair = None
+
+# These caches are per worker process. Writes invalidate the worker that made
+# them; other workers pick the change up when the entry's TTL runs out, which
+# is why the TTLs are kept to seconds.
+
+# Positive (notebook_id, user_id) lookups only; misses always hit the database.
+# Entries hold the notebook settings too, so updates must invalidate them.
+_access_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+# Ownership-only checks for endpoints that never read the settings
+_ownership_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+# get_sources_content results, keyed by (notebook_id, source ids). Studio and
+# study generators launched together read the same sources, so identical
+# concurrent calls share one query and results are reused for a few seconds.
+_sources_cache: TTLCache = TTLCache(maxsize=1_000, ttl=5)
+_sources_inflight: Dict[tuple, asyncio.Future] = {}
+# Bumped by invalidate_sources_content, so a query that started before a
+# write doesn't store its stale result after the invalidation. Entries only
+# need to outlive a query.
+_sources_versions: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# Responses salvaged by json_repair since startup
+json_repair_count = 0
+
+# Body of the first markdown code fence, with or without a json tag
+JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+OPEN_FENCE_RE = re.compile(r"^\s*```(?:json)?")
+
+
+async def verify_notebook_access(notebook_id: UUID, user_id: str):
+    """Verify user has access to the notebook and return notebook data with settings.
+
+    The returned dict also carries `persona_instructions`, built from the
+    settings once per cache entry.
+    """
+    key = (str(notebook_id), user_id)
+    cached = _access_cache.get(key)
+    if cached is not None:
+        return cached
+
+    supabase = get_supabase_client()
+    result = await execute_query(
+        supabase.table("notebooks")
+        .select("id, settings")
+        .eq("id", str(notebook_id))
+        .eq("user_id", user_id)
+        .single()
+    )
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Notebook not found")
+
+    notebook = result.data
+    notebook["persona_instructions"] = build_persona_instructions(notebook.get("settings") or {})
+    _access_cache[key] = notebook
+    return notebook
+
+
+async def verify_notebook_access_only(notebook_id: UUID, user_id: str) -> None:
+    """Verify user has access to the notebook without loading its settings."""
+    key = (str(notebook_id), user_id)
+    if key in _access_cache or key in _ownership_cache:
+        return
+
+    supabase = get_supabase_client()
+    result = await execute_query(
+        supabase.table("notebooks")
+        .select("id")
+        .eq("id", str(notebook_id))
+        .eq("user_id", user_id)
+        .maybe_single()
+    )
+    if not result or not result.data:
+        raise HTTPException(status_code=404, detail="Notebook not found")
+
+    _ownership_cache[key] = True
+
+
+def invalidate_notebook_access(notebook_id: UUID):
+    """Drop cached access checks for a notebook (call after updating or deleting it)."""
+    notebook_id = str(notebook_id)
+    for cache in (_access_cache, _ownership_cache):
+        for key in [key for key in cache.keys() if key[0] == notebook_id]:
+            cache.pop(key, None)
+
+
+async def get_sources_content(
+    notebook_id: UUID, source_ids: Optional[List[UUID]] = None, max_chars: int = 50000
+):
+    """Get content from ready sources (text bodies, otherwise source guide summaries).
+
+    The joined content is capped at max_chars; sources past the cap are not copied.
+    Each caller gets its own copy of the source rows.
+    """
+    key = (str(notebook_id), frozenset(str(sid) for sid in source_ids or ()), max_chars)
+    cached = _sources_cache.get(key)
+    if cached is None:
+        version = _sources_versions.get(key[0], 0)
+        future = _sources_inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(_load_sources_content(notebook_id, source_ids, max_chars))
+            _sources_inflight[key] = future
+
+            def forget(done: asyncio.Future) -> None:
+                # An invalidation may already have replaced or dropped the entry
+                if _sources_inflight.get(key) is done:
+                    del _sources_inflight[key]
+
+            future.add_done_callback(forget)
+
+        # Shield the shared query so one cancelled caller doesn't cancel it for the rest
+        cached = await asyncio.shield(future)
+        if _sources_versions.get(key[0], 0) == version:
+            _sources_cache[key] = cached
+
+    content, sources = cached
+    return content, [dict(source) for source in sources]
+
+
+async def load_notebook_and_sources(
+    notebook_id: UUID,
+    user_id: str,
+    source_ids: Optional[List[UUID]] = None,
+    max_chars: int = 50000,
+    with_settings: bool = True,
+):
+    """Check notebook access and load its source content for a generator.
+
+    The access check and the source query are independent round trips, so
+    they run concurrently; a failed check still raises its 404. Returns
+    (notebook, content, sources), with notebook None when with_settings is
+    False and only ownership is checked.
+    """
+    check = verify_notebook_access if with_settings else verify_notebook_access_only
+    notebook, (content, sources) = await asyncio.gather(
+        check(notebook_id, user_id),
+        get_sources_content(notebook_id, source_ids, max_chars),
+    )
+    return notebook, content, sources
+
+
+def invalidate_sources_content(notebook_id: UUID):
+    """Drop cached source content for a notebook (call after adding, updating or deleting a source)."""
+    notebook_id = str(notebook_id)
+    _sources_versions[notebook_id] = _sources_versions.get(notebook_id, 0) + 1
+    for cache in (_sources_cache, _sources_inflight):
+        for key in [key for key in cache.keys() if key[0] == notebook_id]:
+            cache.pop(key, None)
+
+
+async def _load_sources_content(notebook_id: UUID, source_ids: Optional[List[UUID]], max_chars: int):
+    supabase = get_supabase_client()
+
+    # Only the guide's summary is used, so project it out in PostgREST rather
+    # than transferring the whole guide (topics, questions, ...)
+    query = supabase.table("sources").select("id, type, content, summary:source_guide->>summary").eq("notebook_id", str(notebook_id)).in_("status", ["ready", "completed"])
+
+    if source_ids:
+        query = query.in_("id", [str(sid) for sid in source_ids])
+
+    result = await execute_query(query)
+    sources = result.data or []
+
+    content_parts = []
+    remaining = max_chars
+    for source in sources:
+        if source["type"] == "text" and source.get("content"):
+            part = source["content"]
+        elif source.get("summary"):
+            part = source["summary"]
+        else:
+            continue
+
+        if content_parts:
+            remaining -= 2  # "\n\n" separator
+        if remaining <= 0:
+            break
+        # Slicing only copies the one part that crosses the cap
+        if len(part) > remaining:
+            part = part[:remaining]
+        content_parts.append(part)
+        remaining -= len(part)
+
+    return "\n\n".join(content_parts), sources
+
+
+def parse_json_response(text: str) -> dict:
+    """Parse JSON from Gemini response, handling markdown code blocks.
+
+    Near-valid output (trailing commas, truncated closing brackets, prose
+    around the JSON) is repaired with json_repair when it is installed.
+    """
+    global json_repair_count
+
+    match = JSON_FENCE_RE.search(text)
+    payload = match.group(1) if match else text
+
+    try:
+        return orjson.loads(payload.strip())
+    except orjson.JSONDecodeError:
+        pass
+
+    if json_repair is not None:
+        # A truncated response can leave an opening fence with no closing one
+        repaired = json_repair.loads(payload if match else OPEN_FENCE_RE.sub("", text, count=1))
+        if isinstance(repaired, (dict, list)) and repaired:
+            json_repair_count += 1
+            print(f"Repaired malformed JSON response (total repaired: {json_repair_count})")
+            return repaired
+
+    return {"error": "Failed to parse response", "raw": payload}
+
+
+def parse_json_object(text: str) -> dict:
+    """Parse a response that should be a JSON object.
+
+    Models sometimes wrap the object in a one-item array; that is unwrapped.
+    Any other non-object raises ValueError.
+    """
+    data = parse_json_response(text)
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data
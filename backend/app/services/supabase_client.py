@@ -1,14 +1,98 @@
-from supabase import create_client, Client
+import asyncio
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, List, Optional, TypeVar
+
+import httpx
+from supabase import create_client, Client, ClientOptions
 from app.config import get_settings
 
 settings = get_settings()
 
+T = TypeVar("T")
+
+
+def _log_new_connections(request: httpx.Request) -> None:
+    """Debug request hook: log TCP/TLS setup, so a request that logs nothing reused a pooled connection."""
+    def trace(event_name: str, info: dict) -> None:
+        if event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            print(f"Supabase pool: new connection ({event_name}) for {request.url.host}")
+
+    request.extensions["trace"] = trace
+
 
+def _pooled_client_options() -> Optional[ClientOptions]:
+    """Client options with a keep-alive httpx pool sized for concurrent requests.
+
+    Returns None on supabase-py releases without the httpx_client option, which
+    then keep their own default pool.
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_connections,
+            max_keepalive_connections=settings.supabase_max_keepalive_connections,
+            keepalive_expiry=30,
+        ),
+        timeout=30.0,
+        event_hooks={"request": [_log_new_connections]} if settings.debug else None,
+    )
+    try:
+        return ClientOptions(httpx_client=http_client)
+    except TypeError:
+        http_client.close()
+        return None
+
+
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
-    """Get Supabase client with service role key for backend operations."""
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    """Get the shared Supabase client with service role key for backend operations.
+
+    The client is created once per process so its HTTP connection pool is reused.
+    """
+    options = _pooled_client_options()
+    if options is None:
+        return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    return create_client(settings.supabase_url, settings.supabase_service_role_key, options=options)
 
 
+@lru_cache(maxsize=1)
 def get_supabase_anon_client() -> Client:
-    """Get Supabase client with anon key for user-facing operations."""
+    """Get the shared Supabase client with anon key for user-facing operations."""
     return create_client(settings.supabase_url, settings.supabase_anon_key)
+
+
+async def run_sync(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking supabase-py call (e.g. a storage operation) in the default thread pool.
+
+    supabase-py v2 uses a synchronous httpx client, so calling it directly from
+    an async handler blocks the event loop for the whole round-trip.
+    """
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def execute_query(query: Any) -> Any:
+    """Execute a supabase-py query builder without blocking the event loop."""
+    return await asyncio.to_thread(query.execute)
+
+
+async def upload_storage_object(bucket: str, path: str, chunks: List[bytes], content_type: str) -> None:
+    """Upload an object to Supabase Storage from a list of byte chunks.
+
+    The chunks are streamed as the request body instead of being joined into
+    one buffer first, as supabase-py's upload requires.
+    """
+    async def body() -> AsyncIterator[bytes]:
+        for chunk in chunks:
+            yield chunk
+
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        response = await client.post(
+            f"{settings.supabase_url}/storage/v1/object/{bucket}/{path}",
+            content=body(),
+            headers={
+                "apikey": settings.supabase_service_role_key,
+                "Authorization": f"Bearer {settings.supabase_service_role_key}",
+                "Content-Type": content_type,
+                "Content-Length": str(sum(len(chunk) for chunk in chunks)),
+            },
+        )
+        response.raise_for_status()
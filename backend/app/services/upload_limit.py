@@ -0,0 +1,60 @@
+"""ASGI middleware that rejects oversized multipart uploads before they are parsed."""
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """Cap multipart/form-data request bodies at max_bytes (plus multipart overhead).
+
+    A declared Content-Length over the cap is answered with 413 before the
+    body is read. Bodies without one (chunked) are counted as they arrive
+    and fail with 413 once they pass the cap, so nothing larger is spooled.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.detail = f"File too large (max {max_bytes // (1024 * 1024)}MB)"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._header(scope, b"content-length")
+        if content_length.isdigit() and int(content_length) > self.limit:
+            response = ORJSONResponse(
+                status_code=413,
+                content={"error": {"code": 413, "message": self.detail}},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Raised inside the route's body parsing, so the app's
+                    # HTTPException handler renders the 413
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _header(scope, name: bytes) -> str:
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1")
+        return ""
+
+    def _is_multipart(self, scope) -> bool:
+        return self._header(scope, b"content-type").lower().startswith("multipart/form-data")
@@ -0,0 +1,8 @@
+import os
+
+# Settings are read at import time; the tests never reach these services
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-role-key")
+os.environ.setdefault("GOOGLE_API_KEY", "test-google-api-key")
+os.environ.setdefault("REDIS_URL", "")
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.main import app
+from app.routers import api_keys
+from app.services.auth import API_KEY_LENGTH, API_KEY_PREFIX, hash_api_key
+
+client = TestClient(app)
+
+
+def auth_headers(user_id="user-1"):
+    # Signatures are not verified, so any key produces a usable token
+    return {"Authorization": f"Bearer {jwt.encode({'sub': user_id}, 'test', algorithm='HS256')}"}
+
+
+def test_create_api_key_returns_the_key_once_and_stores_its_hash(monkeypatch):
+    inserted = []
+
+    async def execute_query(query):
+        return SimpleNamespace(data=[{**inserted[-1], "id": "key-1"}])
+
+    class FakeTable:
+        def insert(self, data):
+            inserted.append(data)
+            return self
+
+    monkeypatch.setattr(api_keys, "get_supabase_client", lambda: SimpleNamespace(table=lambda name: FakeTable()))
+    monkeypatch.setattr(api_keys, "execute_query", execute_query)
+
+    response = client.post("/api/v1/api-keys", json={"name": "CI"}, headers=auth_headers())
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    key = data["key"]
+    assert key.startswith(API_KEY_PREFIX) and len(key) == API_KEY_LENGTH
+    assert inserted[0]["user_id"] == "user-1"
+    assert inserted[0]["key_hash"] == hash_api_key(key)
+    assert key not in inserted[0].values()
+
+
+def test_create_api_key_requires_authentication():
+    response = client.post("/api/v1/api-keys", json={"name": "CI"})
+
+    assert response.status_code == 401
+    assert response.json()["error"]["code"] == 401
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import auth
+
+
+@pytest.fixture(autouse=True)
+def clear_rate_limits():
+    auth.rate_limit_store.clear()
+    yield
+    auth.rate_limit_store.clear()
+
+
+def check(key_id, rpm=2, rpd=100):
+    return asyncio.run(auth.check_rate_limit(key_id, rpm, rpd))
+
+
+def test_in_memory_rate_limit_blocks_after_the_minute_limit(monkeypatch):
+    monkeypatch.setattr(auth, "get_rate_limit_script", lambda: None)
+
+    assert check("key-1") and check("key-1")
+    with pytest.raises(HTTPException) as exc:
+        check("key-1")
+
+    assert exc.value.status_code == 429
+    assert "Retry-After" in exc.value.headers
+
+
+@pytest.mark.parametrize("error", [auth.RedisError("connection refused"), OSError("timed out")])
+def test_rate_limit_falls_back_to_memory_when_redis_fails(monkeypatch, error):
+    async def failing_script(keys, args):
+        raise error
+
+    monkeypatch.setattr(auth, "get_rate_limit_script", lambda: failing_script)
+
+    assert check("key-2") and check("key-2")
+    with pytest.raises(HTTPException) as exc:
+        check("key-2")
+    assert exc.value.status_code == 429
+
+
+def test_rate_limit_uses_redis_result_when_available(monkeypatch):
+    results = iter([0, 1])
+
+    async def script(keys, args):
+        return next(results)
+
+    monkeypatch.setattr(auth, "get_rate_limit_script", lambda: script)
+
+    assert check("key-3")
+    with pytest.raises(HTTPException):
+        check("key-3")
+    assert "key-3" not in auth.rate_limit_store
+
+
+def test_invalidate_api_key_drops_every_cached_row_for_the_key():
+    auth._api_key_cache["hash-a"] = {"id": "key-1"}
+    auth._api_key_cache["hash-b"] = {"id": "key-1"}
+    auth._api_key_cache["hash-c"] = {"id": "key-2"}
+
+    auth.invalidate_api_key("key-1")
+
+    assert "hash-a" not in auth._api_key_cache
+    assert "hash-b" not in auth._api_key_cache
+    assert "hash-c" in auth._api_key_cache
+    auth._api_key_cache.clear()
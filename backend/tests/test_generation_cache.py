@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from app.services import generation_cache
+
+
+@pytest.fixture
+def persisted(monkeypatch):
+    rows = {}
+
+    async def load_persisted(key):
+        return rows.get(key)
+
+    async def persist(key, result):
+        rows[key] = result
+
+    monkeypatch.setattr(generation_cache, "_load_persisted", load_persisted)
+    monkeypatch.setattr(generation_cache, "_persist", persist)
+    generation_cache._generation_cache.clear()
+    yield rows
+    generation_cache._generation_cache.clear()
+
+
+def generator(content):
+    calls = []
+
+    async def generate_flashcards(**params):
+        calls.append(params)
+        return {"content": content, "usage": {"input_tokens": 10, "output_tokens": 5, "cost_usd": 0.01}}
+
+    return generate_flashcards, calls
+
+
+def run(generate, **kwargs):
+    return asyncio.run(generation_cache.cached_generate(generate, content="sources", **kwargs))
+
+
+def test_parsed_results_are_cached_and_reported_as_free(persisted):
+    generate, calls = generator('[{"question": "Q", "answer": "A"}]')
+
+    first = run(generate, expect=list)
+    second = run(generate, expect=list)
+
+    assert len(calls) == 1
+    assert len(persisted) == 1
+    assert first["usage"]["cost_usd"] == 0.01
+    assert second["usage"] == {**first["usage"], "cost_usd": 0.0, "cache_hit": True}
+
+
+def test_persisted_results_are_shared_across_workers(persisted):
+    generate, calls = generator('[{"question": "Q", "answer": "A"}]')
+    run(generate, expect=list)
+
+    # Another worker has an empty memory cache but the same gen_cache table
+    generation_cache._generation_cache.clear()
+    result = run(generate, expect=list)
+
+    assert len(calls) == 1
+    assert result["usage"]["cache_hit"] is True
+
+
+@pytest.mark.parametrize("content, expect", [
+    ("I could not find enough material.", list),
+    ('{"error": "Failed"}', dict),
+    ('{"question": "Q"}', list),
+    ("[]", list),
+    ("", None),
+])
+def test_unusable_results_are_not_cached(persisted, content, expect):
+    generate, calls = generator(content)
+
+    run(generate, expect=expect)
+    run(generate, expect=expect)
+
+    assert len(calls) == 2
+    assert persisted == {}
+
+
+def test_regenerate_skips_the_cache_and_replaces_the_result(persisted):
+    generate, calls = generator('[{"question": "Q", "answer": "A"}]')
+    run(generate, expect=list)
+
+    regenerated = run(generate, expect=list, regenerate=True)
+    cached = run(generate, expect=list)
+
+    assert len(calls) == 2
+    assert "cache_hit" not in regenerated["usage"]
+    assert cached["usage"]["cache_hit"] is True
+
+
+def test_different_options_miss_the_cache(persisted):
+    generate, calls = generator('[{"question": "Q", "answer": "A"}]')
+
+    run(generate, expect=list, count=10)
+    run(generate, expect=list, count=20)
+
+    assert len(calls) == 2
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import notebook_access
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    async def load_sources_content(notebook_id, source_ids, max_chars):
+        calls.append(notebook_id)
+        await asyncio.sleep(0.01)
+        return f"content {len(calls)}", [{"id": f"source-{len(calls)}"}]
+
+    monkeypatch.setattr(notebook_access, "_load_sources_content", load_sources_content)
+    notebook_access._sources_cache.clear()
+    yield calls
+    notebook_access._sources_cache.clear()
+
+
+def get(notebook_id="nb-1"):
+    return notebook_access.get_sources_content(notebook_id)
+
+
+def test_concurrent_calls_share_one_query(loads):
+    async def run():
+        return await asyncio.gather(get(), get())
+
+    first, second = asyncio.run(run())
+
+    assert len(loads) == 1
+    assert first == second
+
+
+def test_callers_get_their_own_copy_of_the_sources(loads):
+    _, sources = asyncio.run(get())
+    sources.append({"id": "extra"})
+    sources[0]["id"] = "changed"
+
+    _, again = asyncio.run(get())
+
+    assert len(loads) == 1
+    assert again == [{"id": "source-1"}]
+
+
+def test_invalidation_drops_only_that_notebook(loads):
+    asyncio.run(get("nb-1"))
+    asyncio.run(get("nb-2"))
+
+    notebook_access.invalidate_sources_content("nb-1")
+    content, _ = asyncio.run(get("nb-1"))
+    asyncio.run(get("nb-2"))
+
+    assert content == "content 3"
+    assert loads == ["nb-1", "nb-2", "nb-1"]
+
+
+def test_query_in_flight_during_invalidation_is_not_cached(loads):
+    async def run():
+        pending = asyncio.ensure_future(get())
+        await asyncio.sleep(0)
+        notebook_access.invalidate_sources_content("nb-1")
+        await pending
+        return await get()
+
+    content, _ = asyncio.run(run())
+
+    assert content == "content 2"
+
+
+def test_load_notebook_and_sources_runs_the_check_that_was_asked_for(loads, monkeypatch):
+    async def verify_notebook_access(notebook_id, user_id):
+        return {"id": notebook_id, "persona_instructions": ""}
+
+    async def verify_notebook_access_only(notebook_id, user_id):
+        raise HTTPException(status_code=404, detail="Notebook not found")
+
+    monkeypatch.setattr(notebook_access, "verify_notebook_access", verify_notebook_access)
+    monkeypatch.setattr(notebook_access, "verify_notebook_access_only", verify_notebook_access_only)
+
+    notebook, content, sources = asyncio.run(notebook_access.load_notebook_and_sources("nb-1", "user-1"))
+    assert notebook["id"] == "nb-1"
+    assert content == "content 1"
+    assert sources == [{"id": "source-1"}]
+
+    with pytest.raises(HTTPException):
+        asyncio.run(notebook_access.load_notebook_and_sources("nb-1", "user-2", with_settings=False))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"title": "Deck"}', {"title": "Deck"}),
+    ('```json\n[{"title": "Deck"}]\n```', {"title": "Deck"}),
+])
+def test_parse_json_object_accepts_objects(text, expected):
+    assert notebook_access.parse_json_object(text) == expected
+
+
+@pytest.mark.parametrize("text", ['[{"a": 1}, {"b": 2}]', '"just a string"', "[]"])
+def test_parse_json_object_rejects_other_json(text):
+    with pytest.raises(ValueError):
+        notebook_access.parse_json_object(text)
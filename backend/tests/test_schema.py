@@ -0,0 +1,48 @@
+"""Static checks on supabase/schema.sql for functions exposed over PostgREST RPC."""
+
+import re
+from pathlib import Path
+
+import pytest
+
+SCHEMA = (Path(__file__).resolve().parents[2] / "supabase" / "schema.sql").read_text()
+
+# Every function in the public schema is callable at /rest/v1/rpc/<name> by
+# default, so these are restricted to the service role
+SERVICE_ROLE_RPCS = {
+    "increment_api_key_usage": "UUID[], BIGINT[], TIMESTAMPTZ",
+    "create_session_with_messages": "UUID, UUID, TEXT, TEXT, TEXT",
+    "delete_source_row": "UUID, UUID",
+}
+
+FUNCTION_RE = re.compile(
+    r"CREATE OR REPLACE FUNCTION (\w+)\(.*?\$\$ LANGUAGE plpgsql([^;]*);", re.S
+)
+
+
+def function_options():
+    return {name: options for name, options in FUNCTION_RE.findall(SCHEMA)}
+
+
+@pytest.mark.parametrize("name, signature", SERVICE_ROLE_RPCS.items())
+def test_rpc_is_only_executable_by_the_service_role(name, signature):
+    assert f"REVOKE EXECUTE ON FUNCTION {name}({signature}) FROM PUBLIC, anon, authenticated;" in SCHEMA
+    assert f"GRANT EXECUTE ON FUNCTION {name}({signature}) TO service_role;" in SCHEMA
+
+
+@pytest.mark.parametrize("name", SERVICE_ROLE_RPCS)
+def test_rpc_runs_with_the_callers_rights_and_a_fixed_search_path(name):
+    options = function_options()[name]
+
+    assert "SECURITY INVOKER" in options
+    assert "SET search_path = public" in options
+
+
+def test_security_definer_functions_pin_search_path():
+    # handle_new_user only touches public.profiles, which it schema-qualifies
+    unpinned = [
+        name for name, options in function_options().items()
+        if "SECURITY DEFINER" in options and "search_path" not in options and name != "handle_new_user"
+    ]
+
+    assert unpinned == []
@@ -0,0 +1,198 @@
+import base64
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.main import app
+from app.routers import sources
+
+NOTEBOOK_ID = "11111111-1111-1111-1111-111111111111"
+SOURCE_ID = "22222222-2222-2222-2222-222222222222"
+
+client = TestClient(app)
+
+
+def auth_headers(user_id="user-1"):
+    # Signatures are not verified, so any key produces a usable token
+    return {"Authorization": f"Bearer {jwt.encode({'sub': user_id}, 'test', algorithm='HS256')}"}
+
+
+class FakeQuery:
+    """Records supabase-py query builder calls; execute_query returns `rows`."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, *args, kwargs) if kwargs else (name, *args))
+            return self
+        return call
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    calls = SimpleNamespace(rpc=[], removed=[], invalidated=[], rows=[], query=None)
+
+    class FakeBucket:
+        def remove(self, paths):
+            calls.removed.extend(paths)
+
+    def rpc(name, params):
+        calls.rpc.append((name, params))
+        return FakeQuery(calls.rows)
+
+    def table(name):
+        calls.query = FakeQuery(calls.rows)
+        return calls.query
+
+    async def execute_query(query):
+        return SimpleNamespace(data=query.rows)
+
+    async def verify_notebook_access_only(notebook_id, user_id):
+        return None
+
+    supabase = SimpleNamespace(rpc=rpc, table=table, storage=SimpleNamespace(from_=lambda bucket: FakeBucket()))
+    monkeypatch.setattr(sources, "get_supabase_client", lambda: supabase)
+    monkeypatch.setattr(sources, "execute_query", execute_query)
+    monkeypatch.setattr(sources, "verify_notebook_access_only", verify_notebook_access_only)
+    monkeypatch.setattr(sources, "invalidate_sources_content", calls.invalidated.append)
+    return calls
+
+
+def delete():
+    return client.delete(f"/api/v1/notebooks/{NOTEBOOK_ID}/sources/{SOURCE_ID}", headers=auth_headers())
+
+
+def test_delete_source_removes_an_unshared_object(storage):
+    storage.rows = [{"path": "user-1/abc.pdf", "shared": False}]
+
+    response = delete()
+
+    assert response.status_code == 200
+    assert storage.rpc == [("delete_source_row", {"sid": SOURCE_ID, "nb": NOTEBOOK_ID})]
+    assert storage.removed == ["user-1/abc.pdf"]
+    assert [str(n) for n in storage.invalidated] == [NOTEBOOK_ID]
+
+
+def test_delete_source_keeps_an_object_another_source_uses(storage):
+    storage.rows = [{"path": "user-1/abc.pdf", "shared": True}]
+
+    response = delete()
+
+    assert response.status_code == 200
+    assert storage.removed == []
+
+
+def test_delete_source_without_a_file_skips_storage(storage):
+    storage.rows = [{"path": None, "shared": False}]
+
+    assert delete().status_code == 200
+    assert storage.removed == []
+
+
+def test_delete_missing_source_is_not_found(storage):
+    storage.rows = []
+
+    response = delete()
+
+    assert response.status_code == 404
+    assert storage.invalidated == []
+
+
+def source_row(n):
+    return {"id": f"00000000-0000-0000-0000-{n:012d}", "created_at": f"2026-01-01T00:00:{n:02d}+00:00"}
+
+
+def list_sources(**params):
+    return client.get(f"/api/v1/notebooks/{NOTEBOOK_ID}/sources", params=params, headers=auth_headers())
+
+
+def test_list_sources_returns_a_cursor_when_more_rows_remain(storage):
+    storage.rows = [source_row(n) for n in (3, 2, 1)]
+
+    response = list_sources(limit=2)
+
+    body = response.json()
+    assert [s["id"] for s in body["data"]] == [source_row(3)["id"], source_row(2)["id"]]
+    assert body["meta"]["next_cursor"] == sources.encode_cursor(source_row(2)["created_at"], source_row(2)["id"])
+    # One extra row tells whether another page exists
+    assert ("limit", 3) in storage.query.calls
+    assert [c for c in storage.query.calls if c[0] == "order"] == [
+        ("order", "created_at", {"desc": True}),
+        ("order", "id", {"desc": True}),
+    ]
+
+
+def test_list_sources_last_page_has_no_cursor(storage):
+    storage.rows = [source_row(1)]
+
+    response = list_sources(limit=2)
+
+    assert response.json()["meta"]["next_cursor"] is None
+
+
+def test_list_sources_continues_after_the_cursor(storage):
+    row = source_row(2)
+    storage.rows = []
+
+    list_sources(cursor=sources.encode_cursor(row["created_at"], row["id"]))
+
+    [keyset] = [c[1] for c in storage.query.calls if c[0] == "or_"]
+    assert keyset == (
+        f'created_at.lt."{row["created_at"]}",'
+        f'and(created_at.eq."{row["created_at"]}",id.lt.{row["id"]})'
+    )
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"yesterday|00000000-0000-0000-0000-000000000001").decode(),
+    base64.urlsafe_b64encode(b'2026-01-01T00:00:00|1),or(id.gt.0').decode(),
+])
+def test_list_sources_rejects_malformed_cursors(storage, cursor):
+    response = list_sources(cursor=cursor)
+
+    assert response.status_code == 400
+    assert response.json()["error"]["code"] == 400
+    assert storage.query is None or not any(c[0] == "or_" for c in storage.query.calls)
+
+
+def test_batch_inserts_every_source_in_one_statement(storage, monkeypatch):
+    ingested = []
+    monkeypatch.setattr(sources, "ingest_sources", lambda rows: ingested.extend(rows))
+    storage.rows = [
+        {"id": "s1", "type": "text", "content": "Body text", "status": "processing"},
+        {"id": "s2", "type": "youtube", "content": None, "status": "processing"},
+    ]
+
+    response = client.post(f"/api/v1/notebooks/{NOTEBOOK_ID}/sources/batch", json={"sources": [
+        {"type": "text", "content": "Body text"},
+        {"type": "youtube", "url": "https://youtu.be/dQw4w9WgXcQ"},
+    ]}, headers=auth_headers())
+
+    assert response.status_code == 200
+    [(_, rows)] = [c for c in storage.query.calls if c[0] == "insert"]
+    assert [row["name"] for row in rows] == ["Body text", "YouTube: dQw4w9WgXcQ"]
+    assert rows[1]["metadata"] == {"url": "https://youtu.be/dQw4w9WgXcQ", "video_id": "dQw4w9WgXcQ"}
+    # The response leaves out the content; the background ingest gets it
+    assert all("content" not in s for s in response.json()["data"])
+    assert [s["content"] for s in ingested] == ["Body text", None]
+
+
+@pytest.mark.parametrize("item, detail", [
+    ({"type": "text"}, "Text sources require content"),
+    ({"type": "url"}, "url sources require a url"),
+])
+def test_batch_rejects_incomplete_sources_before_inserting(storage, item, detail):
+    response = client.post(
+        f"/api/v1/notebooks/{NOTEBOOK_ID}/sources/batch", json={"sources": [item]}, headers=auth_headers()
+    )
+
+    assert response.status_code == 400
+    assert response.json()["error"]["message"] == detail
+    assert storage.query is None
@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.routers.sources import spool_upload
+from app.services.upload_limit import MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware
+
+MAX_BYTES = 1024
+
+app = FastAPI()
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_BYTES)
+
+
+@app.post("/upload")
+async def upload(request: Request):
+    tmp_path, size, digest, filename, content_type = await spool_upload(request, MAX_BYTES)
+    try:
+        with open(tmp_path, "rb") as f:
+            body = f.read()
+    finally:
+        os.unlink(tmp_path)
+    return {"size": size, "sha256": digest, "filename": filename, "body_matches": len(body) == size,
+            "suffix": os.path.splitext(tmp_path)[1]}
+
+
+@app.post("/echo")
+async def echo(request: Request):
+    return {"size": len(await request.body())}
+
+
+client = TestClient(app)
+
+
+def test_spool_upload_writes_the_file_once_and_hashes_it():
+    data = b"hello world\n" * 20
+
+    response = client.post("/upload", files={"file": ("Notes.TXT", data, "text/plain")})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "filename": "Notes.TXT",
+        "body_matches": True,
+        "suffix": ".txt",
+    }
+
+
+def test_spool_upload_rejects_a_file_over_the_limit():
+    response = client.post("/upload", files={"file": ("big.txt", b"x" * (MAX_BYTES + 1), "text/plain")})
+
+    assert response.status_code == 413
+
+
+def test_spool_upload_requires_a_file_part():
+    response = client.post("/upload", data={"name": "no file"}, files={"other": ("a.txt", b"a", "text/plain")})
+
+    assert response.status_code == 422
+
+
+def test_middleware_rejects_a_declared_oversized_body_before_reading_it():
+    body = b"x" * (MAX_BYTES + MULTIPART_OVERHEAD_BYTES + 1)
+
+    response = client.post("/echo", content=body, headers={"Content-Type": "multipart/form-data; boundary=b"})
+
+    assert response.status_code == 413
+    assert response.json()["error"]["code"] == 413
+
+
+def test_middleware_counts_chunked_bodies():
+    def chunks():
+        # No Content-Length, so the middleware has to count as it reads
+        for _ in range((MAX_BYTES + MULTIPART_OVERHEAD_BYTES) // 1024 + 1):
+            yield b"x" * 1024
+
+    response = client.post("/echo", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+
+    assert response.status_code == 413
+
+
+def test_middleware_ignores_other_content_types():
+    body = b"x" * (MAX_BYTES + MULTIPART_OVERHEAD_BYTES + 1)
+
+    response = client.post("/echo", content=body, headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 200
+    assert response.json() == {"size": len(body)}
@@ -308,9 +308,9 @@ export async function POST(request: NextRequest, { params }: { params: Promise<{
         filePath: source.file_path || undefined,
       };
 
-      // Handle sources with extracted content in metadata (text, url, youtube all store content here)
-      if (source.metadata?.content) {
-        sourceInfo.content = String(source.metadata.content).slice(0, MAX_SOURCE_CHARS);
+      // Handle sources with extracted content (text, url, youtube all store it in the content column)
+      if (source.content) {
+        sourceInfo.content = String(source.content).slice(0, MAX_SOURCE_CHARS);
       }
       // Handle file sources (PDF, TXT, etc.)
       else if (source.file_path) {
@@ -234,13 +234,10 @@ This export can be used as a backup or for migration.
           }
 
           // For text sources, save content
-          if (source.type === 'text' && source.metadata) {
-            const metadata = source.metadata as Record<string, unknown>;
-            if (metadata.content) {
-              const filename = `${source.id}.txt`;
-              zip.file(`${folderName}/sources/text/${filename}`, metadata.content as string);
-              sourceInfo.exported_file = `text/${filename}`;
-            }
+          if (source.type === 'text' && source.content) {
+            const filename = `${source.id}.txt`;
+            zip.file(`${folderName}/sources/text/${filename}`, source.content as string);
+            sourceInfo.exported_file = `text/${filename}`;
           }
         }
 
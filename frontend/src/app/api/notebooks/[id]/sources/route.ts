@@ -74,7 +74,8 @@ export async function POST(request: NextRequest, { params }: { params: Promise<{
           type: 'text',
           name: name || 'Pasted Text',
           status: 'ready',
-          metadata: { content: content?.slice(0, 100000) },
+          content: content?.slice(0, 100000),
+          metadata: {},
         })
         .select()
         .single();
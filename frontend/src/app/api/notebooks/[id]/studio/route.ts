@@ -67,8 +67,8 @@ async function getSourceContent(notebookId: string, sourceIds?: string[]) {
       parts.push(`## ${s.name}`);
 
       // Add text content if available
-      if (s.type === 'text' && s.metadata?.content) {
-        parts.push(s.metadata.content);
+      if (s.type === 'text' && s.content) {
+        parts.push(s.content);
       }
 
       // Add source guide summary if available
@@ -116,8 +116,8 @@ export async function POST(request: NextRequest, { params }: { params: Promise<{
         const parts: string[] = [];
         parts.push(`## ${s.name}`);
 
-        if (s.type === 'text' && s.metadata?.content) {
-          parts.push(s.metadata.content);
+        if (s.type === 'text' && s.content) {
+          parts.push(s.content);
         }
 
         if (s.source_guide?.summary) {
@@ -126,9 +126,9 @@ export function SourceViewerContent({ source, onReprocessed }: SourceViewerConte
   const sourceGuide = source.source_guide;
   const topics = sourceGuide?.topics ?? [];
   const suggestedQuestions = sourceGuide?.suggested_questions ?? [];
-  const hasContent = !!meta.content;
+  const hasContent = !!source.content;
   const hasUrl = !!meta.url;
-  const contentStr = meta.content ? String(meta.content) : '';
+  const contentStr = source.content ?? '';
   const urlStr = meta.url ? String(meta.url) : '';
 
   // Fetch signed URL for file-based sources
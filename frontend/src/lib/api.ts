@@ -189,43 +189,47 @@ export const studyApi = {
   async generateFlashcards(
     notebookId: string,
     sourceIds?: string[],
-    count = 10
+    count = 10,
+    regenerate = false
   ): Promise<ApiResponse<{ flashcards: Flashcard[] }>> {
     return fetchWithAuth(`/api/v1/notebooks/${notebookId}/flashcards`, {
       method: 'POST',
-      body: JSON.stringify({ source_ids: sourceIds, count }),
+      body: JSON.stringify({ source_ids: sourceIds, count, regenerate }),
     });
   },
 
   async generateQuiz(
     notebookId: string,
     sourceIds?: string[],
-    questionCount = 10
+    questionCount = 10,
+    regenerate = false
   ): Promise<ApiResponse<{ questions: QuizQuestion[] }>> {
     return fetchWithAuth(`/api/v1/notebooks/${notebookId}/quiz`, {
       method: 'POST',
-      body: JSON.stringify({ source_ids: sourceIds, question_count: questionCount }),
+      body: JSON.stringify({ source_ids: sourceIds, question_count: questionCount, regenerate }),
     });
   },
 
   async generateStudyGuide(
     notebookId: string,
-    sourceIds?: string[]
+    sourceIds?: string[],
+    regenerate = false
   ): Promise<ApiResponse<StudyGuide>> {
     return fetchWithAuth(`/api/v1/notebooks/${notebookId}/study-guide`, {
       method: 'POST',
-      body: JSON.stringify({ source_ids: sourceIds }),
+      body: JSON.stringify({ source_ids: sourceIds, regenerate }),
     });
   },
 
   async generateFaq(
     notebookId: string,
     sourceIds?: string[],
-    count = 10
+    count = 10,
+    regenerate = false
   ): Promise<ApiResponse<{ faqs: FAQ[] }>> {
     return fetchWithAuth(`/api/v1/notebooks/${notebookId}/faq`, {
       method: 'POST',
-      body: JSON.stringify({ source_ids: sourceIds, count }),
+      body: JSON.stringify({ source_ids: sourceIds, count, regenerate }),
     });
   },
 };
@@ -34,6 +34,7 @@ export interface Source {
   mime_type: string | null;
   file_size_bytes: number | null;
   token_count: number | null;
+  content?: string | null;
   metadata: Record<string, unknown>;
   source_guide: {
     summary?: string;
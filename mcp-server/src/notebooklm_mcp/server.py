@@ -5,10 +5,14 @@ Exposes research intelligence tools for LLMs via Model Context Protocol.
 """
 
 import os
-import json
+import re
 import asyncio
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import hashlib
+import time
+from typing import Optional, List, Dict, Any, Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import uuid
 
 from mcp.server import Server
@@ -16,6 +20,10 @@ from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 from pydantic import BaseModel
 from dotenv import load_dotenv
+import fastjsonschema
+import httpx
+import orjson
+from supabase import create_client, ClientOptions
 
 # Load environment variables
 load_dotenv()
@@ -31,46 +39,85 @@ SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL"
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-_supabase_client = None
-_gemini_configured = False
-
+# Indent tool results for reading while debugging; compact otherwise
+PRETTY_JSON = os.getenv("MCP_PRETTY_JSON", "").lower() in ("1", "true", "yes")
 
+# lru_cache serializes the first call, so concurrent tool calls share one
+# client / one genai.configure instead of racing to create their own.
+@lru_cache(maxsize=1)
 def get_supabase():
     """Get or create Supabase client."""
-    global _supabase_client
-    if _supabase_client is None:
-        if not SUPABASE_URL or not SUPABASE_KEY:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
-        from supabase import create_client
-        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    return _supabase_client
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+
+    # One keep-alive pool for the process; over HTTP/2, concurrent queries
+    # from worker threads share a connection instead of each opening one
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30),
+        timeout=30.0,
+        http2=True,
+    )
+    try:
+        options = ClientOptions(httpx_client=http_client)
+    except TypeError:  # supabase-py releases without httpx_client keep their own pool
+        http_client.close()
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
 
 
+@lru_cache(maxsize=1)
 def configure_gemini():
-    """Configure Gemini API."""
-    global _gemini_configured
-    if not _gemini_configured:
-        if not GOOGLE_API_KEY:
-            raise ValueError("GOOGLE_API_KEY must be set")
-        import google.generativeai as genai
-        genai.configure(api_key=GOOGLE_API_KEY)
-        _gemini_configured = True
+    """Configure Gemini API and return the configured genai module."""
+    if not GOOGLE_API_KEY:
+        raise ValueError("GOOGLE_API_KEY must be set")
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai
 
 
-# Model pricing (per 1M tokens)
+# Model pricing (per 1M tokens). Keep in step with MODEL_PRICING in
+# backend/app/services/gemini.py so usage is billed the same through both.
 MODEL_PRICING = {
-    "gemini-2.5-flash": {"input": 0.15, "output": 0.60},
+    "gemini-2.5-flash": {"input": 0.10, "output": 0.40},
     "gemini-2.5-flash-lite": {"input": 0.075, "output": 0.30},
     "gemini-2.5-pro": {"input": 1.25, "output": 10.0},
 }
 
+# Cached input tokens are billed at this fraction of the input price
+CACHED_INPUT_RATE = 0.25
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost in USD."""
-    pricing = MODEL_PRICING.get(model, MODEL_PRICING["gemini-2.5-flash"])
-    input_cost = (input_tokens / 1_000_000) * pricing["input"]
-    output_cost = (output_tokens / 1_000_000) * pricing["output"]
-    return round(input_cost + output_cost, 6)
+# MODEL_PRICING as integer micro-USD per 1M tokens: (input, cached input, output)
+_TOKEN_RATES = {
+    model: (
+        round(pricing["input"] * 1_000_000),
+        round(pricing["input"] * CACHED_INPUT_RATE * 1_000_000),
+        round(pricing["output"] * 1_000_000),
+    )
+    for model, pricing in MODEL_PRICING.items()
+}
+
+
+def calculate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """Calculate cost in USD.
+
+    cached_tokens is the part of input_tokens Gemini served from its cache.
+    """
+    input_rate, cached_rate, output_rate = _TOKEN_RATES.get(model, _TOKEN_RATES["gemini-2.5-flash"])
+    cost = (
+        (input_tokens - cached_tokens) * input_rate
+        + cached_tokens * cached_rate
+        + output_tokens * output_rate
+    )
+    return round(cost / 1_000_000_000_000, 6)
+
+
+@lru_cache(maxsize=32)
+def get_model(model_name: str, system_instruction: Optional[str] = None):
+    """Get or create a Gemini model instance for a model and system instruction."""
+    genai = configure_gemini()
+    if system_instruction:
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    return genai.GenerativeModel(model_name)
 
 
 async def generate_content(
@@ -78,23 +125,25 @@ async def generate_content(
     model_name: str = "gemini-2.5-flash",
     system_instruction: Optional[str] = None,
     temperature: float = 0.7,
+    json_output: bool = False,
 ) -> Dict[str, Any]:
-    """Generate content using Gemini."""
-    configure_gemini()
-    import google.generativeai as genai
-
-    generation_config = genai.GenerationConfig(temperature=temperature)
-
-    if system_instruction:
-        model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
-    else:
-        model = genai.GenerativeModel(model_name)
+    """Generate content using Gemini (same request and usage shape as the backend's GeminiService).
+
+    With json_output, Gemini returns bare JSON instead of a fenced block.
+    """
+    genai = configure_gemini()
+    model = get_model(model_name, system_instruction)
+    generation_config = genai.GenerationConfig(
+        temperature=temperature,
+        response_mime_type="application/json" if json_output else None,
+    )
 
-    response = model.generate_content(prompt, generation_config=generation_config)
+    response = await model.generate_content_async(prompt, generation_config=generation_config)
 
     input_tokens = response.usage_metadata.prompt_token_count
     output_tokens = response.usage_metadata.candidates_token_count
-    cost = calculate_cost(model_name, input_tokens, output_tokens)
+    cached_tokens = getattr(response.usage_metadata, "cached_content_token_count", 0) or 0
+    cost = calculate_cost(model_name, input_tokens, output_tokens, cached_tokens)
 
     return {
         "content": response.text,
@@ -107,6 +156,156 @@ async def generate_content(
     }
 
 
+# Input tokens allowed for source context: the 2.5 models take ~1M, leaving
+# room for the question, instructions and output (as in the backend)
+CONTEXT_TOKEN_BUDGET = 900_000
+
+# Source tokens for study materials, audio scripts, reports and tables
+# (about the 15,000 characters they used to be cut to)
+GENERATOR_TOKEN_BUDGET = 4_000
+
+# Token counts of large contexts by digest, so repeated questions over the
+# same sources pay for count_tokens once
+_token_counts: Dict[str, int] = {}
+
+
+async def count_tokens(text: str, model_name: str = "gemini-2.5-flash") -> int:
+    """Count tokens with the model's tokenizer, or estimate them if that fails."""
+    key = hashlib.blake2b(f"{model_name}\0{text}".encode(), digest_size=16).hexdigest()
+    total_tokens = _token_counts.get(key)
+    if total_tokens is None:
+        try:
+            total_tokens = (await get_model(model_name).count_tokens_async(text)).total_tokens
+        except Exception:
+            return len(text) // 4
+        if len(_token_counts) >= 1024:
+            _token_counts.clear()
+        _token_counts[key] = total_tokens
+    return total_tokens
+
+
+async def fit_context(context: str, model_name: str, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Truncate `context` to about `budget` tokens.
+
+    Only context longer than `budget` characters is counted, since a token
+    covers at least one character.
+    """
+    if len(context) <= budget:
+        return context
+
+    total_tokens = await count_tokens(context, model_name)
+    if total_tokens <= budget:
+        return context
+    return context[: int(len(context) * budget / total_tokens * 0.95)]
+
+
+# How long generated answers and study materials are reused for an
+# identical request; generations are sampled, so not for long
+GENERATION_TTL_SECONDS = 60 * 60
+
+
+def normalize_question(message: str) -> str:
+    """Collapse whitespace so re-asked questions produce the same prompt (and cache key)."""
+    return " ".join(message.split())
+
+
+async def cached_generate_content(*, expect: Optional[type] = None, **params: Any) -> Dict[str, Any]:
+    """generate_content, reusing the stored result of an identical request.
+
+    Results are kept in the gen_cache table (shared with the backend) for
+    GENERATION_TTL_SECONDS. The prompt embeds the source content and the
+    options, so edited or added sources miss the cache on their own. Hits
+    report zero cost and set usage.cache_hit. Empty results, and with
+    `expect` results whose JSON isn't a non-empty value of that type, are
+    returned but not stored.
+    """
+    payload = orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+    key = f"mcp:generate_content:{hashlib.blake2b(payload, digest_size=32).hexdigest()}"
+    supabase = get_supabase()
+    now = datetime.now(timezone.utc)
+
+    try:
+        cached = await asyncio.to_thread(
+            supabase.table("gen_cache")
+            .select("response")
+            .eq("hash", key)
+            .gt("expires_at", now.isoformat())
+            .limit(1)
+            .execute
+        )
+    except Exception:  # A failed read just means regenerating
+        cached = None
+    if cached and cached.data:
+        result = cached.data[0]["response"]
+        return {**result, "usage": {**result["usage"], "cost_usd": 0.0, "cache_hit": True}}
+
+    result = await generate_content(**params)
+    if not is_cacheable(result["content"], expect):
+        return result
+
+    try:
+        await asyncio.to_thread(
+            supabase.table("gen_cache").upsert({
+                "hash": key,
+                "response": result,
+                "expires_at": (now + timedelta(seconds=GENERATION_TTL_SECONDS)).isoformat(),
+            }).execute
+        )
+    except Exception:
+        pass  # Caching is best-effort
+    return result
+
+
+def source_prompt(context: str, task: str) -> str:
+    """A generator prompt over the notebook's sources.
+
+    The sources come first and the task last, so the generators share a
+    byte-identical prefix over the same context for Gemini's implicit
+    caching (as in the backend's GeminiService).
+    """
+    return f"<document>\n{context}\n</document>\n\n<task>\n{task}\n</task>"
+
+
+# Body of the first markdown code fence, with or without a json tag
+JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def extract_json(text: str) -> Any:
+    """Parse the JSON in a model response, fenced or bare.
+
+    Raises ValueError (orjson.JSONDecodeError) when it isn't valid JSON.
+    """
+    match = JSON_FENCE_RE.search(text)
+    return orjson.loads(match.group(1) if match else text)
+
+
+def is_cacheable(content: Optional[str], expect: Optional[type]) -> bool:
+    """Whether generated content is worth storing in gen_cache."""
+    if not content or not content.strip():
+        return False
+    if expect is None:
+        return True
+    try:
+        data = extract_json(content)
+    except ValueError:
+        return False
+    return isinstance(data, expect) and bool(data)
+
+
+# Writes that finish after their tool call has returned; referenced here so
+# the tasks aren't garbage-collected mid-write
+_background_writes: set = set()
+
+
+def run_in_background(write: Awaitable[Any]) -> None:
+    """Run a best-effort database write without holding up the tool result."""
+    task = asyncio.ensure_future(write)
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+    # Retrieve the exception so a failed write isn't reported as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
 # ============================================================================
 # Tool Definitions
 # ============================================================================
@@ -136,7 +335,7 @@ TOOLS = [
                 "user_id": {"type": "string", "description": "The user ID"},
                 "name": {"type": "string", "description": "Notebook name"},
                 "description": {"type": "string", "description": "Optional description"},
-                "emoji": {"type": "string", "description": "Optional emoji icon"}
+                "emoji": {"type": "string", "description": "Optional emoji icon", "default": "📓"}
             },
             "required": ["user_id", "name"]
         }
@@ -349,6 +548,30 @@ TOOLS = [
             "required": ["notebook_id"]
         }
     ),
+    Tool(
+        name="generate_study_bundle",
+        description="Generate several study materials (flashcards, quiz, study guide, FAQ) in one pass over the sources. Cheaper than calling each generator separately.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "notebook_id": {"type": "string", "description": "The notebook ID"},
+                "kinds": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ["flashcards", "quiz", "study_guide", "faq"]},
+                    "minItems": 1,
+                    "uniqueItems": True,
+                    "description": "Materials to generate"
+                },
+                "count": {"type": "integer", "description": "Items per flashcard deck, quiz and FAQ (5-50)", "default": 10},
+                "source_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Optional: specific sources to use"
+                }
+            },
+            "required": ["notebook_id", "kinds"]
+        }
+    ),
 
     # --- Audio Generation ---
     Tool(
@@ -436,7 +659,8 @@ TOOLS = [
                 "tags": {
                     "type": "array",
                     "items": {"type": "string"},
-                    "description": "Optional tags for organization"
+                    "description": "Optional tags for organization",
+                    "default": []
                 }
             },
             "required": ["notebook_id", "user_id", "title", "content"]
@@ -501,6 +725,10 @@ TOOLS = [
     ),
 ]
 
+# Argument validators compiled once from each tool's inputSchema. They also
+# fill in schema defaults, so handlers read defaulted arguments directly.
+TOOL_VALIDATORS = {tool.name: fastjsonschema.compile(tool.inputSchema) for tool in TOOLS}
+
 
 # ============================================================================
 # Tool Handlers
@@ -512,173 +740,165 @@ async def list_tools() -> list[Tool]:
     return TOOLS
 
 
+# orjson encodes datetime and UUID natively; default=str only catches
+# types it has no encoder for
+DUMP_OPTIONS = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if PRETTY_JSON else 0)
+
+
+def dump_result(result: Any) -> str:
+    """Serialize a tool result as compact JSON (indented with MCP_PRETTY_JSON).
+
+    Non-ASCII text (most non-English sources) is kept as-is rather than
+    escaped to \\uXXXX sequences.
+    """
+    return orjson.dumps(result, default=str, option=DUMP_OPTIONS).decode()
+
+
 @server.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """Handle tool calls."""
     try:
+        validate = TOOL_VALIDATORS.get(name)
+        if validate is not None:
+            arguments = validate(arguments or {})
         result = await handle_tool(name, arguments)
-        return [TextContent(type="text", text=json.dumps(result, indent=2, default=str))]
+        return [TextContent(type="text", text=dump_result(result))]
+    except fastjsonschema.JsonSchemaException as e:
+        return [TextContent(type="text", text=dump_result({"error": f"Invalid arguments: {e.message}"}))]
     except Exception as e:
-        return [TextContent(type="text", text=json.dumps({"error": str(e)}, indent=2))]
-
+        return [TextContent(type="text", text=dump_result({"error": str(e)}))]
 
-async def handle_tool(name: str, args: dict) -> dict:
-    """Route tool calls to handlers."""
 
+# Tool name -> adapter from the tool's validated arguments (see
+# TOOL_VALIDATORS) to its implementation.
+# The implementations are defined below; names resolve when a tool is called.
+TOOL_HANDLERS: Dict[str, Callable[[dict], Awaitable[dict]]] = {
     # --- Notebooks ---
-    if name == "list_notebooks":
-        return await list_notebooks(args["user_id"])
-
-    elif name == "create_notebook":
-        return await create_notebook(
-            user_id=args["user_id"],
-            name=args["name"],
-            description=args.get("description"),
-            emoji=args.get("emoji", "📓")
-        )
-
-    elif name == "get_notebook":
-        return await get_notebook(args["notebook_id"])
-
-    elif name == "delete_notebook":
-        return await delete_notebook(args["notebook_id"])
+    "list_notebooks": lambda args: list_notebooks(args["user_id"]),
+    "create_notebook": lambda args: create_notebook(
+        user_id=args["user_id"],
+        name=args["name"],
+        description=args.get("description"),
+        emoji=args["emoji"]
+    ),
+    "get_notebook": lambda args: get_notebook(args["notebook_id"]),
+    "delete_notebook": lambda args: delete_notebook(args["notebook_id"]),
 
     # --- Sources ---
-    elif name == "list_sources":
-        return await list_sources(args["notebook_id"])
-
-    elif name == "add_text_source":
-        return await add_text_source(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            name=args["name"],
-            content=args["content"]
-        )
-
-    elif name == "add_url_source":
-        return await add_url_source(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            url=args["url"]
-        )
-
-    elif name == "add_youtube_source":
-        return await add_youtube_source(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            youtube_url=args["youtube_url"]
-        )
-
-    elif name == "get_source":
-        return await get_source(args["source_id"])
-
-    elif name == "delete_source":
-        return await delete_source(args["source_id"])
+    "list_sources": lambda args: list_sources(args["notebook_id"]),
+    "add_text_source": lambda args: add_text_source(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        name=args["name"],
+        content=args["content"]
+    ),
+    "add_url_source": lambda args: add_url_source(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        url=args["url"]
+    ),
+    "add_youtube_source": lambda args: add_youtube_source(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        youtube_url=args["youtube_url"]
+    ),
+    "get_source": lambda args: get_source(args["source_id"]),
+    "delete_source": lambda args: delete_source(args["source_id"]),
 
     # --- Chat ---
-    elif name == "chat_with_sources":
-        return await chat_with_sources(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            message=args["message"],
-            source_ids=args.get("source_ids"),
-            model=args.get("model", "gemini-2.5-flash")
-        )
-
-    elif name == "global_chat":
-        return await global_chat(
-            user_id=args["user_id"],
-            message=args["message"],
-            notebook_ids=args.get("notebook_ids")
-        )
+    "chat_with_sources": lambda args: chat_with_sources(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        message=args["message"],
+        source_ids=args.get("source_ids"),
+        model=args["model"]
+    ),
+    "global_chat": lambda args: global_chat(
+        user_id=args["user_id"],
+        message=args["message"],
+        notebook_ids=args.get("notebook_ids")
+    ),
 
     # --- Study Materials ---
-    elif name == "generate_flashcards":
-        return await generate_flashcards(
-            notebook_id=args["notebook_id"],
-            count=args.get("count", 10),
-            source_ids=args.get("source_ids")
-        )
-
-    elif name == "generate_quiz":
-        return await generate_quiz(
-            notebook_id=args["notebook_id"],
-            question_count=args.get("question_count", 10),
-            source_ids=args.get("source_ids")
-        )
-
-    elif name == "generate_study_guide":
-        return await generate_study_guide(
-            notebook_id=args["notebook_id"],
-            source_ids=args.get("source_ids")
-        )
-
-    elif name == "generate_faq":
-        return await generate_faq(
-            notebook_id=args["notebook_id"],
-            count=args.get("count", 10),
-            source_ids=args.get("source_ids")
-        )
+    "generate_flashcards": lambda args: generate_flashcards(
+        notebook_id=args["notebook_id"],
+        count=args["count"],
+        source_ids=args.get("source_ids")
+    ),
+    "generate_quiz": lambda args: generate_quiz(
+        notebook_id=args["notebook_id"],
+        question_count=args["question_count"],
+        source_ids=args.get("source_ids")
+    ),
+    "generate_study_guide": lambda args: generate_study_guide(
+        notebook_id=args["notebook_id"],
+        source_ids=args.get("source_ids")
+    ),
+    "generate_faq": lambda args: generate_faq(
+        notebook_id=args["notebook_id"],
+        count=args["count"],
+        source_ids=args.get("source_ids")
+    ),
+    "generate_study_bundle": lambda args: generate_study_bundle(
+        notebook_id=args["notebook_id"],
+        kinds=args["kinds"],
+        count=args["count"],
+        source_ids=args.get("source_ids")
+    ),
 
     # --- Audio ---
-    elif name == "generate_audio_overview":
-        return await generate_audio_overview(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            format_type=args.get("format", "deep_dive"),
-            custom_instructions=args.get("custom_instructions"),
-            source_ids=args.get("source_ids")
-        )
-
-    elif name == "get_audio_status":
-        return await get_audio_status(args["audio_id"])
+    "generate_audio_overview": lambda args: generate_audio_overview(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        format_type=args["format"],
+        custom_instructions=args.get("custom_instructions"),
+        source_ids=args.get("source_ids")
+    ),
+    "get_audio_status": lambda args: get_audio_status(args["audio_id"]),
 
     # --- Research ---
-    elif name == "start_research":
-        return await start_research(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            query=args["query"],
-            mode=args.get("mode", "fast")
-        )
-
-    elif name == "get_research_status":
-        return await get_research_status(args["task_id"])
+    "start_research": lambda args: start_research(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        query=args["query"],
+        mode=args["mode"]
+    ),
+    "get_research_status": lambda args: get_research_status(args["task_id"]),
 
     # --- Notes ---
-    elif name == "create_note":
-        return await create_note(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            title=args["title"],
-            content=args["content"],
-            tags=args.get("tags", [])
-        )
-
-    elif name == "list_notes":
-        return await list_notes(args["notebook_id"])
+    "create_note": lambda args: create_note(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        title=args["title"],
+        content=args["content"],
+        tags=args["tags"]
+    ),
+    "list_notes": lambda args: list_notes(args["notebook_id"]),
 
     # --- Studio ---
-    elif name == "generate_report":
-        return await generate_report(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            title=args["title"],
-            custom_instructions=args.get("custom_instructions"),
-            source_ids=args.get("source_ids")
-        )
+    "generate_report": lambda args: generate_report(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        title=args["title"],
+        custom_instructions=args.get("custom_instructions"),
+        source_ids=args.get("source_ids")
+    ),
+    "generate_data_table": lambda args: generate_data_table(
+        notebook_id=args["notebook_id"],
+        user_id=args["user_id"],
+        title=args["title"],
+        custom_instructions=args.get("custom_instructions"),
+        source_ids=args.get("source_ids")
+    ),
+}
 
-    elif name == "generate_data_table":
-        return await generate_data_table(
-            notebook_id=args["notebook_id"],
-            user_id=args["user_id"],
-            title=args["title"],
-            custom_instructions=args.get("custom_instructions"),
-            source_ids=args.get("source_ids")
-        )
 
-    else:
+async def handle_tool(name: str, args: dict) -> dict:
+    """Route tool calls to handlers."""
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
         raise ValueError(f"Unknown tool: {name}")
+    return await handler(args)
 
 
 # ============================================================================
@@ -688,21 +908,28 @@ async def handle_tool(name: str, args: dict) -> dict:
 async def list_notebooks(user_id: str) -> dict:
     """List all notebooks for a user."""
     supabase = get_supabase()
-    result = supabase.table("notebooks").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute()
+    # source_count is maintained by triggers on the sources table, so one
+    # query returns the counts too. Only the returned columns are selected.
+    result = await asyncio.to_thread(
+        supabase.table("notebooks")
+        .select("id, name, description, emoji, source_count, created_at, updated_at")
+        .eq("user_id", user_id)
+        .order("updated_at", desc=True)
+        .execute
+    )
 
-    notebooks = []
-    for nb in result.data:
-        # Get source count
-        sources = supabase.table("sources").select("id", count="exact").eq("notebook_id", nb["id"]).execute()
-        notebooks.append({
+    notebooks = [
+        {
             "id": nb["id"],
             "name": nb["name"],
             "description": nb.get("description"),
             "emoji": nb.get("emoji", "📓"),
-            "source_count": sources.count or 0,
+            "source_count": nb.get("source_count", 0),
             "created_at": nb["created_at"],
             "updated_at": nb["updated_at"]
-        })
+        }
+        for nb in result.data
+    ]
 
     return {"notebooks": notebooks, "count": len(notebooks)}
 
@@ -719,7 +946,7 @@ async def create_notebook(user_id: str, name: str, description: Optional[str] =
         "settings": {}
     }
 
-    result = supabase.table("notebooks").insert(data).execute()
+    result = await asyncio.to_thread(supabase.table("notebooks").insert(data).execute)
     return {"notebook": result.data[0], "message": "Notebook created successfully"}
 
 
@@ -727,13 +954,22 @@ async def get_notebook(notebook_id: str) -> dict:
     """Get notebook details with sources."""
     supabase = get_supabase()
 
-    notebook = supabase.table("notebooks").select("*").eq("id", notebook_id).single().execute()
-    sources = supabase.table("sources").select("id, name, type, status, created_at").eq("notebook_id", notebook_id).execute()
+    # Sources are embedded through their notebook_id foreign key, so one
+    # request returns both
+    result = await asyncio.to_thread(
+        supabase.table("notebooks")
+        .select("*, sources(id, name, type, status, created_at)")
+        .eq("id", notebook_id)
+        .single()
+        .execute
+    )
+    notebook = result.data
+    sources = notebook.pop("sources")
 
     return {
-        "notebook": notebook.data,
-        "sources": sources.data,
-        "source_count": len(sources.data)
+        "notebook": notebook,
+        "sources": sources,
+        "source_count": len(sources)
     }
 
 
@@ -741,16 +977,11 @@ async def delete_notebook(notebook_id: str) -> dict:
     """Delete a notebook and all contents."""
     supabase = get_supabase()
 
-    # Delete related data first
-    supabase.table("sources").delete().eq("notebook_id", notebook_id).execute()
-    supabase.table("chat_sessions").delete().eq("notebook_id", notebook_id).execute()
-    supabase.table("notes").delete().eq("notebook_id", notebook_id).execute()
-    supabase.table("audio_overviews").delete().eq("notebook_id", notebook_id).execute()
-    supabase.table("research_tasks").delete().eq("notebook_id", notebook_id).execute()
-    supabase.table("studio_outputs").delete().eq("notebook_id", notebook_id).execute()
-
-    # Delete notebook
-    supabase.table("notebooks").delete().eq("id", notebook_id).execute()
+    # Sources, chats, notes, audio, video, research, study materials and
+    # studio outputs reference notebooks ON DELETE CASCADE, so Postgres
+    # removes them in the same transaction as the notebook
+    await asyncio.to_thread(supabase.table("notebooks").delete().eq("id", notebook_id).execute)
+    invalidate_source_context(notebook_id)
 
     return {"message": "Notebook deleted successfully"}
 
@@ -758,7 +989,7 @@ async def delete_notebook(notebook_id: str) -> dict:
 async def list_sources(notebook_id: str) -> dict:
     """List sources in a notebook."""
     supabase = get_supabase()
-    result = supabase.table("sources").select("*").eq("notebook_id", notebook_id).order("created_at", desc=True).execute()
+    result = await asyncio.to_thread(supabase.table("sources").select("*").eq("notebook_id", notebook_id).order("created_at", desc=True).execute)
 
     return {"sources": result.data, "count": len(result.data)}
 
@@ -767,8 +998,8 @@ async def add_text_source(notebook_id: str, user_id: str, name: str, content: st
     """Add text content as a source."""
     supabase = get_supabase()
 
-    # Generate summary using Gemini
-    summary_result = await generate_content(
+    # Generate summary using Gemini, counting the content's tokens alongside
+    summary_result, token_count = await asyncio.gather(generate_content(
         prompt=f"""Analyze this content and provide:
 1. A concise summary (2-3 paragraphs)
 2. Key topics covered (list of 5-10 topics)
@@ -780,17 +1011,11 @@ Content:
 Format as JSON:
 {{"summary": "...", "topics": ["..."], "suggested_questions": ["..."]}}""",
         model_name="gemini-2.5-flash"
-    )
+    ), count_tokens(content))
 
     try:
-        # Try to parse JSON from response
-        summary_text = summary_result["content"]
-        if "```json" in summary_text:
-            summary_text = summary_text.split("```json")[1].split("```")[0]
-        elif "```" in summary_text:
-            summary_text = summary_text.split("```")[1].split("```")[0]
-        source_guide = json.loads(summary_text)
-    except:
+        source_guide = extract_json(summary_result["content"])
+    except ValueError:
         source_guide = {"summary": summary_result["content"], "topics": [], "suggested_questions": []}
 
     # Create source record
@@ -800,12 +1025,14 @@ Format as JSON:
         "type": "text",
         "name": name,
         "status": "ready",
-        "metadata": {"content": content[:50000], "char_count": len(content)},
+        "content": content[:50000],
+        "metadata": {"char_count": len(content)},
         "source_guide": source_guide,
-        "token_count": len(content.split()) * 1.3  # Rough estimate
+        "token_count": token_count
     }
 
-    result = supabase.table("sources").insert(data).execute()
+    result = await asyncio.to_thread(supabase.table("sources").insert(data).execute)
+    invalidate_source_context(notebook_id)
 
     return {
         "source": result.data[0],
@@ -828,7 +1055,7 @@ async def add_url_source(notebook_id: str, user_id: str, url: str) -> dict:
         "metadata": {"url": url},
     }
 
-    result = supabase.table("sources").insert(data).execute()
+    result = await asyncio.to_thread(supabase.table("sources").insert(data).execute)
 
     return {
         "source": result.data[0],
@@ -850,7 +1077,7 @@ async def add_youtube_source(notebook_id: str, user_id: str, youtube_url: str) -
         "metadata": {"youtube_url": youtube_url},
     }
 
-    result = supabase.table("sources").insert(data).execute()
+    result = await asyncio.to_thread(supabase.table("sources").insert(data).execute)
 
     return {
         "source": result.data[0],
@@ -861,45 +1088,126 @@ async def add_youtube_source(notebook_id: str, user_id: str, youtube_url: str) -
 async def get_source(source_id: str) -> dict:
     """Get source details."""
     supabase = get_supabase()
-    result = supabase.table("sources").select("*").eq("id", source_id).single().execute()
+    result = await asyncio.to_thread(supabase.table("sources").select("*").eq("id", source_id).single().execute)
     return {"source": result.data}
 
 
 async def delete_source(source_id: str) -> dict:
     """Delete a source."""
     supabase = get_supabase()
-    supabase.table("sources").delete().eq("id", source_id).execute()
+    result = await asyncio.to_thread(supabase.table("sources").delete().eq("id", source_id).execute)
+    for row in result.data:
+        invalidate_source_context(row["notebook_id"])
     return {"message": "Source deleted successfully"}
 
 
+# How long a notebook's assembled source context is reused. Sources changed
+# through this server invalidate it right away; the TTL bounds staleness
+# for changes made through the web app.
+SOURCE_CONTEXT_TTL_SECONDS = 300
+
+# sources_rag picks each source's summary or the head of its text in
+# Postgres, so full content and metadata never leave the database
+RAG_COLUMNS = "id, notebook_id, name, type, rag_text"
+
+# (notebook_id, sorted source_ids) -> (expires_at, context, sources)
+_source_contexts: Dict[tuple, tuple[float, str, List[dict]]] = {}
+
+# Loads in progress by the same key, so concurrent tool calls over the same
+# sources (e.g. a client requesting flashcards and a quiz at once) share
+# one query
+_source_loads: Dict[tuple, asyncio.Future] = {}
+
+# Bumped by invalidate_source_context, so a load that started before a
+# source change doesn't cache its stale result after the invalidation
+_source_versions: Dict[str, int] = {}
+
+
+def invalidate_source_context(notebook_id: str) -> None:
+    """Drop every cached context and pending load of a notebook after its sources change."""
+    _source_versions[notebook_id] = _source_versions.get(notebook_id, 0) + 1
+    for cache in (_source_contexts, _source_loads):
+        for key in [key for key in cache if key[0] == notebook_id]:
+            del cache[key]
+
+
 async def get_source_content(notebook_id: str, source_ids: Optional[List[str]] = None) -> tuple[str, List[dict]]:
     """Get content from sources for RAG."""
+    key = (notebook_id, tuple(sorted(source_ids or [])))
+    cached = _source_contexts.get(key)
+    if cached and cached[0] > time.monotonic():
+        context, sources = cached[1], cached[2]
+    else:
+        version = _source_versions.get(notebook_id, 0)
+        load = _source_loads.get(key)
+        if load is None:
+            load = asyncio.ensure_future(_load_source_content(notebook_id, source_ids))
+            _source_loads[key] = load
+
+            def forget(done: asyncio.Future) -> None:
+                # An invalidation may already have replaced or dropped the entry
+                if _source_loads.get(key) is done:
+                    del _source_loads[key]
+
+            load.add_done_callback(forget)
+
+        # Shield the shared load so one cancelled caller doesn't cancel it for the rest
+        context, sources = await asyncio.shield(load)
+
+        if _source_versions.get(notebook_id, 0) == version:
+            if len(_source_contexts) >= 1024:
+                _source_contexts.clear()
+            _source_contexts[key] = (time.monotonic() + SOURCE_CONTEXT_TTL_SECONDS, context, sources)
+
+    # Copies, so callers can annotate their source list
+    return context, [dict(s) for s in sources]
+
+
+async def _load_source_content(notebook_id: str, source_ids: Optional[List[str]]) -> tuple[str, List[dict]]:
     supabase = get_supabase()
 
-    query = supabase.table("sources").select("*").eq("notebook_id", notebook_id).eq("status", "ready")
+    query = supabase.table("sources_rag").select(RAG_COLUMNS).eq("notebook_id", notebook_id).eq("status", "ready")
     if source_ids:
         query = query.in_("id", source_ids)
 
-    result = query.execute()
+    result = await asyncio.to_thread(query.execute)
+    return build_source_context(result.data)
 
-    context_parts = []
-    sources = []
 
-    for source in result.data:
-        source_guide = source.get("source_guide") or {}
-        metadata = source.get("metadata") or {}
+def build_source_context(
+    rows: List[dict], seen: Optional[Dict[str, tuple[dict, str]]] = None
+) -> tuple[str, List[dict]]:
+    """Build RAG context and the source list from sources_rag rows.
 
-        content = ""
-        if source_guide.get("summary"):
-            content = source_guide["summary"]
-        elif metadata.get("content"):
-            content = metadata["content"][:5000]
-        elif metadata.get("transcript"):
-            content = metadata["transcript"][:5000]
+    A source whose content matches one already in `seen` (content digest ->
+    (source entry, notebook_id)) is left out of the context, and its notebook
+    is added to the first one's "also_in" list when it comes from another
+    notebook. Pass the same `seen` across calls to deduplicate between them.
+    """
+    if seen is None:
+        seen = {}
+    context_parts = []
+    sources = []
 
-        if content:
-            context_parts.append(f"[Source: {source['name']}]\n{content}\n")
-            sources.append({"id": source["id"], "name": source["name"], "type": source["type"]})
+    for source in rows:
+        content = source["rag_text"]
+        if not content:
+            continue
+
+        # The same document added twice (or to two notebooks) is sent once
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if digest in seen:
+            first, first_notebook_id = seen[digest]
+            if source["notebook_id"] != first_notebook_id:
+                also_in = first.setdefault("also_in", [])
+                if source["notebook_id"] not in also_in:
+                    also_in.append(source["notebook_id"])
+            continue
+
+        context_parts.append(f"[Source: {source['name']}]\n{content}\n")
+        entry = {"id": source["id"], "name": source["name"], "type": source["type"]}
+        sources.append(entry)
+        seen[digest] = (entry, source["notebook_id"])
 
     return "\n".join(context_parts), sources
 
@@ -926,42 +1234,42 @@ Be concise but thorough."""
     for i, s in enumerate(sources, 1):
         source_context += f"[{i}] {s['name']}\n"
 
+    context = await fit_context(context, model)
+
     prompt = f"""Sources:
 {context}
 
 Source Index:
 {source_context}
 
-User Question: {message}
+User Question: {normalize_question(message)}
 
 Provide a well-cited response:"""
 
-    result = await generate_content(
+    result = await cached_generate_content(
         prompt=prompt,
         model_name=model,
         system_instruction=system_instruction
     )
 
-    # Store in chat history
+    # Session and both messages in one transaction, written after the answer
+    # is returned; nothing is written for a failed answer
     supabase = get_supabase()
-    session_data = {
-        "notebook_id": notebook_id,
-        "user_id": user_id,
-        "title": message[:50]
-    }
-    session = supabase.table("chat_sessions").insert(session_data).execute()
-
-    # Store messages
-    messages = [
-        {"session_id": session.data[0]["id"], "role": "user", "content": message},
-        {"session_id": session.data[0]["id"], "role": "assistant", "content": result["content"]}
-    ]
-    supabase.table("chat_messages").insert(messages).execute()
+    session_id = str(uuid.uuid4())
+    run_in_background(asyncio.to_thread(
+        supabase.rpc("create_session_with_messages", {
+            "sid": session_id,
+            "nb": notebook_id,
+            "title": message[:50],
+            "user_msg": message,
+            "asst_msg": result["content"],
+        }).execute
+    ))
 
     return {
         "response": result["content"],
         "sources": sources,
-        "session_id": session.data[0]["id"],
+        "session_id": session_id,
         "usage": result["usage"]
     }
 
@@ -974,13 +1282,28 @@ async def global_chat(user_id: str, message: str, notebook_ids: Optional[List[st
     query = supabase.table("notebooks").select("id, name, emoji").eq("user_id", user_id)
     if notebook_ids:
         query = query.in_("id", notebook_ids)
-    notebooks = query.execute()
+    notebooks = await asyncio.to_thread(query.execute)
 
     all_context = []
     all_sources = []
 
+    # One query for every notebook's sources, grouped here, instead of one per notebook
+    rows_by_notebook: Dict[str, List[dict]] = {nb["id"]: [] for nb in notebooks.data}
+    if rows_by_notebook:
+        rows = await asyncio.to_thread(
+            supabase.table("sources_rag")
+            .select(RAG_COLUMNS)
+            .in_("notebook_id", list(rows_by_notebook))
+            .eq("status", "ready")
+            .execute
+        )
+        for row in rows.data:
+            rows_by_notebook[row["notebook_id"]].append(row)
+
+    # Shared across notebooks so a document in several of them is sent once
+    seen: Dict[str, tuple[dict, str]] = {}
     for nb in notebooks.data:
-        context, sources = await get_source_content(nb["id"])
+        context, sources = build_source_context(rows_by_notebook[nb["id"]], seen)
         if context:
             all_context.append(f"=== Notebook: {nb.get('emoji', '📓')} {nb['name']} ===\n{context}")
             for s in sources:
@@ -991,12 +1314,21 @@ async def global_chat(user_id: str, message: str, notebook_ids: Optional[List[st
     if not all_context:
         return {"error": "No sources available in any notebooks", "sources": []}
 
+    notebook_names = {nb["id"]: nb["name"] for nb in notebooks.data}
+    for s in all_sources:
+        if "also_in" in s:
+            s["also_in"] = [
+                {"notebook_id": nb_id, "notebook_name": notebook_names[nb_id]} for nb_id in s["also_in"]
+            ]
+
     system_instruction = """You are a research assistant with access to multiple notebooks.
 Answer questions using information from all available sources.
 Cite sources as [Notebook: Source Name] when referencing information."""
 
-    result = await generate_content(
-        prompt=f"Sources from multiple notebooks:\n\n{chr(10).join(all_context)}\n\nQuestion: {message}",
+    context = await fit_context("\n".join(all_context), "gemini-2.5-flash")
+
+    result = await cached_generate_content(
+        prompt=f"Sources from multiple notebooks:\n\n{context}\n\nQuestion: {normalize_question(message)}",
         model_name="gemini-2.5-flash",
         system_instruction=system_instruction
     )
@@ -1016,27 +1348,22 @@ async def generate_flashcards(notebook_id: str, count: int = 10, source_ids: Opt
     if not context:
         return {"error": "No sources available"}
 
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
+
     count = max(5, min(100, count))
 
-    result = await generate_content(
-        prompt=f"""Create {count} educational flashcards from this content.
+    result = await cached_generate_content(
+        expect=list,
+        prompt=source_prompt(context, f"""Create {count} educational flashcards from this content.
 Each flashcard should test understanding of key concepts.
 
-Content:
-{context[:15000]}
-
 Format as JSON array:
-[{{"question": "...", "answer": "..."}}]"""
+[{{"question": "...", "answer": "..."}}]""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        flashcards = json.loads(content)
-    except:
+        flashcards = extract_json(result["content"])
+    except ValueError:
         flashcards = []
 
     return {
@@ -1054,27 +1381,22 @@ async def generate_quiz(notebook_id: str, question_count: int = 10, source_ids:
     if not context:
         return {"error": "No sources available"}
 
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
+
     question_count = max(5, min(50, question_count))
 
-    result = await generate_content(
-        prompt=f"""Create a {question_count}-question multiple choice quiz from this content.
+    result = await cached_generate_content(
+        expect=list,
+        prompt=source_prompt(context, f"""Create a {question_count}-question multiple choice quiz from this content.
 Each question should have 4 options with one correct answer.
 
-Content:
-{context[:15000]}
-
 Format as JSON array:
-[{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_index": 0, "explanation": "..."}}]"""
+[{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_index": 0, "explanation": "..."}}]""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        questions = json.loads(content)
-    except:
+        questions = extract_json(result["content"])
+    except ValueError:
         questions = []
 
     return {
@@ -1092,30 +1414,25 @@ async def generate_study_guide(notebook_id: str, source_ids: Optional[List[str]]
     if not context:
         return {"error": "No sources available"}
 
-    result = await generate_content(
-        prompt=f"""Create a comprehensive study guide from this content.
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
 
-Content:
-{context[:15000]}
+    result = await cached_generate_content(
+        expect=dict,
+        prompt=source_prompt(context, """Create a comprehensive study guide from this content.
 
 Format as JSON:
-{{
+{
     "title": "...",
     "summary": "...",
-    "key_concepts": [{{"term": "...", "definition": "...", "importance": "..."}}],
-    "glossary": [{{"term": "...", "definition": "..."}}],
+    "key_concepts": [{"term": "...", "definition": "...", "importance": "..."}],
+    "glossary": [{"term": "...", "definition": "..."}],
     "review_questions": ["...", "..."]
-}}"""
+}""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        guide = json.loads(content)
-    except:
+        guide = extract_json(result["content"])
+    except ValueError:
         guide = {"title": "Study Guide", "content": result["content"]}
 
     return {
@@ -1132,27 +1449,22 @@ async def generate_faq(notebook_id: str, count: int = 10, source_ids: Optional[L
     if not context:
         return {"error": "No sources available"}
 
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
+
     count = max(5, min(50, count))
 
-    result = await generate_content(
-        prompt=f"""Generate {count} frequently asked questions and answers about this content.
+    result = await cached_generate_content(
+        expect=list,
+        prompt=source_prompt(context, f"""Generate {count} frequently asked questions and answers about this content.
 Focus on common questions a reader might have.
 
-Content:
-{context[:15000]}
-
 Format as JSON array:
-[{{"question": "...", "answer": "..."}}]"""
+[{{"question": "...", "answer": "..."}}]""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        faq = json.loads(content)
-    except:
+        faq = extract_json(result["content"])
+    except ValueError:
         faq = []
 
     return {
@@ -1163,6 +1475,73 @@ Format as JSON array:
     }
 
 
+# Instructions and JSON shape of each study material in a bundle; {count}
+# is filled in per request
+STUDY_BUNDLE_PARTS = {
+    "flashcards": (
+        "{count} educational flashcards testing understanding of key concepts",
+        '"flashcards": [{"question": "...", "answer": "..."}]',
+    ),
+    "quiz": (
+        "a {count}-question multiple choice quiz, each question with 4 options and one correct answer",
+        '"quiz": [{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_index": 0, "explanation": "..."}]',
+    ),
+    "study_guide": (
+        "a comprehensive study guide",
+        '"study_guide": {"title": "...", "summary": "...", "key_concepts": [{"term": "...", "definition": "...", "importance": "..."}], '
+        '"glossary": [{"term": "...", "definition": "..."}], "review_questions": ["...", "..."]}',
+    ),
+    "faq": (
+        "{count} frequently asked questions and answers a reader might have",
+        '"faq": [{"question": "...", "answer": "..."}]',
+    ),
+}
+
+
+async def generate_study_bundle(
+    notebook_id: str,
+    kinds: List[str],
+    count: int = 10,
+    source_ids: Optional[List[str]] = None
+) -> dict:
+    """Generate several study materials from one read of the sources and one Gemini call."""
+    context, sources = await get_source_content(notebook_id, source_ids)
+
+    if not context:
+        return {"error": "No sources available"}
+
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
+
+    count = max(5, min(50, count))
+    tasks = "\n".join(f"- {STUDY_BUNDLE_PARTS[kind][0].format(count=count)}" for kind in kinds)
+    shape = ",\n    ".join(STUDY_BUNDLE_PARTS[kind][1] for kind in kinds)
+
+    result = await cached_generate_content(
+        expect=dict,
+        prompt=source_prompt(context, f"""Create the following study materials from this content:
+{tasks}
+
+Format as a JSON object:
+{{
+    {shape}
+}}"""),
+        json_output=True
+    )
+
+    try:
+        bundle = extract_json(result["content"])
+    except ValueError:
+        bundle = {}
+    if not isinstance(bundle, dict):
+        bundle = {}
+
+    return {
+        **{kind: bundle.get(kind, {} if kind == "study_guide" else []) for kind in kinds},
+        "sources_used": len(sources),
+        "usage": result["usage"]
+    }
+
+
 async def generate_audio_overview(
     notebook_id: str,
     user_id: str,
@@ -1176,6 +1555,8 @@ async def generate_audio_overview(
     if not context:
         return {"error": "No sources available"}
 
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
+
     format_prompts = {
         "deep_dive": "Create an engaging 10-15 minute two-host podcast script exploring this topic in depth.",
         "brief": "Create a concise 2-3 minute single-speaker summary of the key points.",
@@ -1187,13 +1568,11 @@ async def generate_audio_overview(
     if custom_instructions:
         prompt += f"\n\nAdditional instructions: {custom_instructions}"
 
+    # Not cached: asking for another audio overview means wanting a new take
     result = await generate_content(
-        prompt=f"""{prompt}
+        prompt=source_prompt(context, f"""{prompt}
 
-Content to discuss:
-{context[:15000]}
-
-Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for each line.""",
+Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for each line."""),
         model_name="gemini-2.5-pro"
     )
 
@@ -1207,7 +1586,7 @@ Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for
         "script": result["content"],
         "cost_usd": result["usage"]["cost_usd"]
     }
-    audio_record = supabase.table("audio_overviews").insert(audio_data).execute()
+    audio_record = await asyncio.to_thread(supabase.table("audio_overviews").insert(audio_data).execute)
 
     return {
         "audio_id": audio_record.data[0]["id"],
@@ -1221,7 +1600,7 @@ Format the script with clear speaker labels (Host 1:, Host 2:, or Speaker:) for
 async def get_audio_status(audio_id: str) -> dict:
     """Get audio generation status."""
     supabase = get_supabase()
-    result = supabase.table("audio_overviews").select("*").eq("id", audio_id).single().execute()
+    result = await asyncio.to_thread(supabase.table("audio_overviews").select("*").eq("id", audio_id).single().execute)
     return {"audio": result.data}
 
 
@@ -1229,20 +1608,11 @@ async def start_research(notebook_id: str, user_id: str, query: str, mode: str =
     """Start a research task."""
     supabase = get_supabase()
 
-    # Create task record
-    task_data = {
-        "notebook_id": notebook_id,
-        "user_id": user_id,
-        "query": query,
-        "mode": mode,
-        "status": "in_progress"
-    }
-    task = supabase.table("research_tasks").insert(task_data).execute()
-    task_id = task.data[0]["id"]
-
     # Generate research report
     depth = "comprehensive and detailed" if mode == "deep" else "concise but thorough"
 
+    # Not cached: the prompt has no source content, so a cached report would
+    # be reused across notebooks and users asking the same query
     result = await generate_content(
         prompt=f"""Create a {depth} research report on: {query}
 
@@ -1256,12 +1626,19 @@ Use markdown formatting.""",
         model_name="gemini-2.5-pro"
     )
 
-    # Update task with results
-    supabase.table("research_tasks").update({
+    # The report is generated before returning, so nobody can poll an
+    # in-progress task: record it once, completed
+    task_data = {
+        "notebook_id": notebook_id,
+        "user_id": user_id,
+        "query": query,
+        "mode": mode,
         "status": "completed",
         "report_content": result["content"],
         "cost_usd": result["usage"]["cost_usd"]
-    }).eq("id", task_id).execute()
+    }
+    task = await asyncio.to_thread(supabase.table("research_tasks").insert(task_data).execute)
+    task_id = task.data[0]["id"]
 
     return {
         "task_id": task_id,
@@ -1274,7 +1651,7 @@ Use markdown formatting.""",
 async def get_research_status(task_id: str) -> dict:
     """Get research task status."""
     supabase = get_supabase()
-    result = supabase.table("research_tasks").select("*").eq("id", task_id).single().execute()
+    result = await asyncio.to_thread(supabase.table("research_tasks").select("*").eq("id", task_id).single().execute)
     return {"task": result.data}
 
 
@@ -1292,14 +1669,14 @@ async def create_note(notebook_id: str, user_id: str, title: str, content: str,
         "is_pinned": False
     }
 
-    result = supabase.table("notes").insert(data).execute()
+    result = await asyncio.to_thread(supabase.table("notes").insert(data).execute)
     return {"note": result.data[0], "message": "Note created successfully"}
 
 
 async def list_notes(notebook_id: str) -> dict:
     """List notes in a notebook."""
     supabase = get_supabase()
-    result = supabase.table("notes").select("*").eq("notebook_id", notebook_id).order("is_pinned", desc=True).order("created_at", desc=True).execute()
+    result = await asyncio.to_thread(supabase.table("notes").select("*").eq("notebook_id", notebook_id).order("is_pinned", desc=True).order("created_at", desc=True).execute)
     return {"notes": result.data, "count": len(result.data)}
 
 
@@ -1316,13 +1693,13 @@ async def generate_report(
     if not context:
         return {"error": "No sources available"}
 
-    extra = f"\n\nFocus: {custom_instructions}" if custom_instructions else ""
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
 
-    result = await generate_content(
-        prompt=f"""Create a professional briefing document titled "{title}".{extra}
+    extra = f"\n\nFocus: {custom_instructions}" if custom_instructions else ""
 
-Content:
-{context[:15000]}
+    result = await cached_generate_content(
+        expect=dict,
+        prompt=source_prompt(context, f"""Create a professional briefing document titled "{title}".{extra}
 
 Format as JSON:
 {{
@@ -1331,17 +1708,12 @@ Format as JSON:
     "sections": [{{"title": "...", "content": "..."}}],
     "key_findings": ["..."],
     "conclusion": "..."
-}}"""
+}}""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        report = json.loads(content)
-    except:
+        report = extract_json(result["content"])
+    except ValueError:
         report = {"title": title, "content": result["content"]}
 
     # Store in database
@@ -1355,7 +1727,7 @@ Format as JSON:
         "content": report,
         "cost_usd": result["usage"]["cost_usd"]
     }
-    output = supabase.table("studio_outputs").insert(output_data).execute()
+    output = await asyncio.to_thread(supabase.table("studio_outputs").insert(output_data).execute)
 
     return {
         "output_id": output.data[0]["id"],
@@ -1377,30 +1749,25 @@ async def generate_data_table(
     if not context:
         return {"error": "No sources available"}
 
-    extra = f"\n\nExtract: {custom_instructions}" if custom_instructions else ""
+    context = await fit_context(context, "gemini-2.5-flash", GENERATOR_TOKEN_BUDGET)
 
-    result = await generate_content(
-        prompt=f"""Create a structured data table titled "{title}" from this content.{extra}
+    extra = f"\n\nExtract: {custom_instructions}" if custom_instructions else ""
 
-Content:
-{context[:15000]}
+    result = await cached_generate_content(
+        expect=dict,
+        prompt=source_prompt(context, f"""Create a structured data table titled "{title}" from this content.{extra}
 
 Format as JSON:
 {{
     "title": "...",
     "columns": ["Column1", "Column2", ...],
     "rows": [["value1", "value2", ...], ...]
-}}"""
+}}""")
     )
 
     try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        table = json.loads(content)
-    except:
+        table = extract_json(result["content"])
+    except ValueError:
         table = {"title": title, "columns": [], "rows": []}
 
     # Store in database
@@ -1414,7 +1781,7 @@ Format as JSON:
         "content": table,
         "cost_usd": result["usage"]["cost_usd"]
     }
-    output = supabase.table("studio_outputs").insert(output_data).execute()
+    output = await asyncio.to_thread(supabase.table("studio_outputs").insert(output_data).execute)
 
     return {
         "output_id": output.data[0]["id"],
@@ -1435,6 +1802,9 @@ def main():
 
 async def run_server():
     """Start the stdio server."""
+    # Supabase calls run in threads; size the pool for concurrent round
+    # trips rather than CPU count
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
     async with stdio_server() as (read_stream, write_stream):
         await server.run(read_stream, write_stream, server.create_initialization_options())
 
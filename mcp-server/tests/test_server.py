@@ -0,0 +1,226 @@
+"""Tests for tool argument validation and cached generation in the MCP server."""
+
+import asyncio
+from types import SimpleNamespace
+
+import fastjsonschema
+import orjson
+import pytest
+
+from notebooklm_mcp import server
+
+
+class FakeGenCache:
+    """Just enough of the supabase-py query builder for the gen_cache table."""
+
+    def __init__(self):
+        self.rows = {}
+        self.upserts = 0
+        self._hash = None
+
+    def table(self, name):
+        assert name == "gen_cache"
+        return self
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self._hash = value
+        return self
+
+    def gt(self, column, value):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def upsert(self, row):
+        self.upserts += 1
+        self.rows[row["hash"]] = row
+        return self
+
+    def execute(self):
+        row = self.rows.get(self._hash)
+        return SimpleNamespace(data=[{"response": row["response"]}] if row else [])
+
+
+@pytest.fixture
+def gen_cache(monkeypatch):
+    cache = FakeGenCache()
+    monkeypatch.setattr(server, "get_supabase", lambda: cache)
+    return cache
+
+
+def fake_generate(monkeypatch, content):
+    calls = []
+
+    async def generate_content(**params):
+        calls.append(params)
+        return {"content": content, "usage": {"input_tokens": 10, "output_tokens": 5, "cost_usd": 0.01}}
+
+    monkeypatch.setattr(server, "generate_content", generate_content)
+    return calls
+
+
+def call_tool(name, arguments):
+    result = asyncio.run(server.call_tool(name, arguments))
+    return orjson.loads(result[0].text)
+
+
+def test_every_tool_has_a_validator_and_handler():
+    names = {tool.name for tool in server.TOOLS}
+    assert set(server.TOOL_VALIDATORS) == names
+    assert names <= set(server.TOOL_HANDLERS)
+
+
+def test_validator_fills_schema_defaults():
+    arguments = server.TOOL_VALIDATORS["create_notebook"]({"user_id": "u1", "name": "Reading"})
+    assert arguments["emoji"] == "📓"
+
+    arguments = server.TOOL_VALIDATORS["generate_flashcards"]({"notebook_id": "n1"})
+    assert arguments["count"] == 10
+
+
+@pytest.mark.parametrize("arguments", [
+    {"user_id": "u1"},
+    {"user_id": "u1", "name": 5},
+])
+def test_validator_rejects_bad_arguments(arguments):
+    with pytest.raises(fastjsonschema.JsonSchemaException):
+        server.TOOL_VALIDATORS["create_notebook"](arguments)
+
+
+def test_call_tool_reports_invalid_arguments_without_running_the_tool(monkeypatch):
+    monkeypatch.setitem(server.TOOL_HANDLERS, "generate_flashcards", pytest.fail)
+
+    result = call_tool("generate_flashcards", {"count": 10})
+
+    assert result["error"].startswith("Invalid arguments:")
+
+
+def test_cached_generate_content_reuses_parsed_results(gen_cache, monkeypatch):
+    calls = fake_generate(monkeypatch, '[{"front": "Q", "back": "A"}]')
+
+    first = asyncio.run(server.cached_generate_content(expect=list, prompt="p"))
+    second = asyncio.run(server.cached_generate_content(expect=list, prompt="p"))
+
+    assert len(calls) == 1
+    assert gen_cache.upserts == 1
+    assert first["usage"]["cost_usd"] == 0.01
+    assert second["content"] == first["content"]
+    assert second["usage"]["cost_usd"] == 0.0
+    assert second["usage"]["cache_hit"] is True
+
+
+@pytest.mark.parametrize("content, expect", [
+    ("Sorry, I can't help with that.", list),
+    ('{"title": "Not a list"}', list),
+    ("[]", list),
+    ("   ", None),
+])
+def test_cached_generate_content_skips_unusable_results(gen_cache, monkeypatch, content, expect):
+    calls = fake_generate(monkeypatch, content)
+
+    asyncio.run(server.cached_generate_content(expect=expect, prompt="p"))
+    asyncio.run(server.cached_generate_content(expect=expect, prompt="p"))
+
+    assert len(calls) == 2
+    assert gen_cache.upserts == 0
+
+
+def test_cached_generate_content_keys_on_every_parameter(gen_cache, monkeypatch):
+    calls = fake_generate(monkeypatch, "An answer")
+
+    asyncio.run(server.cached_generate_content(prompt="p"))
+    asyncio.run(server.cached_generate_content(prompt="p", temperature=0.2))
+
+    assert len(calls) == 2
+
+
+@pytest.fixture
+def source_loads(monkeypatch):
+    calls = []
+
+    async def load_source_content(notebook_id, source_ids):
+        calls.append(notebook_id)
+        await asyncio.sleep(0.01)
+        return f"context {len(calls)}", [{"id": f"source-{len(calls)}"}]
+
+    monkeypatch.setattr(server, "_load_source_content", load_source_content)
+    server._source_contexts.clear()
+    yield calls
+    server._source_contexts.clear()
+
+
+def test_source_context_is_reused_and_copied(source_loads):
+    _, sources = asyncio.run(server.get_source_content("nb-1"))
+    sources[0]["also_in"] = ["nb-2"]
+
+    context, again = asyncio.run(server.get_source_content("nb-1"))
+
+    assert source_loads == ["nb-1"]
+    assert context == "context 1"
+    assert again == [{"id": "source-1"}]
+
+
+def test_concurrent_source_loads_share_one_query(source_loads):
+    async def run():
+        return await asyncio.gather(server.get_source_content("nb-1"), server.get_source_content("nb-1"))
+
+    first, second = asyncio.run(run())
+
+    assert source_loads == ["nb-1"]
+    assert first == second
+
+
+def test_invalidation_drops_only_that_notebook(source_loads):
+    asyncio.run(server.get_source_content("nb-1"))
+    asyncio.run(server.get_source_content("nb-2"))
+
+    server.invalidate_source_context("nb-1")
+    asyncio.run(server.get_source_content("nb-1"))
+    asyncio.run(server.get_source_content("nb-2"))
+
+    assert source_loads == ["nb-1", "nb-2", "nb-1"]
+
+
+def test_load_in_flight_during_invalidation_is_not_cached(source_loads):
+    async def run():
+        pending = asyncio.ensure_future(server.get_source_content("nb-1"))
+        await asyncio.sleep(0)
+        server.invalidate_source_context("nb-1")
+        await pending
+        return await server.get_source_content("nb-1")
+
+    context, _ = asyncio.run(run())
+
+    assert context == "context 2"
+
+
+def rag_row(source_id, notebook_id, text, name="Doc"):
+    return {"id": source_id, "notebook_id": notebook_id, "name": name, "type": "text", "rag_text": text}
+
+
+def test_build_source_context_sends_duplicate_content_once():
+    seen = {}
+    context, sources = server.build_source_context([
+        rag_row("a", "nb-1", "same text"),
+        rag_row("b", "nb-1", "same text"),
+        rag_row("c", "nb-1", "other text"),
+    ], seen)
+    _, more = server.build_source_context([rag_row("d", "nb-2", "same text")], seen)
+
+    assert context.count("same text") == 1
+    assert [s["id"] for s in sources] == ["a", "c"]
+    # Only another notebook's copy is recorded, and only once
+    assert sources[0]["also_in"] == ["nb-2"]
+    assert "also_in" not in sources[1]
+    assert more == []
+
+
+def test_build_source_context_skips_rows_without_text():
+    context, sources = server.build_source_context([rag_row("a", "nb-1", None), rag_row("b", "nb-1", "")])
+
+    assert context == ""
+    assert sources == []
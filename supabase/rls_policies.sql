@@ -21,6 +21,9 @@ ALTER TABLE studio_outputs ENABLE ROW LEVEL SECURITY;
 ALTER TABLE api_keys ENABLE ROW LEVEL SECURITY;
 ALTER TABLE api_key_usage_logs ENABLE ROW LEVEL SECURITY;
 ALTER TABLE usage_logs ENABLE ROW LEVEL SECURITY;
+-- No policies: only the service role (backend) reads/writes this cache
+ALTER TABLE source_guide_cache ENABLE ROW LEVEL SECURITY;
+ALTER TABLE gen_cache ENABLE ROW LEVEL SECURITY;
 
 -- ============================================================================
 -- PROFILES POLICIES
@@ -73,6 +73,7 @@ CREATE TABLE IF NOT EXISTS sources (
   mime_type TEXT,
   file_size_bytes BIGINT,
   token_count INT,
+  content TEXT,  -- extracted text; excluded from list queries
   metadata JSONB DEFAULT '{}',
   source_guide JSONB,  -- { summary, topics, suggested_questions }
   error_message TEXT,
@@ -80,7 +81,32 @@ CREATE TABLE IF NOT EXISTS sources (
   updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Existing projects: move extracted text out of metadata JSONB into its own column
+ALTER TABLE sources ADD COLUMN IF NOT EXISTS content TEXT;
+UPDATE sources
+SET content = metadata->>'content', metadata = metadata - 'content'
+WHERE metadata ? 'content';
+
 CREATE INDEX IF NOT EXISTS idx_sources_notebook_id ON sources(notebook_id);
+CREATE INDEX IF NOT EXISTS idx_sources_notebook_created ON sources(notebook_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sources_file_path ON sources(file_path) WHERE file_path IS NOT NULL;
+
+-- Text the MCP server puts in prompts: the source guide summary, else the
+-- first 5000 characters of the content or transcript. Truncating here keeps
+-- whole documents off the wire.
+CREATE OR REPLACE VIEW sources_rag WITH (security_invoker = true) AS
+SELECT
+  id,
+  notebook_id,
+  status,
+  name,
+  type,
+  COALESCE(
+    NULLIF(source_guide->>'summary', ''),
+    NULLIF(left(content, 5000), ''),
+    NULLIF(left(metadata->>'transcript', 5000), '')
+  ) AS rag_text
+FROM sources;
 
 -- ============================================================================
 -- 4. CHAT SESSIONS
@@ -309,3 +335,153 @@ CREATE TABLE IF NOT EXISTS usage_logs (
 
 CREATE INDEX IF NOT EXISTS idx_usage_logs_user_id ON usage_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_usage_logs_created_at ON usage_logs(created_at);
+
+-- ============================================================================
+-- 15. SOURCE COUNT TRIGGERS
+-- ============================================================================
+-- notebooks.source_count is kept in sync by statement-level triggers, so batch
+-- inserts and cascaded deletes update each notebook once per statement.
+
+CREATE OR REPLACE FUNCTION sources_count_after_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE notebooks n
+  SET source_count = COALESCE(n.source_count, 0) + c.cnt
+  FROM (SELECT notebook_id, COUNT(*) AS cnt FROM new_sources GROUP BY notebook_id) c
+  WHERE n.id = c.notebook_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION sources_count_after_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE notebooks n
+  SET source_count = GREATEST(COALESCE(n.source_count, 0) - c.cnt, 0)
+  FROM (SELECT notebook_id, COUNT(*) AS cnt FROM old_sources GROUP BY notebook_id) c
+  WHERE n.id = c.notebook_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS sources_count_insert ON sources;
+CREATE TRIGGER sources_count_insert
+  AFTER INSERT ON sources
+  REFERENCING NEW TABLE AS new_sources
+  FOR EACH STATEMENT EXECUTE FUNCTION sources_count_after_insert();
+
+DROP TRIGGER IF EXISTS sources_count_delete ON sources;
+CREATE TRIGGER sources_count_delete
+  AFTER DELETE ON sources
+  REFERENCING OLD TABLE AS old_sources
+  FOR EACH STATEMENT EXECUTE FUNCTION sources_count_after_delete();
+
+-- One-time resync for existing projects
+UPDATE notebooks n
+SET source_count = (SELECT COUNT(*) FROM sources s WHERE s.notebook_id = n.id);
+
+-- ============================================================================
+-- 16. SOURCE GUIDE CACHE (backend only; keyed by content hash + model)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS source_guide_cache (
+  key TEXT NOT NULL,  -- BLAKE2b hex digest of the summarized text
+  model TEXT NOT NULL,
+  source_guide JSONB NOT NULL,
+  token_count INT,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (key, model)
+);
+
+-- ============================================================================
+-- 17. API KEY USAGE COUNTERS
+-- ============================================================================
+-- The API batches per-key request counts in memory and adds them here in a
+-- single call, instead of updating api_keys on every authenticated request.
+
+CREATE OR REPLACE FUNCTION increment_api_key_usage(key_ids UUID[], counts BIGINT[], used_at TIMESTAMPTZ)
+RETURNS VOID AS $$
+BEGIN
+  UPDATE api_keys k
+  SET total_requests = COALESCE(k.total_requests, 0) + u.cnt,
+      last_used_at = GREATEST(k.last_used_at, used_at)
+  FROM unnest(key_ids, counts) AS u(id, cnt)
+  WHERE k.id = u.id;
+END;
+$$ LANGUAGE plpgsql SECURITY INVOKER SET search_path = public;
+
+-- Only the API calls this, with the service role
+REVOKE EXECUTE ON FUNCTION increment_api_key_usage(UUID[], BIGINT[], TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_api_key_usage(UUID[], BIGINT[], TIMESTAMPTZ) TO service_role;
+
+-- ============================================================================
+-- 18. GENERATION CACHE (backend only; keyed by generator + input hash)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS gen_cache (
+  hash TEXT PRIMARY KEY,
+  response JSONB NOT NULL,
+  expires_at TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_gen_cache_expires_at ON gen_cache(expires_at);
+
+-- ============================================================================
+-- 19. CHAT SESSION WITH MESSAGES (MCP server)
+-- ============================================================================
+-- Creates a session with its first question and answer in one transaction
+-- and round trip, instead of one insert for the session and one for the
+-- messages. The caller picks the session id, so it can answer before the
+-- write finishes.
+
+-- Earlier four-argument version, which let the database pick the id
+DROP FUNCTION IF EXISTS create_session_with_messages(UUID, TEXT, TEXT, TEXT);
+
+CREATE OR REPLACE FUNCTION create_session_with_messages(
+  sid UUID, nb UUID, title TEXT, user_msg TEXT, asst_msg TEXT
+)
+RETURNS UUID AS $$
+BEGIN
+  INSERT INTO chat_sessions (id, notebook_id, title)
+  VALUES (sid, nb, title);
+
+  INSERT INTO chat_messages (session_id, role, content)
+  VALUES (sid, 'user', user_msg), (sid, 'assistant', asst_msg);
+
+  RETURN sid;
+END;
+$$ LANGUAGE plpgsql SECURITY INVOKER SET search_path = public;
+
+-- Only the MCP server calls this, with the service role
+REVOKE EXECUTE ON FUNCTION create_session_with_messages(UUID, UUID, TEXT, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION create_session_with_messages(UUID, UUID, TEXT, TEXT, TEXT) TO service_role;
+
+-- ============================================================================
+-- 20. SOURCE DELETE WITH STORAGE REFERENCE CHECK
+-- ============================================================================
+-- Uploads are stored at {user_id}/{sha256}.{ext}, so several sources can share
+-- one storage object. Deletes the source and reports whether another row still
+-- references its file in the same call. The advisory lock serializes deletes of
+-- rows sharing a file, so the last one sees the others gone and frees the object.
+
+CREATE OR REPLACE FUNCTION delete_source_row(sid UUID, nb UUID)
+RETURNS TABLE (path TEXT, shared BOOLEAN) AS $$
+BEGIN
+  DELETE FROM sources s
+  WHERE s.id = sid AND s.notebook_id = nb
+  RETURNING s.file_path INTO path;
+
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  IF path IS NOT NULL THEN
+    PERFORM pg_advisory_xact_lock(hashtext(path));
+  END IF;
+  shared := EXISTS (SELECT 1 FROM sources s WHERE s.file_path = path);
+  RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql SECURITY INVOKER SET search_path = public;
+
+-- Only the API calls this, with the service role
+REVOKE EXECUTE ON FUNCTION delete_source_row(UUID, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION delete_source_row(UUID, UUID) TO service_role;